@@ -0,0 +1,173 @@
+from sqlalchemy import event, text
+from database import SUPPORTED_DIALECTS, trigger_names
+from extensions import db
+
+# Statistics kept up to date by triggers on documents, document_states and
+# document_state_sub_states, so every write path (ORM, bulk statements, raw SQL)
+# updates them in its own transaction and /stats only reads a handful of rows.
+#
+# dimension    key                      count                 quantity
+# ---------    ---                      -----                 --------
+# total        documents/states/        rows                  sum of state quantities
+#              cartons/modeles                                (states only)
+# state_type   REP, HS, SWA, BRK        states of that type   pieces of that type
+# sub_state    KC, Ill                  states flagged        pieces flagged
+# carton       numero_carton            documents
+# modele       modele                   documents
+
+
+class StatAggregate(db.Model):
+    __tablename__ = 'stat_aggregates'
+    dimension = db.Column(db.String(20), primary_key=True)
+    key = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+    # Top-N cartons/modeles straight from the index
+    __table_args__ = (db.Index('ix_stat_aggregates_dimension_count', 'dimension', 'count'),)
+
+
+def _bump(dimension, key, sign, quantity='0', where='TRUE'):
+    return (
+        f"INSERT INTO stat_aggregates (dimension, key, count, quantity) "
+        f"SELECT '{dimension}', {key}, {sign}, {quantity} WHERE {where} "
+        f"ON CONFLICT (dimension, key) DO UPDATE SET "
+        f"count = stat_aggregates.count + excluded.count, quantity = stat_aggregates.quantity + excluded.quantity;"
+    )
+
+
+def _bump_distinct(dimension, key, sign):
+    # Also track how many distinct cartons/modeles exist: a key reaching 1 was
+    # just added, a key dropping to 0 just disappeared
+    edge = 1 if sign > 0 else 0
+    return _bump(dimension, key, sign) + (
+        f" UPDATE stat_aggregates SET count = count + {sign} "
+        f"WHERE dimension = 'total' AND key = '{dimension}s' AND "
+        f"(SELECT count FROM stat_aggregates WHERE dimension = '{dimension}' AND key = {key}) = {edge};"
+    )
+
+
+def _document_delta(row, sign):
+    return ' '.join([
+        _bump('total', "'documents'", sign),
+        _bump_distinct('carton', f'{row}.numero_carton', sign),
+        _bump_distinct('modele', f'{row}.modele', sign),
+    ])
+
+
+def _state_delta(row, sign):
+    quantity = f'{sign} * COALESCE({row}.quantity, 0)'
+    return ' '.join([
+        _bump('total', "'states'", sign, quantity),
+        _bump('state_type', f'{row}.state_type', sign, quantity),
+    ])
+
+
+def _sub_state_delta(row, sign):
+    quantity = f'{sign} * (SELECT COALESCE(quantity, 0) FROM document_states WHERE id = {row}.state_id)'
+    return _bump('sub_state', f'{row}.sub_state', sign, quantity)
+
+
+# name: (timing, table, statements), turned into SQLite triggers or PostgreSQL trigger functions
+TRIGGERS = {
+    'stats_documents_ai': ('AFTER INSERT', 'documents', _document_delta('new', 1)),
+    'stats_documents_ad': ('AFTER DELETE', 'documents', _document_delta('old', -1)),
+    'stats_documents_au': ('AFTER UPDATE OF numero_carton, modele', 'documents',
+                           f"{_document_delta('old', -1)} {_document_delta('new', 1)}"),
+    'stats_states_ai': ('AFTER INSERT', 'document_states', _state_delta('new', 1)),
+    'stats_states_ad': ('AFTER DELETE', 'document_states', _state_delta('old', -1)),
+    # Sub-states go first, while their state's quantity can still be read; this
+    # also cascades bulk DELETEs that bypass the ORM relationship
+    'stats_states_bd': ('BEFORE DELETE', 'document_states',
+                        "DELETE FROM document_state_sub_states WHERE state_id = old.id;"),
+    'stats_states_au': (
+        'AFTER UPDATE', 'document_states',
+        f"{_state_delta('old', -1)} {_state_delta('new', 1)} "
+        "INSERT INTO stat_aggregates (dimension, key, count, quantity) "
+        "SELECT 'sub_state', sub_state, 0, COALESCE(new.quantity, 0) - COALESCE(old.quantity, 0) "
+        "FROM document_state_sub_states WHERE state_id = new.id "
+        "ON CONFLICT (dimension, key) DO UPDATE SET quantity = stat_aggregates.quantity + excluded.quantity;"
+    ),
+    'stats_sub_states_ai': ('AFTER INSERT', 'document_state_sub_states', _sub_state_delta('new', 1)),
+    'stats_sub_states_ad': ('AFTER DELETE', 'document_state_sub_states', _sub_state_delta('old', -1)),
+}
+
+
+def trigger_ddl(dialect, name, timing, table, statements):
+    """DROP/CREATE statements installing one row trigger on SQLite or PostgreSQL."""
+    if dialect == 'sqlite':
+        return [
+            f"DROP TRIGGER IF EXISTS {name}",
+            f"CREATE TRIGGER {name} {timing} ON {table} BEGIN {statements} END",
+        ]
+    # BEFORE triggers must hand the row back or PostgreSQL skips the operation
+    returned = 'OLD' if timing.startswith('BEFORE') else 'NULL'
+    return [
+        f"DROP TRIGGER IF EXISTS {name} ON {table}",
+        f"CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$ "
+        f"BEGIN {statements} RETURN {returned}; END $$",
+        f"CREATE TRIGGER {name} {timing} ON {table} FOR EACH ROW EXECUTE FUNCTION {name}()",
+    ]
+
+
+def rebuild_stats(connection):
+    """Recompute every aggregate from the base tables."""
+    connection.execute(text("DELETE FROM stat_aggregates"))
+    connection.execute(text(
+        "INSERT INTO stat_aggregates (dimension, key, count, quantity) "
+        "SELECT 'total', 'documents', COUNT(*), 0 FROM documents "
+        "UNION ALL SELECT 'total', 'states', COUNT(*), COALESCE(SUM(quantity), 0) FROM document_states "
+        "UNION ALL SELECT 'total', 'cartons', COUNT(DISTINCT numero_carton), 0 FROM documents "
+        "UNION ALL SELECT 'total', 'modeles', COUNT(DISTINCT modele), 0 FROM documents "
+        "UNION ALL SELECT 'state_type', state_type, COUNT(*), COALESCE(SUM(quantity), 0) "
+        "FROM document_states GROUP BY state_type "
+        "UNION ALL SELECT 'sub_state', s.sub_state, COUNT(*), COALESCE(SUM(d.quantity), 0) "
+        "FROM document_state_sub_states s JOIN document_states d ON d.id = s.state_id GROUP BY s.sub_state "
+        "UNION ALL SELECT 'carton', numero_carton, COUNT(*), 0 FROM documents GROUP BY numero_carton "
+        "UNION ALL SELECT 'modele', modele, COUNT(*), 0 FROM documents GROUP BY modele"
+    ))
+
+
+def init_stats_tables(connection):
+    """Install the maintenance triggers, backfilling the aggregates the first time."""
+    if connection.dialect.name not in SUPPORTED_DIALECTS:
+        return
+    if trigger_names(connection, 'stats_') == set(TRIGGERS):
+        return
+    for name, (timing, table, statements) in TRIGGERS.items():
+        for statement in trigger_ddl(connection.dialect.name, name, timing, table, statements):
+            connection.execute(text(statement))
+    rebuild_stats(connection)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_stats_triggers(target, connection, **kw):
+    # Metadata-level so documents and document_states exist before the triggers
+    init_stats_tables(connection)
+
+
+def read_stats(top=10):
+    """Return the /stats figures: totals, per-state and per-sub-state breakdowns, top cartons/modeles."""
+    rows = StatAggregate.query.filter(
+        StatAggregate.dimension.in_(['total', 'state_type', 'sub_state'])
+    ).all()
+    by_dimension = {'total': {}, 'state_type': {}, 'sub_state': {}}
+    for row in rows:
+        by_dimension[row.dimension][row.key] = row
+
+    def top_keys(dimension):
+        return StatAggregate.query.filter(StatAggregate.dimension == dimension, StatAggregate.count > 0) \
+            .order_by(StatAggregate.count.desc()).limit(top).all()
+
+    totals = by_dimension['total']
+    return {
+        'total_documents': totals['documents'].count if 'documents' in totals else 0,
+        'total_states': totals['states'].count if 'states' in totals else 0,
+        'total_quantity': totals['states'].quantity if 'states' in totals else 0,
+        'total_cartons': totals['cartons'].count if 'cartons' in totals else 0,
+        'total_modeles': totals['modeles'].count if 'modeles' in totals else 0,
+        'by_state_type': by_dimension['state_type'],
+        'by_sub_state': by_dimension['sub_state'],
+        'top_cartons': top_keys('carton'),
+        'top_modeles': top_keys('modele'),
+    }
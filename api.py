@@ -0,0 +1,350 @@
+import json
+from collections import defaultdict
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from cache import not_modified, response_cache
+from database import read_only
+from extensions import db
+from filters import FACET_LIMIT, facet_counts, filter_criteria, filter_params
+from instrumentation import timed
+from models import Document, DocumentState, DocumentSubState, sort_sub_states
+from readmodel import read_model
+from search import apply_search, search_criterion
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder is used instead
+    orjson = None
+
+api_bp = Blueprint('api', __name__)
+
+API_BATCH_SIZE = 500
+API_MAX_LIMIT = 1000
+NDJSON = 'application/x-ndjson'
+# Fields of /api/documents, in Document.to_dict() order; ``fields`` picks among them
+DOCUMENT_FIELDS = ('id', 'numero_dossier', 'numero_carton', 'modele', 'created_at', 'updated_at')
+STATE_FIELDS = ('id', 'state_type', 'sub_state', 'sub_states', 'quantity')
+
+# The query building and encoding below is shared with the async handlers in asgi.py
+
+
+def list_params(args, accept):
+    """Read the /api/documents arguments from a MultiDict of query args and an Accept header.
+
+    Raises ValueError for an unknown field in ``fields``.
+    """
+    limit = args.get('limit', type=int)
+    ndjson = args.get('format') == 'ndjson' or accept.best == NDJSON
+    return {
+        'search': args.get('search', '').strip(),
+        'sub_state': args.get('sub_state', '').strip(),
+        'after': args.get('after', 0, type=int),
+        'limit': max(1, min(limit, API_MAX_LIMIT)) if limit is not None else None,
+        'mimetype': NDJSON if ndjson else 'application/json',
+        'fields': field_projection(args.get('fields', '')),
+    }
+
+
+def field_projection(value):
+    """Parse ``fields`` (e.g. ``numero_carton,states.state_type``) into document and state fields.
+
+    Without it every field is returned, as in Document.to_dict(). ``id`` always
+    is, being the paging cursor; ``states`` alone means every state field.
+    The state fields are None when no state field was asked for.
+    """
+    if not value.strip():
+        return {'document': list(DOCUMENT_FIELDS), 'states': list(STATE_FIELDS)}
+    document, states = {'id'}, set()
+    for name in filter(None, (part.strip() for part in value.split(','))):
+        if name == 'states':
+            states.update(STATE_FIELDS)
+        elif name.startswith('states.') and name[len('states.'):] in STATE_FIELDS:
+            states.add(name[len('states.'):])
+        elif name in DOCUMENT_FIELDS:
+            document.add(name)
+        else:
+            raise ValueError(f'champ inconnu: {name}')
+    return {
+        'document': [name for name in DOCUMENT_FIELDS if name in document],
+        'states': [name for name in STATE_FIELDS if name in states] or None,
+    }
+
+
+def search_params(args):
+    return {
+        'q': args.get('q', '').strip(),
+        'limit': max(1, min(args.get('limit', 20, type=int), API_MAX_LIMIT)),
+    }
+
+
+def document_criteria(params, dialect):
+    criteria = []
+    if params['search']:
+        # Keyset paging needs id order, so the index is used as a filter only
+        criteria.append(search_criterion(params['search'], dialect))
+    if params['sub_state']:
+        criteria.append(Document.states.any(
+            DocumentState.sub_state_rows.any(DocumentSubState.sub_state == params['sub_state'])
+        ))
+    return criteria
+
+
+def documents_batch(criteria, after, size):
+    """The next keyset batch of documents after id ``after``, states eager-loaded."""
+    return select(Document).options(selectinload(Document.states)) \
+        .where(*criteria, Document.id > after).order_by(Document.id).limit(size)
+
+
+def next_after(criteria, after, limit):
+    # Peek one id past the page so the cursor header can be sent before the body
+    return select(Document.id).where(*criteria, Document.id > after) \
+        .order_by(Document.id).offset(limit - 1).limit(2)
+
+
+def ranked_search(params, dialect):
+    statement = select(Document).options(selectinload(Document.states))
+    return apply_search(statement, params['q'], ranked=True, dialect=dialect).limit(params['limit'])
+
+
+# ------------------------
+# Row path: /api/documents reads plain rows and encodes them without ORM objects
+# ------------------------
+def document_rows(criteria, after, size, fields):
+    """The next keyset batch of documents after id ``after``, only the projected columns (id first)."""
+    columns = [getattr(Document, name) for name in fields['document']]
+    return select(*columns).where(*criteria, Document.id > after).order_by(Document.id).limit(size)
+
+
+def state_rows(document_ids):
+    return select(DocumentState.document_id, DocumentState.id, DocumentState.state_type, DocumentState.quantity) \
+        .where(DocumentState.document_id.in_(document_ids)).order_by(DocumentState.document_id, DocumentState.id)
+
+
+def state_sub_state_rows(document_ids):
+    return select(DocumentSubState.state_id, DocumentSubState.sub_state) \
+        .join(DocumentState, DocumentState.id == DocumentSubState.state_id) \
+        .where(DocumentState.document_id.in_(document_ids))
+
+
+def needs_sub_states(fields):
+    return bool(fields['states']) and ('sub_state' in fields['states'] or 'sub_states' in fields['states'])
+
+
+@timed('serialize')
+def document_dicts(rows, states, sub_states, fields):
+    """Document.to_dict()-shaped dicts for a batch of rows, restricted to ``fields``."""
+    names = fields['document']
+    dated = [name for name in ('created_at', 'updated_at') if name in names]
+    documents = []
+    by_id = {}
+    for row in rows:
+        document = dict(zip(names, row))
+        for name in dated:
+            if document[name] is not None:
+                document[name] = document[name].isoformat()
+        if fields['states'] is not None:
+            document['states'] = by_id[row[0]] = []
+        documents.append(document)
+    if fields['states'] is None:
+        return documents
+
+    grouped = defaultdict(list)
+    for state_id, sub_state in sub_states:
+        grouped[state_id].append(sub_state)
+    for document_id, state_id, state_type, quantity in states:
+        sorted_sub_states = sort_sub_states(grouped[state_id]) if state_id in grouped else []
+        values = {'id': state_id, 'state_type': state_type, 'quantity': quantity,
+                  'sub_state': ','.join(sorted_sub_states) or None, 'sub_states': sorted_sub_states}
+        by_id[document_id].append({name: values[name] for name in fields['states']})
+    return documents
+
+
+def iter_document_dicts(criteria, fields, after=0, limit=None, batch_size=API_BATCH_SIZE):
+    """Yield documents as dicts in id order: per keyset batch, one query plus one per state table needed."""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        rows = db.session.execute(document_rows(criteria, after, size, fields)).all()
+        if not rows:
+            return
+        states, sub_states = [], []
+        if fields['states'] is not None:
+            ids = [row[0] for row in rows]
+            states = db.session.execute(state_rows(ids)).all()
+            if needs_sub_states(fields):
+                sub_states = db.session.execute(state_sub_state_rows(ids)).all()
+        yield from document_dicts(rows, states, sub_states, fields)
+        after = rows[-1][0]
+        if remaining is not None:
+            remaining -= len(rows)
+        if len(rows) < size:
+            return
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def dumps_compact(value):
+    """Compact JSON of plain values: orjson when installed, else the stdlib C encoder."""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return _encoder.encode(value)
+
+
+@timed('serialize')
+def encode_document(document, index, mimetype, dumps=dumps_compact):
+    """One document dict of a list body: an NDJSON line or a JSON array element."""
+    if mimetype == NDJSON:
+        return dumps(document) + '\n'
+    return (',' if index else '[') + dumps(document)
+
+
+def close_list(count, mimetype):
+    if mimetype == NDJSON:
+        return ''
+    return ']' if count else '[]'
+
+
+def iter_documents(criteria, after=0, limit=None, batch_size=API_BATCH_SIZE):
+    """Yield documents in id order, one keyset batch (plus its states) at a time."""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        batch = db.session.scalars(documents_batch(criteria, after, size)).all()
+        if not batch:
+            return
+        yield from batch
+        after = batch[-1].id
+        if remaining is not None:
+            remaining -= len(batch)
+        if len(batch) < size:
+            return
+
+
+# ------------------------
+# API Routes for Angular
+# ------------------------
+@api_bp.route('/api/documents', methods=['GET'])
+@read_only
+def get_documents():
+    try:
+        params = list_params(request.args, request.accept_mimetypes)
+    except ValueError as exc:
+        return jsonify({'success': False, 'message': str(exc)}), 400
+    mimetype = params['mimetype']
+
+    # Unchanged data since the client's copy: answer before touching the database
+    key = f'documents:{mimetype}:{request.full_path}'
+    etag = response_cache.etag(key)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
+    criteria = document_criteria(params, db.engine.dialect.name)
+    headers = {}
+    if params['limit'] is not None:
+        cached = response_cache.get(key)
+        if cached is not None:
+            response = Response(cached['body'], mimetype=mimetype, headers=cached['headers'])
+            response.set_etag(etag)
+            return response
+
+        ids = db.session.execute(next_after(criteria, params['after'], params['limit'])).all()
+        if len(ids) == 2:
+            headers['X-Next-After'] = str(ids[0].id)
+
+    documents = iter_document_dicts(criteria, params['fields'], after=params['after'], limit=params['limit'])
+
+    # Documents are encoded as they are fetched so memory stays bounded by the batch size
+    def generate():
+        count = 0
+        for count, document in enumerate(documents, start=1):
+            yield encode_document(document, count - 1, mimetype)
+        yield close_list(count, mimetype)
+
+    if params['limit'] is not None:
+        # A bounded page is small enough to keep whole
+        body = ''.join(generate())
+        response_cache.set(key, {'body': body, 'headers': headers})
+        response = Response(body, mimetype=mimetype, headers=headers)
+    else:
+        response = Response(stream_with_context(generate()), mimetype=mimetype, headers=headers)
+    response.set_etag(etag)
+    return response
+
+
+@api_bp.route('/api/documents/search', methods=['GET'])
+@read_only
+def search_documents():
+    params = search_params(request.args)
+    if not params['q']:
+        return jsonify([])
+
+    key = 'search:' + request.full_path
+    etag = response_cache.etag(key)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
+    cached = response_cache.get(key)
+    if cached is None:
+        documents = db.session.scalars(ranked_search(params, db.engine.dialect.name)).all()
+        cached = {'body': [doc.to_dict() for doc in documents]}
+        response_cache.set(key, cached)
+    response = jsonify(cached['body'])
+    response.set_etag(etag)
+    return response
+
+
+@api_bp.route('/api/documents/filter', methods=['GET'])
+@read_only
+def filter_documents():
+    """One keyset page of the documents matching structured filters, with facet counts.
+
+    Arguments: state_type, sub_state, carton, modele (repeatable), quantity_min,
+    quantity_max, search, after, limit (default 50) and facets=0 to skip the counts.
+    """
+    try:
+        params = filter_params(request.args)
+    except ValueError as exc:
+        return jsonify({'success': False, 'message': str(exc)}), 400
+
+    key = 'filter:' + request.full_path
+    etag = response_cache.etag(key)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
+    cached = response_cache.get(key)
+    if cached is None:
+        after = request.args.get('after', 0, type=int)
+        limit = max(1, min(request.args.get('limit', 50, type=int), API_MAX_LIMIT))
+        facets = None
+        model = read_model() if not params['search'] else None
+        if model is not None:
+            # Ids and counts from the in-memory columns, only the page itself from the database
+            columns = model.current()
+            mask = columns.match(params) if request.args.get('facets') != '0' else None
+            ids = columns.ids_after(params, after, limit + 1, mask)
+            documents = db.session.scalars(documents_batch([Document.id.in_(ids[:limit])], 0, limit)).all()
+            next_id = ids[limit - 1] if len(ids) > limit else None
+            if mask is not None:
+                facets = columns.facet_counts(mask, FACET_LIMIT)
+        else:
+            criteria = filter_criteria(params, db.engine.dialect.name)
+            # One extra row tells whether there is a next page
+            documents = db.session.scalars(documents_batch(criteria, after, limit + 1)).all()
+            next_id = documents[limit - 1].id if len(documents) > limit else None
+            if request.args.get('facets') != '0':
+                facets = facet_counts(criteria)
+        body = {
+            'documents': [doc.to_dict() for doc in documents[:limit]],
+            'next_after': next_id,
+        }
+        if facets is not None:
+            body['total'], body['facets'] = facets
+        cached = {'body': body}
+        response_cache.set(key, cached)
+    response = jsonify(cached['body'])
+    response.set_etag(etag)
+    return response
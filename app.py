@@ -1,582 +1,178 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session
-from sqlalchemy import text, or_, func
-from extensions import db
-from auth import auth_bp
-
-ALL_ETATS = ['REP', 'HS', 'SWA', 'BRK']
-
-# Initialize Flask app
-app = Flask(__name__)
-
-# Configuration must come before db.init_app
-basedir = os.path.abspath(os.path.dirname(__file__))
-app.config.update(
-    SECRET_KEY='your-secret-key-here',
-    SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(basedir, 'instance', 'database.db'),
-    SQLALCHEMY_TRACK_MODIFICATIONS=False
-)
-
-db.init_app(app)
-app.register_blueprint(auth_bp)
-
-
-# ------------------------
-# Models
-# ------------------------
-class Document(db.Model):
-    __tablename__ = 'documents'
-    id = db.Column(db.Integer, primary_key=True)
-    numero_dossier = db.Column(db.String(100), nullable=False, unique=True)
-    numero_carton = db.Column(db.String(100), nullable=False)
-    modele = db.Column(db.String(100), nullable=False)
-
-    # lazy='dynamic' for querying states if needed
-    states = db.relationship('DocumentState', backref='document', lazy='dynamic', cascade='all, delete-orphan')
-
-    def __repr__(self):
-        return f'<Document {self.numero_dossier}>'
-
-    # Optional: helper to get list of states (non-dynamic)
-    def get_states(self):
-        return self.states.all()
-
-
-class DocumentState(db.Model):
-    __tablename__ = 'document_states'
-    id = db.Column(db.Integer, primary_key=True)
-    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
-    state_type = db.Column(db.String(50), nullable=False)
-    sub_state = db.Column(db.String(200))
-    quantity = db.Column(db.Integer, nullable=True)
-
-    def get_sub_states(self):
-        return self.sub_state.split(',') if self.sub_state else []
-
-
-# ------------------------
-# Routes
-# ------------------------
-
-def is_logged_in():
-    return 'user_id' in session
-
-
-@app.route('/')
-def home():
-    return redirect(url_for('auth.login'))
-
-
-@app.route('/dashboard')
-def dashboard():
-    if not is_logged_in():
-        flash('Veuillez vous connecter pour accéder au tableau de bord.', 'error')
-        return redirect(url_for('auth.login'))
-
-    search = request.args.get('search', '').strip()
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-
-    query = Document.query
-    if search:
-        query = query.filter(
-            or_(
-                Document.numero_dossier.contains(search),
-                Document.numero_carton.contains(search),
-                Document.modele.contains(search)
-            )
-        )
-
-    documents = query.paginate(page=page, per_page=per_page, error_out=False)
-    return render_template('index.html', documents=documents, search=search)
-
-
-@app.route('/add', methods=['GET', 'POST'])
-def add_document():
-    if not is_logged_in():
-        return redirect(url_for('auth.login'))
-
-    if request.method == 'POST':
-        numero_dossier = request.form['numero_dossier'].strip()
-        numero_carton = request.form['numero_carton'].strip()
-        modele = request.form['modele'].strip()
-
-        if not numero_dossier or not numero_carton or not modele:
-            flash('Veuillez remplir tous les champs obligatoires!', 'error')
-            return redirect(url_for('add_document'))
-
-        if Document.query.filter_by(numero_dossier=numero_dossier).first():
-            flash('Un document avec ce numéro de dossier existe déjà!', 'error')
-            return redirect(url_for('add_document'))
-
-        new_document = Document(numero_dossier=numero_dossier, numero_carton=numero_carton, modele=modele)
-        db.session.add(new_document)
-        db.session.flush()
-
-        states = request.form.getlist('etats')
-        quantities = request.form.getlist('quantities')
-
-        for i, state_type in enumerate(states):
-            quantity = int(quantities[i]) if i < len(quantities) and quantities[i].isdigit() else 1
-            sub_states = request.form.getlist(f'sub_states_{i}') if state_type == 'BRK' else []
-            sub_state_str = ",".join(sub_states) if sub_states else None
-
-            db.session.add(DocumentState(
-                document_id=new_document.id,
-                state_type=state_type,
-                sub_state=sub_state_str,
-                quantity=quantity
-            ))
-
-        db.session.commit()
-        flash('Document ajouté avec succès!', 'success')
-        return redirect(url_for('dashboard'))
-
-    etats = [{'id': etat, 'nom': etat} for etat in ALL_ETATS]
-    return render_template('add_document.html', etats=etats)
-
-
-@app.route('/edit/<int:id>', methods=['GET', 'POST'])
-def edit_document(id):
-    if not is_logged_in():
-        return redirect(url_for('auth.login'))
-
-    document = Document.query.get_or_404(id)
-
-    if request.method == 'POST':
-        document.numero_dossier = request.form['numero_dossier'].strip()
-        document.numero_carton = request.form['numero_carton'].strip()
-        document.modele = request.form['modele'].strip()
-
-        DocumentState.query.filter_by(document_id=id).delete()
-
-        states = request.form.getlist('etats')
-        quantities = request.form.getlist('quantities')
-
-        for i, state_type in enumerate(states):
-            quantity = int(quantities[i]) if i < len(quantities) and quantities[i].isdigit() else 1
-            sub_states = request.form.getlist(f'sub_states_{i}') if state_type == 'BRK' else []
-            sub_state_str = ",".join(sub_states) if sub_states else None
-
-            db.session.add(DocumentState(
-                document_id=id,
-                state_type=state_type,
-                sub_state=sub_state_str,
-                quantity=quantity
-            ))
-
-        db.session.commit()
-        flash('Document modifié avec succès!', 'success')
-        return redirect(url_for('dashboard'))
-
-    etats = [{'id': etat, 'nom': etat} for etat in ALL_ETATS]
-    selected_etats = [state.state_type for state in document.states]
-
-    return render_template('edit_document.html', document=document, etats=etats, selected_etats=selected_etats)
-
-
-@app.route('/delete/<int:id>', methods=['POST'])
-def delete_document(id):
-    if not is_logged_in():
-        return redirect(url_for('auth.login'))
-
-    document = Document.query.get_or_404(id)
-    db.session.delete(document)
-    db.session.commit()
-    flash('Document supprimé avec succès!', 'success')
-    return redirect(url_for('dashboard'))
-
-
-@app.route('/document/<int:doc_id>/add_state', methods=['POST'])
-def add_document_state(doc_id):
-    if not is_logged_in():
-        return redirect(url_for('auth.login'))
-
-    data = request.get_json()
-    Document.query.get_or_404(doc_id)
-
-    new_state = DocumentState(
-        document_id=doc_id,
-        state_type=data.get('state_type'),
-        sub_state=data.get('sub_state'),
-        quantity=data.get('quantity', 1)
-    )
-
-    db.session.add(new_state)
-    db.session.commit()
-    return jsonify({'success': True, 'message': 'État ajouté avec succès'})
-
-
-@app.route('/state/<int:state_id>/delete', methods=['POST'])
-def delete_document_state(state_id):
-    if not is_logged_in():
-        return redirect(url_for('auth.login'))
-
-    state = DocumentState.query.get_or_404(state_id)
-    db.session.delete(state)
-    db.session.commit()
-    return jsonify({'success': True, 'message': 'État supprimé avec succès'})
-
-
-@app.route('/tables')
-def list_tables():
-    with db.engine.connect() as connection:
-        result = connection.execute(text("SELECT name FROM sqlite_master WHERE type='table';"))
-        table_names = [row[0] for row in result]
-    return f"Tables dans la base de données: {', '.join(table_names)}"
-
-
-@app.route('/stats')
-def stats():
-    if not is_logged_in():
-        return redirect(url_for('auth.login'))
-
-    total_documents = Document.query.count()
-    total_states = DocumentState.query.count()
-    documents_by_dossier = db.session.query(
-        Document.numero_dossier, func.count(Document.id)
-    ).group_by(Document.numero_dossier).all()
-
-    return render_template('stats.html',
-                           total_documents=total_documents,
-                           total_states=total_states,
-                           documents_by_dossier=documents_by_dossier)
-
-
-# ------------------------
-# Initialize & add sample data
-# ------------------------
-if __name__ == '__main__':
-    instance_path = os.path.join(basedir, 'instance')
-    os.makedirs(instance_path, exist_ok=True)
-
-    with app.app_context():
-        db.create_all()
-
-        if Document.query.count() == 0:
-            sample_docs = [
-                Document(numero_dossier='Dossier001', numero_carton='CartonA', modele='ModelX'),
-                Document(numero_dossier='Dossier002', numero_carton='CartonB', modele='ModelY'),
-                Document(numero_dossier='Dossier003', numero_carton='CartonC', modele='ModelZ'),
-            ]
-            db.session.bulk_save_objects(sample_docs)
-            db.session.commit()
-
-            sample_states = [
-                DocumentState(document_id=1, state_type='REP', quantity=5),
-                DocumentState(document_id=1, state_type='HS', quantity=2),
-                DocumentState(document_id=2, state_type='SWA', quantity=4),
-                DocumentState(document_id=3, state_type='BRK', sub_state='KC', quantity=1),
-                DocumentState(document_id=3, state_type='BRK', sub_state='Ill', quantity=1),
-            ]
-            db.session.bulk_save_objects(sample_states)
-            db.session.commit()
-
-    app.run(debug=True)
-import os
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session
-from sqlalchemy import text, or_, func
+import click
+from flask import Flask, current_app
 from flask_cors import CORS
 from extensions import db
+from database import database_binds, database_url, engine_options, init_sqlite_tuning
 from auth import auth_bp
+from models import Document, DocumentState
+from cache import response_cache
+from compression import init_compression
+from instrumentation import init_instrumentation
+from documents import documents_bp
+from api import api_bp
+from importer import import_bp
+from exporter import export_bp
+from batch import batch_bp
+from cartons import cartons_bp
+from jobs import init_jobs
+from reports import reports_bp
+from changes import changes_bp
+from history import history_bp
+from readmodel import init_read_model
+from migrations import missing_indexes, run_migrations
 
-ALL_ETATS = ['REP', 'HS', 'SWA', 'BRK']
-
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app) # Enable CORS for all routes
-
-# Configuration must come before db.init_app
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config.update(
-    SECRET_KEY='your-secret-key-here',
-    SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(basedir, 'instance', 'database.db'),
-    SQLALCHEMY_TRACK_MODIFICATIONS=False
-)
-
-db.init_app(app)
-app.register_blueprint(auth_bp)
-
-
-# ------------------------
-# Models
-# ------------------------
-class Document(db.Model):
-    __tablename__ = 'documents'
-    id = db.Column(db.Integer, primary_key=True)
-    numero_dossier = db.Column(db.String(100), nullable=False, unique=True)
-    numero_carton = db.Column(db.String(100), nullable=False)
-    modele = db.Column(db.String(100), nullable=False)
-
-    states = db.relationship('DocumentState', backref='document', lazy='dynamic', cascade='all, delete-orphan')
-
-    def __repr__(self):
-        return f'<Document {self.numero_dossier}>'
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'numero_dossier': self.numero_dossier,
-            'numero_carton': self.numero_carton,
-            'modele': self.modele,
-            'states': [state.to_dict() for state in self.states]
-        }
-
+EXPOSED_HEADERS = ['X-Next-After', 'ETag', 'Server-Timing']
+
+
+def default_config():
+    """Configuration read from the environment when the app is created.
+
+    DATABASE_URL may point at SQLite or PostgreSQL; DATABASE_REPLICA_URL, if
+    set, serves the read-only views.
+    """
+    return dict(
+        SECRET_KEY=os.environ.get('SECRET_KEY', 'your-secret-key-here'),
+        SQLALCHEMY_DATABASE_URI=database_url(os.environ.get(
+            'DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'instance', 'database.db')
+        )),
+        SQLALCHEMY_BINDS=database_binds(os.environ.get('DATABASE_REPLICA_URL')),
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # Connection pool of each worker process; see engine_options()
+        DB_POOL_SIZE=int(os.environ.get('DB_POOL_SIZE', 10)),
+        DB_MAX_OVERFLOW=int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        # SQLite only. WAL lets the dashboard keep reading while a form is being saved
+        SQLITE_PRAGMAS={
+            'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+            'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+            'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+            'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),
+            'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 268435456)),
+            'temp_store': 'MEMORY',
+        },
+        DB_WRITE_RETRIES=int(os.environ.get('DB_WRITE_RETRIES', 5)),
+        # Listing/stats response cache; CACHE_REDIS_URL shares it between worker processes
+        CACHE_TTL=int(os.environ.get('CACHE_TTL', 30)),
+        CACHE_MAX_ENTRIES=int(os.environ.get('CACHE_MAX_ENTRIES', 512)),
+        CACHE_REDIS_URL=os.environ.get('CACHE_REDIS_URL'),
+        # Werkzeug hash spec; existing hashes are upgraded at their next login
+        PASSWORD_HASH_METHOD=os.environ.get('PASSWORD_HASH_METHOD', 'scrypt'),
+        AUTH_CACHE_TTL=int(os.environ.get('AUTH_CACHE_TTL', 60)),
+        # Instrumentation: Server-Timing header, /metrics, slow-query and N+1 warnings
+        SERVER_TIMING=os.environ.get('SERVER_TIMING', '1') == '1',
+        SLOW_QUERY_MS=float(os.environ.get('SLOW_QUERY_MS', 200)),
+        QUERY_COUNT_WARNING=int(os.environ.get('QUERY_COUNT_WARNING', 50)),
+        # Background jobs: JOB_WORKERS per process (0 leaves them to `flask run-jobs`),
+        # JOB_LIMITS per kind across processes; output files go to JOB_DIR
+        JOB_WORKERS=int(os.environ.get('JOB_WORKERS', 2)),
+        JOB_LIMITS={
+            'import': int(os.environ.get('JOB_LIMIT_IMPORT', 1)),
+            'delete': int(os.environ.get('JOB_LIMIT_DELETE', 1)),
+            'aggregates': 1,
+            'export': int(os.environ.get('JOB_LIMIT_EXPORT', 2)),
+            'report': int(os.environ.get('JOB_LIMIT_REPORT', 2)),
+        },
+        JOB_DIR=os.environ.get('JOB_DIR', os.path.join(basedir, 'instance', 'jobs')),
+        # Print reports above this many dossiers run as jobs
+        REPORT_INLINE_LIMIT=int(os.environ.get('REPORT_INLINE_LIMIT', 500)),
+        # Seconds between two looks at the change log for each Server-Sent Events client
+        CHANGES_POLL_INTERVAL=float(os.environ.get('CHANGES_POLL_INTERVAL', 1)),
+        # In-memory columns for filters, facets and carton totals (needs numpy), at most
+        # READ_MODEL_REFRESH seconds behind writes of other processes
+        READ_MODEL=os.environ.get('READ_MODEL', '0') == '1',
+        READ_MODEL_REFRESH=float(os.environ.get('READ_MODEL_REFRESH', 1)),
+        # gzip/brotli for responses of at least COMPRESS_MIN_SIZE bytes; off when a proxy compresses
+        COMPRESSION=os.environ.get('COMPRESSION', '1') == '1',
+        COMPRESS_MIN_SIZE=int(os.environ.get('COMPRESS_MIN_SIZE', 500)),
+    )
 
-class DocumentState(db.Model):
-    __tablename__ = 'document_states'
-    id = db.Column(db.Integer, primary_key=True)
-    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
-    state_type = db.Column(db.String(50), nullable=False)
-    sub_state = db.Column(db.String(200))
-    quantity = db.Column(db.Integer, nullable=True)
 
-    def get_sub_states(self):
-        return self.sub_state.split(',') if self.sub_state else []
-    
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'state_type': self.state_type,
-            'sub_state': self.sub_state,
-            'quantity': self.quantity
-        }
+def create_app(config=None):
+    """Build the Flask app; ``config`` overrides the environment-driven defaults."""
+    app = Flask(__name__)
+    # Enable CORS for all routes; the Angular client reads the paging cursor and validators
+    CORS(app, expose_headers=EXPOSED_HEADERS)
+
+    # Configuration must come before db.init_app
+    app.config.update(default_config())
+    app.config.update(config or {})
+    # Built from the final database URL, which ``config`` may have replaced
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(
+        app.config['SQLALCHEMY_DATABASE_URI'], app.config['DB_POOL_SIZE'], app.config['DB_MAX_OVERFLOW']))
+
+    db.init_app(app)
+    init_sqlite_tuning(app)
+    response_cache.init_app(app)
+    init_instrumentation(app)
+    init_jobs(app)
+    init_read_model(app)
+    init_compression(app)
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(documents_bp)
+    app.register_blueprint(api_bp)
+    app.register_blueprint(import_bp)
+    app.register_blueprint(export_bp)
+    app.register_blueprint(batch_bp)
+    app.register_blueprint(cartons_bp)
+    app.register_blueprint(reports_bp)
+    app.register_blueprint(changes_bp)
+    app.register_blueprint(history_bp)
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Crée les tables et applique les migrations en attente."""
+        init_database()
+        click.echo('Base de données à jour.')
+
+    return app
 
 
 # ------------------------
-# Traditional Flask Routes (for server-side rendering, if needed)
+# Database setup
 # ------------------------
-def is_logged_in():
-    return 'user_id' in session
-
-@app.route('/')
-def home():
-    return redirect(url_for('auth.login'))
-
-@app.route('/dashboard')
-def dashboard():
-    if not is_logged_in():
-        flash('Veuillez vous connecter pour accéder au tableau de bord.', 'error')
-        return redirect(url_for('auth.login'))
-
-    search = request.args.get('search', '').strip()
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-
-    query = Document.query
-    if search:
-        query = query.filter(
-            or_(
-                Document.numero_dossier.contains(search),
-                Document.numero_carton.contains(search),
-                Document.modele.contains(search)
-            )
-        )
-
-    documents = query.paginate(page=page, per_page=per_page, error_out=False)
-    return render_template('index.html', documents=documents, search=search)
-
-@app.route('/add', methods=['GET', 'POST'])
-def add_document():
-    if not is_logged_in():
-        return redirect(url_for('auth.login'))
-
-    if request.method == 'POST':
-        numero_dossier = request.form['numero_dossier'].strip()
-        numero_carton = request.form['numero_carton'].strip()
-        modele = request.form['modele'].strip()
-
-        if not numero_dossier or not numero_carton or not modele:
-            flash('Veuillez remplir tous les champs obligatoires!', 'error')
-            return redirect(url_for('add_document'))
-
-        if Document.query.filter_by(numero_dossier=numero_dossier).first():
-            flash('Un document avec ce numéro de dossier existe déjà!', 'error')
-            return redirect(url_for('add_document'))
-
-        new_document = Document(numero_dossier=numero_dossier, numero_carton=numero_carton, modele=modele)
-        db.session.add(new_document)
-        db.session.flush()
-
-        states = request.form.getlist('etats')
-        quantities = request.form.getlist('quantities')
-
-        for i, state_type in enumerate(states):
-            quantity = int(quantities[i]) if i < len(quantities) and quantities[i].isdigit() else 1
-            sub_states = request.form.getlist(f'sub_states_{i}') if state_type == 'BRK' else []
-            sub_state_str = ",".join(sub_states) if sub_states else None
-
-            db.session.add(DocumentState(
-                document_id=new_document.id,
-                state_type=state_type,
-                sub_state=sub_state_str,
-                quantity=quantity
-            ))
-
+def init_database():
+    """Create missing tables, apply pending migrations and report any index still missing.
+
+    Needs an app context. Run it once per deployment (``flask --app wsgi init-db``)
+    rather than from every worker.
+    """
+    db.create_all()
+    run_migrations(db.engine, current_app.logger)
+    for table_name, index_name in missing_indexes(db.engine):
+        current_app.logger.warning('Index manquant: %s sur la table %s', index_name, table_name)
+
+
+def add_sample_data():
+    if Document.query.count() == 0:
+        sample_docs = [
+            Document(numero_dossier='Dossier001', numero_carton='CartonA', modele='ModelX'),
+            Document(numero_dossier='Dossier002', numero_carton='CartonB', modele='ModelY'),
+            Document(numero_dossier='Dossier003', numero_carton='CartonC', modele='ModelZ'),
+        ]
+        db.session.bulk_save_objects(sample_docs)
         db.session.commit()
-        flash('Document ajouté avec succès!', 'success')
-        return redirect(url_for('dashboard'))
-
-    etats = [{'id': etat, 'nom': etat} for etat in ALL_ETATS]
-    return render_template('add_document.html', etats=etats)
-
-
-@app.route('/edit/<int:id>', methods=['GET', 'POST'])
-def edit_document(id):
-    if not is_logged_in():
-        return redirect(url_for('auth.login'))
-
-    document = Document.query.get_or_404(id)
-
-    if request.method == 'POST':
-        document.numero_dossier = request.form['numero_dossier'].strip()
-        document.numero_carton = request.form['numero_carton'].strip()
-        document.modele = request.form['modele'].strip()
-
-        DocumentState.query.filter_by(document_id=id).delete()
-
-        states = request.form.getlist('etats')
-        quantities = request.form.getlist('quantities')
-
-        for i, state_type in enumerate(states):
-            quantity = int(quantities[i]) if i < len(quantities) and quantities[i].isdigit() else 1
-            sub_states = request.form.getlist(f'sub_states_{i}') if state_type == 'BRK' else []
-            sub_state_str = ",".join(sub_states) if sub_states else None
-
-            db.session.add(DocumentState(
-                document_id=id,
-                state_type=state_type,
-                sub_state=sub_state_str,
-                quantity=quantity
-            ))
 
+        sample_states = [
+            DocumentState(document_id=1, state_type='REP', quantity=5),
+            DocumentState(document_id=1, state_type='HS', quantity=2),
+            DocumentState(document_id=2, state_type='SWA', quantity=4),
+            DocumentState(document_id=3, state_type='BRK', sub_state='KC', quantity=1),
+            DocumentState(document_id=3, state_type='BRK', sub_state='Ill', quantity=1),
+        ]
+        db.session.add_all(sample_states)
         db.session.commit()
-        flash('Document modifié avec succès!', 'success')
-        return redirect(url_for('dashboard'))
-
-    etats = [{'id': etat, 'nom': etat} for etat in ALL_ETATS]
-    selected_etats = [state.state_type for state in document.states]
-
-    return render_template('edit_document.html', document=document, etats=etats, selected_etats=selected_etats)
-
-@app.route('/delete/<int:id>', methods=['POST'])
-def delete_document(id):
-    if not is_logged_in():
-        return redirect(url_for('auth.login'))
-
-    document = Document.query.get_or_404(id)
-    db.session.delete(document)
-    db.session.commit()
-    flash('Document supprimé avec succès!', 'success')
-    return redirect(url_for('dashboard'))
-
-@app.route('/document/<int:doc_id>/add_state', methods=['POST'])
-def add_document_state(doc_id):
-    if not is_logged_in():
-        return redirect(url_for('auth.login'))
-
-    data = request.get_json()
-    Document.query.get_or_404(doc_id)
-
-    new_state = DocumentState(
-        document_id=doc_id,
-        state_type=data.get('state_type'),
-        sub_state=data.get('sub_state'),
-        quantity=data.get('quantity', 1)
-    )
-
-    db.session.add(new_state)
-    db.session.commit()
-    return jsonify({'success': True, 'message': 'État ajouté avec succès'})
-
-
-@app.route('/state/<int:state_id>/delete', methods=['POST'])
-def delete_document_state(state_id):
-    if not is_logged_in():
-        return redirect(url_for('auth.login'))
-
-    state = DocumentState.query.get_or_404(state_id)
-    db.session.delete(state)
-    db.session.commit()
-    return jsonify({'success': True, 'message': 'État supprimé avec succès'})
-
-
-@app.route('/tables')
-def list_tables():
-    with db.engine.connect() as connection:
-        result = connection.execute(text("SELECT name FROM sqlite_master WHERE type='table';"))
-        table_names = [row[0] for row in result]
-    return f"Tables dans la base de données: {', '.join(table_names)}"
-
-@app.route('/stats')
-def stats():
-    if not is_logged_in():
-        return redirect(url_for('auth.login'))
-
-    total_documents = Document.query.count()
-    total_states = DocumentState.query.count()
-    documents_by_dossier = db.session.query(
-        Document.numero_dossier, func.count(Document.id)
-    ).group_by(Document.numero_dossier).all()
-
-    return render_template('stats.html',
-                            total_documents=total_documents,
-                            total_states=total_states,
-                            documents_by_dossier=documents_by_dossier)
-
-
-# ------------------------
-# API Routes for Angular
-# ------------------------
-@app.route('/api/documents', methods=['GET'])
-def get_documents():
-    query = Document.query
-    search = request.args.get('search', '').strip()
-    
-    if search:
-        query = query.filter(
-            or_(
-                Document.numero_dossier.contains(search),
-                Document.numero_carton.contains(search),
-                Document.modele.contains(search)
-            )
-        )
-    
-    documents = query.all()
-    
-    # Use list comprehension to serialize documents using the to_dict method
-    documents_list = [doc.to_dict() for doc in documents]
-        
-    return jsonify(documents_list)
 
 
 # ------------------------
-# Initialize & add sample data
+# Initialize & add sample data (development server only; see wsgi.py / asgi.py)
 # ------------------------
 if __name__ == '__main__':
-    instance_path = os.path.join(basedir, 'instance')
-    os.makedirs(instance_path, exist_ok=True)
+    os.makedirs(os.path.join(basedir, 'instance'), exist_ok=True)
+    app = create_app()
 
     with app.app_context():
-        db.create_all()
-
-        if Document.query.count() == 0:
-            sample_docs = [
-                Document(numero_dossier='Dossier001', numero_carton='CartonA', modele='ModelX'),
-                Document(numero_dossier='Dossier002', numero_carton='CartonB', modele='ModelY'),
-                Document(numero_dossier='Dossier003', numero_carton='CartonC', modele='ModelZ'),
-            ]
-            db.session.bulk_save_objects(sample_docs)
-            db.session.commit()
-
-            sample_states = [
-                DocumentState(document_id=1, state_type='REP', quantity=5),
-                DocumentState(document_id=1, state_type='HS', quantity=2),
-                DocumentState(document_id=2, state_type='SWA', quantity=4),
-                DocumentState(document_id=3, state_type='BRK', sub_state='KC', quantity=1),
-                DocumentState(document_id=3, state_type='BRK', sub_state='Ill', quantity=1),
-            ]
-            db.session.bulk_save_objects(sample_states)
-            db.session.commit()
+        init_database()
+        add_sample_data()
 
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1')
@@ -0,0 +1,271 @@
+"""ASGI entry point: the JSON listing API and change feed on async handlers, everything else on the Flask app.
+
+    flask --app wsgi init-db                 # once per deployment
+    uvicorn asgi:app --workers 4 --host 0.0.0.0 --port 8000
+
+GET /api/documents, /api/documents/search and the /api/documents/changes feed
+are answered from an async engine (aiosqlite or asyncpg, on the replica if
+configured), so slow listings wait on the event loop instead of holding a
+thread that state mutations need. An idle Server-Sent Events client costs a
+sleeping coroutine and one small query per CHANGES_POLL_INTERVAL. Every
+other request is passed to the Flask app, which asgiref runs in its thread
+pool. Listings are compressed as in compression.py. The async handlers are
+not instrumented: they send no Server-Timing header and do not appear in
+/metrics, which only covers the requests passed to Flask. Needs the asgiref
+and aiosqlite (or asyncpg) packages.
+"""
+import asyncio
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy.ext.asyncio import AsyncSession
+from werkzeug.datastructures import Accept, MIMEAccept, MultiDict
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
+import compression
+from api import (API_BATCH_SIZE, close_list, document_criteria, document_dicts, document_rows, encode_document,
+                 list_params, needs_sub_states, next_after, ranked_search, search_params, state_rows,
+                 state_sub_state_rows)
+from app import EXPOSED_HEADERS, create_app
+from cache import response_cache
+from changes import (CHANGES_KEEPALIVE, GONE, changed_documents, changes_body, changes_params, documents_by_id,
+                     sse_event, version_bounds)
+from database import create_async_api_engine
+
+flask_app = create_app()
+wsgi_app = WsgiToAsgi(flask_app)
+engine = create_async_api_engine(flask_app)
+dumps = flask_app.json.dumps
+
+
+# ------------------------
+# Request / response plumbing
+# ------------------------
+class Request:
+    def __init__(self, scope, receive):
+        self.receive = receive
+        query_string = scope['query_string'].decode('latin-1')
+        self.args = MultiDict(parse_qsl(query_string, keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        # Same key as Flask's request.full_path, so both sides share cache entries
+        self.full_path = f"{scope['path']}?{query_string}"
+        self.accept_mimetypes = parse_accept_header(self.headers.get('accept'), MIMEAccept)
+        self.accept_encodings = parse_accept_header(self.headers.get('accept-encoding'), Accept)
+        self.if_none_match = parse_etags(self.headers.get('if-none-match'))
+
+
+async def start_response(send, status, mimetype=None, headers=None, etag=None, encoding=None):
+    # The Angular client is cross-origin; the Flask side gets this header from flask-cors
+    raw = [(b'access-control-allow-origin', b'*'),
+           (b'access-control-expose-headers', ', '.join(EXPOSED_HEADERS).encode())]
+    if mimetype:
+        raw.append((b'content-type', f'{mimetype}; charset=utf-8'.encode()))
+    if etag:
+        # Same content, other bytes: a compressed body gets a weak validator
+        raw.append((b'etag', quote_etag(etag, weak=encoding is not None).encode()))
+    if encoding:
+        raw.append((b'content-encoding', encoding.encode()))
+    if status == 200 and mimetype in compression.COMPRESSIBLE and flask_app.config['COMPRESSION']:
+        raw.append((b'vary', b'Accept-Encoding'))
+    raw.extend((name.lower().encode(), str(value).encode()) for name, value in (headers or {}).items())
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw})
+
+
+async def respond(send, status, body='', mimetype=None, headers=None, etag=None, encoding=None):
+    body = body.encode()
+    if encoding is not None and len(body) >= flask_app.config['COMPRESS_MIN_SIZE']:
+        body = compression.compress(body, encoding)
+    else:
+        encoding = None
+    await start_response(send, status, mimetype, headers, etag, encoding)
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def response_encoding(request):
+    """Content-Encoding negotiated for a compressible response, or None."""
+    if not flask_app.config['COMPRESSION']:
+        return None
+    return compression.negotiate(request.accept_encodings)
+
+
+async def iter_document_dicts(session, criteria, fields, after=0, limit=None, batch_size=API_BATCH_SIZE):
+    """Async twin of api.iter_document_dicts."""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        rows = (await session.execute(document_rows(criteria, after, size, fields))).all()
+        if not rows:
+            return
+        states, sub_states = [], []
+        if fields['states'] is not None:
+            ids = [row[0] for row in rows]
+            states = (await session.execute(state_rows(ids))).all()
+            if needs_sub_states(fields):
+                sub_states = (await session.execute(state_sub_state_rows(ids))).all()
+        for document in document_dicts(rows, states, sub_states, fields):
+            yield document
+        after = rows[-1][0]
+        if remaining is not None:
+            remaining -= len(rows)
+        if len(rows) < size:
+            return
+
+
+# ------------------------
+# Async API handlers
+# ------------------------
+async def get_documents(request, send):
+    try:
+        params = list_params(request.args, request.accept_mimetypes)
+    except ValueError as exc:
+        return await respond(send, 400, dumps({'success': False, 'message': str(exc)}) + '\n', 'application/json')
+    mimetype = params['mimetype']
+
+    key = f'documents:{mimetype}:{request.full_path}'
+    etag = response_cache.etag(key)
+    if request.if_none_match.contains_weak(etag):
+        return await respond(send, 304, etag=etag)
+
+    criteria = document_criteria(params, engine.dialect.name)
+    headers = {}
+    encoding = response_encoding(request)
+    if params['limit'] is not None:
+        cached = response_cache.get(key)
+        if cached is not None:
+            return await respond(send, 200, cached['body'], mimetype, cached['headers'], etag, encoding)
+
+    async with AsyncSession(engine) as session:
+        if params['limit'] is not None:
+            ids = (await session.execute(next_after(criteria, params['after'], params['limit']))).all()
+            if len(ids) == 2:
+                headers['X-Next-After'] = str(ids[0].id)
+
+        async def generate():
+            count = 0
+            async for document in iter_document_dicts(session, criteria, params['fields'], params['after'],
+                                                      params['limit']):
+                yield encode_document(document, count, mimetype)
+                count += 1
+            yield close_list(count, mimetype)
+
+        if params['limit'] is not None:
+            body = ''.join([piece async for piece in generate()])
+            response_cache.set(key, {'body': body, 'headers': headers})
+            return await respond(send, 200, body, mimetype, headers, etag, encoding)
+
+        compressor = compression.Compressor(encoding) if encoding else None
+        await start_response(send, 200, mimetype, headers, etag, encoding)
+        async for piece in generate():
+            data = compressor.compress(piece.encode()) if compressor else piece.encode()
+            if data:
+                await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': compressor.finish() if compressor else b''})
+
+
+async def search_documents(request, send):
+    params = search_params(request.args)
+    if not params['q']:
+        return await respond(send, 200, '[]', 'application/json')
+
+    key = 'search:' + request.full_path
+    etag = response_cache.etag(key)
+    if request.if_none_match.contains_weak(etag):
+        return await respond(send, 304, etag=etag)
+
+    cached = response_cache.get(key)
+    if cached is None:
+        async with AsyncSession(engine) as session:
+            documents = (await session.scalars(ranked_search(params, engine.dialect.name))).all()
+            cached = {'body': [doc.to_dict() for doc in documents]}
+        response_cache.set(key, cached)
+    await respond(send, 200, dumps(cached['body']) + '\n', 'application/json', etag=etag,
+                  encoding=response_encoding(request))
+
+
+async def read_changes(session, since, limit):
+    """Async twin of changes.read_changes."""
+    bounds = (await session.execute(version_bounds(engine.dialect.name))).one()
+    rows = []
+    documents = []
+    if since is not None and bounds[1] is not None and since < bounds[1]:
+        rows = (await session.execute(changed_documents(since, bounds[1], limit))).all()
+        if rows:
+            documents = (await session.scalars(documents_by_id([row[0] for row in rows[:limit]]))).all()
+    return changes_body(since, limit, bounds, rows, documents)
+
+
+async def get_changes(request, send):
+    params = changes_params(request.args)
+    async with AsyncSession(engine) as session:
+        body = await read_changes(session, params['since'], params['limit'])
+    if body is None:
+        return await respond(send, 410, dumps(GONE) + '\n', 'application/json')
+    await respond(send, 200, dumps(body) + '\n', 'application/json', encoding=response_encoding(request))
+
+
+async def stream_changes(request, send):
+    params = changes_params(request.args, request.headers.get('last-event-id'))
+    interval = flask_app.config['CHANGES_POLL_INTERVAL']
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await request.receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    async def push(text):
+        await send({'type': 'http.response.body', 'body': text.encode(), 'more_body': True})
+
+    watcher = asyncio.create_task(watch_disconnect())
+    await start_response(send, 200, 'text/event-stream', {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    since, idle = params['since'], 0.0
+    try:
+        while not disconnected.is_set():
+            async with AsyncSession(engine) as session:
+                body = await read_changes(session, since, params['limit'])
+            if body is None:
+                await push(f"event: reset\ndata: {dumps(GONE)}\n\n")
+                break
+            if since is None or body['changes']:
+                await push(sse_event(body, dumps))
+                since, idle = body['version'], 0.0
+                if body['more']:
+                    continue
+            elif idle >= CHANGES_KEEPALIVE:
+                await push(': keepalive\n\n')
+                idle = 0.0
+            try:
+                await asyncio.wait_for(disconnected.wait(), interval)
+            except asyncio.TimeoutError:
+                idle += interval
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+
+
+ASYNC_ROUTES = {
+    '/api/documents': get_documents,
+    '/api/documents/search': search_documents,
+    '/api/documents/changes': get_changes,
+    '/api/documents/changes/stream': stream_changes,
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    handler = ASYNC_ROUTES.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'GET' else None
+    if handler is None:
+        return await wsgi_app(scope, receive, send)
+    await handler(Request(scope, receive), send)
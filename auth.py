@@ -1,14 +1,84 @@
-from flask import Blueprint, request, redirect, render_template, session, url_for, flash
+from functools import lru_cache
+
+import click
+from flask import Blueprint, current_app, request, redirect, render_template, session, url_for, flash
+from sqlalchemy import select
 from werkzeug.security import generate_password_hash, check_password_hash
+
+from cache import LRUCache
 from extensions import db
 
-auth_bp = Blueprint('auth', __name__)
+auth_bp = Blueprint('auth', __name__, cli_group=None)
+
+REVOKED = -1
+
 
 # Modèle utilisateur
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    # unique=True already gives the login lookup its index
     username = db.Column(db.String(100), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
+    # Stored in the session at login; bumping it logs the user out everywhere
+    session_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
+@auth_bp.record_once
+def _init_session_cache(state):
+    state.app.extensions['auth_sessions'] = LRUCache(
+        state.app.config.get('AUTH_CACHE_SIZE', 10000), state.app.config.get('AUTH_CACHE_TTL', 60)
+    )
+
+
+# ------------------------
+# Passwords
+# ------------------------
+@lru_cache(maxsize=None)
+def _hash_prefix(method):
+    # Werkzeug spells out default parameters in the hash ('scrypt' -> 'scrypt:32768:8:1')
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt'))
+
+
+def needs_rehash(password_hash):
+    """True when the hash was made with other parameters than PASSWORD_HASH_METHOD."""
+    method = current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+    return password_hash.split('$', 1)[0] != _hash_prefix(method)
+
+
+# ------------------------
+# Sessions
+# ------------------------
+def is_logged_in():
+    """True if the session belongs to an existing user whose sessions were not revoked.
+
+    Each user's session_version is cached per process for AUTH_CACHE_TTL
+    seconds, so most requests are checked without a query. A revocation made
+    by another worker is seen once its cache entry expires.
+    """
+    user_id = session.get('user_id')
+    if user_id is None:
+        return False
+    sessions = current_app.extensions['auth_sessions']
+    version = sessions.get(user_id)
+    if version is None:
+        version = db.session.execute(select(User.session_version).where(User.id == user_id)).scalar()
+        version = REVOKED if version is None else version
+        sessions.set(user_id, version)
+    if version != session.get('session_version', 0):
+        session.pop('user_id', None)
+        return False
+    return True
+
+
+def revoke_sessions(user):
+    """Log ``user`` out of every session and device."""
+    user.session_version += 1
+    db.session.commit()
+    current_app.extensions['auth_sessions'].delete(user.id)
 
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
@@ -25,8 +95,7 @@ def register():
             flash('Nom d’utilisateur déjà pris.', 'error')
             return redirect(url_for('auth.register'))
 
-        hashed_password = generate_password_hash(password)
-        new_user = User(username=username, password=hashed_password)
+        new_user = User(username=username, password=hash_password(password))
         db.session.add(new_user)
         db.session.commit()
         flash('Compte créé avec succès. Vous pouvez maintenant vous connecter.', 'success')
@@ -47,9 +116,15 @@ def login():
             flash('Nom d’utilisateur ou mot de passe incorrect.', 'error')
             return redirect(url_for('auth.login'))
 
+        if needs_rehash(user.password):
+            # The password is at hand only now: move the hash to the current parameters
+            user.password = hash_password(password)
+            db.session.commit()
+
         session['user_id'] = user.id
+        session['session_version'] = user.session_version
         flash('Connexion réussie.', 'success')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('documents.dashboard'))
 
     return render_template('login.html')
 
@@ -57,5 +132,17 @@ def login():
 @auth_bp.route('/logout')
 def logout():
     session.pop('user_id', None)
+    session.pop('session_version', None)
     flash('Vous avez été déconnecté.', 'success')
     return redirect(url_for('auth.login'))
+
+
+@auth_bp.cli.command('revoke-sessions')
+@click.argument('username')
+def revoke_sessions_command(username):
+    """Déconnecte un utilisateur de toutes ses sessions."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'Utilisateur inconnu: {username}')
+    revoke_sessions(user)
+    click.echo(f'Sessions de {username} révoquées.')
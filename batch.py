@@ -0,0 +1,184 @@
+from flask import Blueprint, request, jsonify, redirect, url_for
+from sqlalchemy import delete, func, insert, select, update
+
+from auth import is_logged_in
+from database import retry_on_busy
+from extensions import db
+from jobs import job_accepted, submit_job, task
+from models import Document, DocumentState, DocumentSubState, clean_state, insert_states, sub_state_rows
+
+batch_bp = Blueprint('batch', __name__)
+
+MAX_OPERATIONS = 5000
+DELETE_CHUNK_SIZE = 1000
+
+
+def _is_id(value):
+    # JSON true/false decode to bool, which isinstance(..., int) would let through as 1/0
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _validate(operations, document_id=None):
+    """Check every operation up front; return (cleaned operations, per-operation errors)."""
+    cleaned = []
+    errors = []
+
+    operations = [op if isinstance(op, dict) else {} for op in operations]
+    state_ids = {op.get('id') for op in operations
+                 if op.get('op') in ('update', 'delete') and _is_id(op.get('id'))}
+    states = dict(db.session.execute(
+        select(DocumentState.id, DocumentState.document_id).where(DocumentState.id.in_(state_ids))
+    ).all()) if state_ids else {}
+
+    document_ids = {document_id} if document_id is not None else {
+        op.get('document_id') for op in operations
+        if op.get('op') == 'add' and _is_id(op.get('document_id'))
+    }
+    documents = set(db.session.execute(
+        select(Document.id).where(Document.id.in_(document_ids))
+    ).scalars()) if document_ids else set()
+
+    for index, op in enumerate(operations):
+        try:
+            kind = op.get('op')
+            if kind == 'add':
+                target = document_id if document_id is not None else op.get('document_id')
+                if not _is_id(target) or target not in documents:
+                    raise ValueError(f'document introuvable: {target}')
+                values = clean_state(op.get('state_type'), op.get('quantity'), op.get('sub_state'))
+                cleaned.append(('add', dict(values, document_id=target)))
+            elif kind in ('update', 'delete'):
+                state_id = op.get('id')
+                if (not _is_id(state_id) or state_id not in states
+                        or (document_id is not None and states[state_id] != document_id)):
+                    raise ValueError(f'état introuvable: {state_id}')
+                if kind == 'delete':
+                    cleaned.append(('delete', {'id': state_id}))
+                else:
+                    values = clean_state(op.get('state_type'), op.get('quantity'), op.get('sub_state'))
+                    cleaned.append(('update', dict(values, id=state_id)))
+            else:
+                raise ValueError(f'type d\'opération inconnu: {kind}')
+        except ValueError as exc:
+            errors.append({'index': index, 'success': False, 'message': str(exc)})
+    return cleaned, errors
+
+
+def apply_operations(operations, document_id=None):
+    """Validate and apply add/update/delete state operations in a single transaction.
+
+    Returns (status code, per-operation results). Nothing is written unless every
+    operation is valid. Each kind is sent as one bulk statement.
+    """
+    if not isinstance(operations, list) or not operations:
+        return 400, [{'success': False, 'message': 'Aucune opération fournie'}]
+    if len(operations) > MAX_OPERATIONS:
+        return 400, [{'success': False, 'message': f'Au plus {MAX_OPERATIONS} opérations par requête'}]
+
+    cleaned, errors = _validate(operations, document_id)
+    if errors:
+        return 400, errors
+
+    adds = [values for kind, values in cleaned if kind == 'add']
+    updates = [values for kind, values in cleaned if kind == 'update']
+    deletes = [values['id'] for kind, values in cleaned if kind == 'delete']
+
+    new_ids = iter(insert_states(adds, return_ids=True) if adds else [])
+    if updates:
+        db.session.execute(update(DocumentState), [
+            {name: value for name, value in values.items() if name != 'sub_state'} for values in updates
+        ])
+        # Sub-states of updated states are replaced wholesale
+        updated_ids = [values['id'] for values in updates]
+        db.session.execute(delete(DocumentSubState).where(DocumentSubState.state_id.in_(updated_ids)))
+        sub_states = [sub for values in updates for sub in sub_state_rows(values['id'], values['sub_state'])]
+        if sub_states:
+            db.session.execute(insert(DocumentSubState), sub_states)
+    if deletes:
+        db.session.execute(delete(DocumentState).where(DocumentState.id.in_(deletes)))
+    db.session.commit()
+
+    results = []
+    for index, (kind, values) in enumerate(cleaned):
+        state_id = next(new_ids) if kind == 'add' else values['id']
+        results.append({'index': index, 'op': kind, 'id': state_id, 'success': True})
+    return 200, results
+
+
+def delete_criteria(ids=None, carton=None):
+    if ids is not None:
+        return [Document.id.in_(ids)]
+    return [Document.numero_carton == carton]
+
+
+def delete_documents(criteria, chunk_size=DELETE_CHUNK_SIZE, progress=None):
+    """Delete the matching documents with their states, one committed chunk at a time; return the count.
+
+    Each chunk is three set-based DELETEs instead of the ORM cascade, which
+    loads every state before deleting it row by row.
+    """
+    deleted = 0
+    while True:
+        ids = db.session.scalars(
+            select(Document.id).where(*criteria).order_by(Document.id).limit(chunk_size)
+        ).all()
+        if not ids:
+            return deleted
+        states = select(DocumentState.id).where(DocumentState.document_id.in_(ids))
+        for statement in (
+            delete(DocumentSubState).where(DocumentSubState.state_id.in_(states)),
+            delete(DocumentState).where(DocumentState.document_id.in_(ids)),
+            delete(Document).where(Document.id.in_(ids)),
+        ):
+            db.session.execute(statement.execution_options(synchronize_session=False))
+        db.session.commit()
+        deleted += len(ids)
+        if progress:
+            progress(deleted)
+
+
+@task('delete')
+def delete_job(job, ids=None, carton=None):
+    return {'deleted': delete_documents(delete_criteria(ids, carton), progress=job.progress)}
+
+
+@batch_bp.route('/api/documents/<int:doc_id>/states:batch', methods=['POST'])
+@retry_on_busy
+def document_states_batch(doc_id):
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    Document.query.get_or_404(doc_id)
+    status, results = apply_operations((request.get_json(silent=True) or {}).get('operations'), doc_id)
+    return jsonify({'success': status == 200, 'results': results}), status
+
+
+@batch_bp.route('/api/states:batch', methods=['POST'])
+@retry_on_busy
+def states_batch():
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    status, results = apply_operations((request.get_json(silent=True) or {}).get('operations'))
+    return jsonify({'success': status == 200, 'results': results}), status
+
+
+@batch_bp.route('/api/documents:delete', methods=['POST'])
+def mass_delete():
+    """Queue the deletion of a list of documents ({"ids": [...]}) or of a whole carton ({"carton": "..."})."""
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    data = request.get_json(silent=True) or {}
+    ids, carton = data.get('ids'), data.get('carton')
+    if ids is not None:
+        if not isinstance(ids, list) or not all(_is_id(value) for value in ids):
+            return jsonify({'success': False, 'message': 'ids doit être une liste d\'identifiants'}), 400
+        params = {'ids': ids}
+    elif isinstance(carton, str) and carton.strip():
+        params = {'carton': carton.strip()}
+    else:
+        return jsonify({'success': False, 'message': 'Précisez ids ou carton'}), 400
+
+    total = db.session.scalar(select(func.count()).select_from(Document).where(*delete_criteria(**params)))
+    return job_accepted(submit_job('delete', params, total=total))
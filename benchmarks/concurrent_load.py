@@ -0,0 +1,152 @@
+"""Concurrent read/write load against a throwaway SQLite database.
+
+Readers hit /dashboard and /api/documents while writers post /add and /edit,
+all through Flask test clients on separate threads. Run it once with the
+default tuning and once with --baseline (rollback journal, no retries) to
+compare throughput and "database is locked" failures:
+
+    python benchmarks/concurrent_load.py --seconds 10
+    python benchmarks/concurrent_load.py --seconds 10 --baseline
+
+Every client logs in (scrypt, slow on purpose) before the clock starts, and
+throughput is divided by the time actually measured, from the common start
+to the last request to finish.
+
+--baseline only changes the SQLite and pool settings: it still runs the
+current application code, indexes and queries. It isolates the effect of
+the connection tuning, not the whole difference with older releases; for
+that, run the same load against a checkout of the older commit.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--documents', type=int, default=2000, help='Dossiers created before the run.')
+    parser.add_argument('--baseline', action='store_true', help='Default SQLite settings, no write retries.')
+    return parser.parse_args()
+
+
+def configure(args, path):
+    # Must happen before create_app(): that is when the config is read from the environment
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+    if args.baseline:
+        os.environ.update(SQLITE_JOURNAL_MODE='DELETE', SQLITE_SYNCHRONOUS='FULL', SQLITE_CACHE_SIZE='-2000',
+                          SQLITE_MMAP_SIZE='0', DB_WRITE_RETRIES='0', DB_POOL_SIZE='5')
+
+
+def seed(app, db, count):
+    from auth import User
+    from models import Document, insert_states
+    from werkzeug.security import generate_password_hash
+
+    with app.app_context():
+        db.session.add(User(username='bench', password=generate_password_hash('bench')))
+        db.session.execute(db.insert(Document), [
+            {'numero_dossier': f'B{i:07d}', 'numero_carton': f'C{i // 40:05d}', 'modele': f'M{i % 25}'}
+            for i in range(count)
+        ])
+        insert_states([{'document_id': i + 1, 'state_type': 'REP', 'quantity': 1} for i in range(count)])
+        db.session.commit()
+
+
+def worker(app, kind, index, barrier, window, results, lock):
+    client = app.test_client()
+    client.post('/login', data={'username': 'bench', 'password': 'bench'})
+    # The barrier's action sets the window once every client is logged in
+    barrier.wait()
+    done, failed, counter = 0, 0, 0
+    while time.perf_counter() < window['deadline']:
+        counter += 1
+        try:
+            if kind == 'read':
+                path = '/dashboard?page=%d' % (counter % 50 + 1) if counter % 2 else '/api/documents?limit=100'
+                response = client.get(path)
+            elif counter % 2:
+                response = client.post('/add', data={
+                    'numero_dossier': f'W{index}-{counter}', 'numero_carton': f'CW{index}', 'modele': 'MW',
+                    'etats': ['REP', 'BRK'], 'quantities': ['1', '2'], 'sub_states_1': ['KC'],
+                })
+            else:
+                response = client.post(f'/edit/{counter % 500 + 1}', data={
+                    'numero_dossier': f'B{counter % 500:07d}', 'numero_carton': 'CE', 'modele': 'ME',
+                    'etats': ['HS'], 'quantities': [str(counter % 7 + 1)],
+                })
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        done += ok
+        failed += not ok
+    finished = time.perf_counter()
+    with lock:
+        results[kind]['ok'] += done
+        results[kind]['failed'] += failed
+        window['end'] = max(window.get('end', finished), finished)
+
+
+def main():
+    args = parse_args()
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    configure(args, path)
+    sys.path.insert(0, ROOT)
+
+    import logging
+    logging.getLogger('app').setLevel(logging.ERROR)
+    from app import create_app, init_database
+    from extensions import db
+
+    app = create_app()
+
+    with app.app_context():
+        init_database()
+    seed(app, db, args.documents)
+
+    results = {'read': {'ok': 0, 'failed': 0}, 'write': {'ok': 0, 'failed': 0}}
+    lock = threading.Lock()
+    window = {}
+
+    def start_clock():
+        window['start'] = time.perf_counter()
+        window['deadline'] = window['start'] + args.seconds
+
+    barrier = threading.Barrier(args.readers + args.writers, action=start_clock)
+    threads = [threading.Thread(target=worker, args=(app, 'read', i, barrier, window, results, lock))
+               for i in range(args.readers)]
+    threads += [threading.Thread(target=worker, args=(app, 'write', i, barrier, window, results, lock))
+                for i in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = window['end'] - window['start']
+    report = {
+        'mode': 'baseline' if args.baseline else 'tuned',
+        'seconds': round(elapsed, 2),
+        'readers': args.readers,
+        'writers': args.writers,
+        'reads_per_second': round(results['read']['ok'] / elapsed, 1),
+        'writes_per_second': round(results['write']['ok'] / elapsed, 1),
+        'failed_reads': results['read']['failed'],
+        'failed_writes': results['write']['failed'],
+    }
+    print(json.dumps(report, indent=2))
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
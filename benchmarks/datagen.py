@@ -0,0 +1,134 @@
+"""Seeded synthetic data: users, dossiers and states with realistic distributions.
+
+The same seed and size always give the same database, so figures measured on
+it can be compared across commits:
+
+    python benchmarks/datagen.py bench.db --documents 100000 --seed 42
+
+Distributions:
+- cartons hold 1 to 120 dossiers, most around 40 (triangular);
+- modeles follow a Zipf law over MODELES models, a few models dominate;
+- a dossier has 0 to 4 states (mostly 1 or 2), typed after STATE_WEIGHTS;
+- quantities are geometric: mostly 1, rarely above 5;
+- BRK states carry no sub-state, KC, Ill or both after SUB_STATE_WEIGHTS.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import insert  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+MODELES = 200
+STATE_COUNT_WEIGHTS = [0.08, 0.5, 0.27, 0.1, 0.05]
+STATE_WEIGHTS = {'REP': 0.4, 'HS': 0.25, 'SWA': 0.2, 'BRK': 0.15}
+SUB_STATE_WEIGHTS = {None: 0.3, 'KC': 0.35, 'Ill': 0.25, 'KC,Ill': 0.1}
+CHUNK_SIZE = 10000
+PASSWORD = 'bench'
+
+
+def carton_sizes(rng):
+    while True:
+        yield max(1, round(rng.triangular(1, 120, 40)))
+
+
+def quantity(rng):
+    value = 1
+    while value < 50 and rng.random() < 0.35:
+        value += 1
+    return value
+
+
+def generate(documents, seed=42):
+    """Yield (document row, [state rows]) for ``documents`` dossiers, ids starting at 1."""
+    rng = random.Random(seed)
+    modele_weights = [1 / rank ** 1.1 for rank in range(1, MODELES + 1)]
+    state_types, state_weights = list(STATE_WEIGHTS), list(STATE_WEIGHTS.values())
+    sub_states, sub_state_weights = list(SUB_STATE_WEIGHTS), list(SUB_STATE_WEIGHTS.values())
+
+    sizes = carton_sizes(rng)
+    carton, left = 0, 0
+    for document_id in range(1, documents + 1):
+        if not left:
+            carton, left = carton + 1, next(sizes)
+        left -= 1
+        modele = rng.choices(range(MODELES), modele_weights)[0]
+        document = {
+            'id': document_id,
+            'numero_dossier': f'DOS{document_id:08d}',
+            'numero_carton': f'CRT{carton:06d}',
+            'modele': f'MOD-{modele:03d}',
+        }
+        states = []
+        for _ in range(rng.choices(range(len(STATE_COUNT_WEIGHTS)), STATE_COUNT_WEIGHTS)[0]):
+            state_type = rng.choices(state_types, state_weights)[0]
+            states.append({
+                'document_id': document_id,
+                'state_type': state_type,
+                'quantity': quantity(rng),
+                'sub_state': rng.choices(sub_states, sub_state_weights)[0] if state_type == 'BRK' else None,
+            })
+        yield document, states
+
+
+def populate(documents, seed=42, users=5, progress=None):
+    """Fill the current app's empty database. Needs an app context; returns the elapsed seconds."""
+    from auth import User
+    from extensions import db
+    from models import Document, insert_states
+
+    start = time.perf_counter()
+    # One hash for every user: scrypt is deliberately slow
+    password = generate_password_hash(PASSWORD)
+    db.session.execute(insert(User), [{'username': f'user{i}', 'password': password} for i in range(users)])
+
+    document_rows, state_rows = [], []
+
+    def flush():
+        db.session.execute(insert(Document), document_rows)
+        if state_rows:
+            insert_states(state_rows)
+        db.session.commit()
+        document_rows.clear()
+        state_rows.clear()
+
+    for count, (document, states) in enumerate(generate(documents, seed), start=1):
+        document_rows.append(document)
+        state_rows.extend(states)
+        if len(document_rows) >= CHUNK_SIZE:
+            flush()
+            if progress:
+                progress(count)
+    if document_rows:
+        flush()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('database', help='SQLite file to create.')
+    parser.add_argument('--documents', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users', type=int, default=5)
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        sys.exit(f'{args.database} existe déjà.')
+
+    from app import create_app, init_database
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(args.database)})
+    with app.app_context():
+        init_database()
+        elapsed = populate(args.documents, args.seed, args.users,
+                          progress=lambda count: print(f'{count} dossiers', file=sys.stderr))
+    print(f'{args.documents} dossiers générés en {elapsed:.1f} s dans {args.database}')
+
+
+if __name__ == '__main__':
+    main()
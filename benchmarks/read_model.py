@@ -0,0 +1,170 @@
+"""Memory and latency of the in-memory read model against the ORM and SQL paths.
+
+Builds (or reuses, see --data-dir) the seeded database of run.py, about 1M
+states for the default 650k dossiers, loads the read model once and times the
+same questions answered three ways:
+
+- orm: DocumentState objects loaded and counted in Python, what the pages did
+  before the aggregate tables (state totals only, skip it with --no-orm);
+- sql: the grouped queries the app runs without the read model;
+- model: the NumPy columns of readmodel.py.
+
+    python benchmarks/read_model.py --documents 650000 --output read_model.json
+
+Memory is the tracemalloc growth of loading each representation and kept
+alive: ORM objects in the session identity map, or the model's columns.
+Needs numpy.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from importlib import metadata
+
+from werkzeug.datastructures import MultiDict
+
+from run import base_database, git_commit
+
+FILTERS = {
+    'all': {},
+    'brk_kc': {'state_type': ['BRK'], 'sub_state': ['KC']},
+    'hs_quantity': {'state_type': ['HS'], 'quantity_min': ['3']},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=650000, help='Dossiers (about 1.5 states each).')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per question and path.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'electrodoc-bench'))
+    parser.add_argument('--no-orm', action='store_true', help='Skip loading every state as an ORM object.')
+    parser.add_argument('--output', help='Write the JSON report here.')
+    return parser.parse_args()
+
+
+def timed(run, repeat):
+    run()  # warm-up
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {'p50_ms': round(statistics.median(latencies), 2), 'max_ms': round(max(latencies), 2)}
+
+
+def allocated(load):
+    """(result, seconds, bytes still allocated by it) of calling ``load`` under tracemalloc."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - start
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, round(elapsed, 2), after - before
+
+
+def main():
+    args = parse_args()
+    from sqlalchemy import func, select
+
+    from app import create_app
+    from cartons import carton_state_totals
+    from extensions import db
+    from filters import FACET_LIMIT, facet_counts, filter_criteria, filter_params
+    from models import Document, DocumentState
+    from readmodel import ReadModel
+
+    path = base_database(args.data_dir, args.documents, args.seed)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path, 'JOB_WORKERS': 0, 'CACHE_TTL': 0,
+                      'SLOW_QUERY_MS': float('inf'), 'QUERY_COUNT_WARNING': float('inf')})
+    report = {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlalchemy': metadata.version('sqlalchemy'),
+        'numpy': metadata.version('numpy'),
+        'documents': args.documents,
+        'seed': args.seed,
+        'memory_kb': {},
+        'load_s': {},
+        'results': {},
+    }
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        report['states'] = db.session.scalar(select(func.count()).select_from(DocumentState))
+        print(f"{report['states']} états", file=sys.stderr)
+
+        # Timed without tracemalloc, which slows allocations down several times
+        start = time.perf_counter()
+        columns = ReadModel().current()
+        report['load_s']['model'] = round(time.perf_counter() - start, 2)
+        report['memory_kb']['model_arrays'] = round(columns.nbytes / 1024)
+        del columns
+        columns, _, size = allocated(lambda: ReadModel().current())
+        report['memory_kb']['model'] = round(size / 1024)
+
+        results = report['results']
+        dialect = db.engine.dialect.name
+        for name, args_filter in FILTERS.items():
+            params = filter_params(MultiDict(args_filter))
+            criteria = filter_criteria(params, dialect)
+            results[f'facets_{name}'] = {
+                'sql': timed(lambda: facet_counts(criteria), args.repeat),
+                'model': timed(lambda: columns.facet_counts(columns.match(params), FACET_LIMIT), args.repeat),
+            }
+            after = rng.randint(0, args.documents)
+            results[f'id_scan_{name}'] = {
+                'sql': timed(lambda: db.session.scalars(
+                    select(Document.id).where(*criteria, Document.id > after).order_by(Document.id).limit(100)
+                ).all(), args.repeat),
+                'model': timed(lambda: columns.ids_after(params, after, 100), args.repeat),
+            }
+
+        cartons = db.session.scalars(select(Document.numero_carton).distinct().limit(20)).all()
+        results['carton_totals'] = {
+            'sql': timed(lambda: carton_state_totals(cartons), args.repeat),
+            'model': timed(lambda: columns.carton_state_totals(cartons), args.repeat),
+        }
+        results['state_totals'] = {
+            'sql': timed(lambda: db.session.execute(
+                select(DocumentState.state_type, func.count(), func.sum(DocumentState.quantity))
+                .group_by(DocumentState.state_type)
+            ).all(), args.repeat),
+            'model': timed(columns.state_totals, args.repeat),
+        }
+
+        if not args.no_orm:
+            start = time.perf_counter()
+            states = db.session.scalars(select(DocumentState)).all()
+            Counter(state.state_type for state in states)
+            report['load_s']['orm'] = round(time.perf_counter() - start, 2)
+            results['state_totals']['orm'] = {'p50_ms': round((time.perf_counter() - start) * 1000, 2)}
+            del states
+            db.session.expunge_all()
+            _, _, size = allocated(lambda: db.session.scalars(select(DocumentState)).all())
+            report['memory_kb']['orm'] = round(size / 1024)
+            db.session.expunge_all()
+        db.engine.dispose()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
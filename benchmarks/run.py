@@ -0,0 +1,245 @@
+"""Latency, query count and memory of the main routes on synthetic databases.
+
+Generates (or reuses, see --data-dir) one seeded database per size, then drives
+dashboard, get_documents, stats, add_document and edit_document through the
+Flask test client on a fresh copy of it. Writes a JSON report that a later
+run can be compared against:
+
+    python benchmarks/run.py --sizes 10k,100k --output before.json
+    python benchmarks/run.py --sizes 10k,100k --output after.json --compare before.json
+
+Query counts come from the Server-Timing header. Peak memory is the
+tracemalloc peak of a separate, shorter pass so it does not skew latencies.
+The response cache is off unless --cache is given.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from importlib import metadata
+
+from datagen import PASSWORD, populate
+from sqlalchemy import text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = {'10k': 10000, '100k': 100000, '1m': 1000000}
+SCENARIOS = ['dashboard', 'dashboard_search', 'get_documents', 'stats', 'add_document', 'edit_document']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10k', help='Comma-separated sizes among ' + ', '.join(SIZES) + '.')
+    parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario.')
+    parser.add_argument('--memory-requests', type=int, default=20, help='Requests of the memory pass.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'electrodoc-bench'),
+                        help='Where generated databases are kept between runs.')
+    parser.add_argument('--cache', action='store_true', help='Keep the response cache on.')
+    parser.add_argument('--output', help='Write the JSON report here.')
+    parser.add_argument('--compare', help='Earlier JSON report to compare against.')
+    return parser.parse_args()
+
+
+# ------------------------
+# Scenarios
+# ------------------------
+class Scenarios:
+    """One method per scenario, each issuing a single request."""
+
+    def __init__(self, client, documents, seed):
+        self.client = client
+        self.documents = documents
+        self.rng = random.Random(seed)
+        self.added = 0
+
+    def dashboard(self):
+        return self.client.get(f'/dashboard?page={self.rng.randint(1, 50)}')
+
+    def dashboard_search(self):
+        carton = self.rng.randint(1, max(1, self.documents // 40))
+        return self.client.get(f'/dashboard?search=CRT{carton:06d}')
+
+    def get_documents(self):
+        return self.client.get(f'/api/documents?limit=100&after={self.rng.randint(0, self.documents)}')
+
+    def stats(self):
+        return self.client.get('/stats')
+
+    def add_document(self):
+        self.added += 1
+        return self.client.post('/add', data={
+            'numero_dossier': f'BENCH{self.added:08d}', 'numero_carton': 'CRT-BENCH', 'modele': 'MOD-BENCH',
+            'etats': ['REP', 'BRK'], 'quantities': ['1', '2'], 'sub_states_1': ['KC'],
+        })
+
+    def edit_document(self):
+        document_id = self.rng.randint(1, self.documents)
+        return self.client.post(f'/edit/{document_id}', data={
+            'numero_dossier': f'DOS{document_id:08d}', 'numero_carton': 'CRT-EDIT', 'modele': 'MOD-EDIT',
+            'etats': ['HS', 'BRK'], 'quantities': [str(self.rng.randint(1, 5)), '1'], 'sub_states_1': ['Ill'],
+        })
+
+
+def query_count(response):
+    # Server-Timing: db;desc="4 SQL";dur=...
+    for metric in response.headers.get('Server-Timing', '').split(','):
+        if metric.strip().startswith('db;desc="'):
+            return int(metric.split('"')[1].split()[0])
+    return None
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(scenarios, name, requests, memory_requests):
+    run = getattr(scenarios, name)
+    run()  # warm-up: template compilation, statement caches
+    latencies, queries, errors = [], [], 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = run()
+        latencies.append((time.perf_counter() - start) * 1000)
+        errors += response.status_code >= 400
+        if query_count(response) is not None:
+            queries.append(query_count(response))
+
+    tracemalloc.start()
+    for _ in range(memory_requests):
+        run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p90_ms': round(percentile(latencies, 0.9), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(max(latencies), 2),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'queries_mean': round(statistics.fmean(queries), 2) if queries else None,
+        'queries_max': max(queries) if queries else None,
+        'peak_memory_kb': round(peak / 1024),
+    }
+
+
+# ------------------------
+# Databases
+# ------------------------
+def base_database(data_dir, documents, seed):
+    """Path of the generated database for this size and seed, creating it if needed."""
+    from app import create_app, init_database
+
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'bench-{documents}-{seed}.db')
+    if not os.path.exists(path):
+        partial = path + '.tmp'
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(partial + suffix):
+                os.remove(partial + suffix)
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + partial})
+        with app.app_context():
+            init_database()
+            elapsed = populate(documents, seed, progress=lambda count: print(f'  {count} dossiers', file=sys.stderr))
+            # Fold the WAL back so a single file can be copied
+            from extensions import db
+            db.session.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+            db.engine.dispose()
+        print(f'  généré en {elapsed:.1f} s', file=sys.stderr)
+        os.replace(partial, path)
+    return path
+
+
+def run_size(args, documents):
+    from app import create_app, init_database
+
+    source = base_database(args.data_dir, documents, args.seed)
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'bench.db')
+    shutil.copy(source, path)
+    try:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path,
+            'CACHE_TTL': 30 if args.cache else 0,
+            'SLOW_QUERY_MS': float('inf'),
+            'QUERY_COUNT_WARNING': float('inf'),
+        })
+        with app.app_context():
+            init_database()
+        client = app.test_client()
+        client.post('/login', data={'username': 'user0', 'password': PASSWORD})
+        scenarios = Scenarios(client, documents, args.seed)
+        results = {}
+        for name in args.scenarios.split(','):
+            print(f'  {name}', file=sys.stderr)
+            results[name] = measure(scenarios, name, args.requests, args.memory_requests)
+        with app.app_context():
+            from extensions import db
+            db.engine.dispose()
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    print(f"\n{'taille':<6} {'scénario':<18} {'p50 avant':>10} {'p50 après':>10} {'p95 avant':>10} "
+          f"{'p95 après':>10} {'SQL avant':>10} {'SQL après':>10}")
+    for size, results in report['results'].items():
+        for name, result in results.items():
+            before = baseline.get('results', {}).get(size, {}).get(name)
+            if not before:
+                continue
+            print(f"{size:<6} {name:<18} {before['p50_ms']:>10} {result['p50_ms']:>10} {before['p95_ms']:>10} "
+                  f"{result['p95_ms']:>10} {str(before['queries_mean']):>10} {str(result['queries_mean']):>10}")
+
+
+def main():
+    args = parse_args()
+    report = {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'flask': metadata.version('flask'),
+        'sqlalchemy': metadata.version('sqlalchemy'),
+        'seed': args.seed,
+        'requests': args.requests,
+        'cache': args.cache,
+        'results': {},
+    }
+    for size in args.sizes.split(','):
+        print(f'{size}:', file=sys.stderr)
+        report['results'][size] = run_size(args, SIZES[size.lower()])
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
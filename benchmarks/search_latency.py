@@ -0,0 +1,138 @@
+"""Search latency through the trigram index against the LIKE scan it replaced.
+
+Builds (or reuses, see --data-dir) the seeded database of run.py, 1M dossiers
+by default, and runs the same random searches three ways:
+
+- like: the former filter, LIKE '%term%' on dossier, carton and modele;
+- ranked: /api/documents/search and the dashboard (apply_search ranked);
+- filter: /api/documents, the index as a filter in id order.
+
+Terms are prefixes of random dossier and carton numbers, between 5 and 11
+characters. Results are also split by length: ``short`` prefixes (under
+SHORT_TERM characters, e.g. DOS00) match a large share of the table and are
+listed in id order by the ranked path, ``long`` ones are ranked by bm25.
+
+    python benchmarks/search_latency.py --documents 1000000 --output search.json
+
+Latencies are from the query to the loaded Document objects, --limit of them.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sqlite3
+import sys
+import tempfile
+import time
+from importlib import metadata
+
+from run import base_database, git_commit, percentile
+
+# search.RANKED_MIN_LENGTH
+SHORT_TERM = 7
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=100, help='Random search terms per path.')
+    parser.add_argument('--limit', type=int, default=20, help='Results per search.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'electrodoc-bench'))
+    parser.add_argument('--output', help='Write the JSON report here.')
+    return parser.parse_args()
+
+
+def search_terms(documents, count, seed):
+    rng = random.Random(seed)
+    terms = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            number = f'DOS{rng.randint(1, documents):08d}'
+        else:
+            number = f'CRT{rng.randint(1, max(1, documents // 40)):06d}'
+        terms.append(number[:rng.randint(5, len(number))])
+    return terms
+
+
+def summary(values):
+    return {
+        'p50_ms': round(statistics.median(values), 2),
+        'p95_ms': round(percentile(values, 0.95), 2),
+        'max_ms': round(max(values), 2),
+    }
+
+
+def latencies(run, terms):
+    run(terms[0])  # warm-up
+    timings = []
+    for term in terms:
+        start = time.perf_counter()
+        run(term)
+        timings.append((len(term) < SHORT_TERM, (time.perf_counter() - start) * 1000))
+    result = summary([elapsed for _, elapsed in timings])
+    for group, short in (('short', True), ('long', False)):
+        values = [elapsed for is_short, elapsed in timings if is_short == short]
+        if values:
+            result[group] = dict(summary(values), terms=len(values))
+    return result
+
+
+def main():
+    args = parse_args()
+    from sqlalchemy import or_, select
+
+    from app import create_app
+    from extensions import db
+    from models import Document
+    from search import SEARCH_COLUMNS, apply_search, search_criterion
+
+    path = base_database(args.data_dir, args.documents, args.seed)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path, 'JOB_WORKERS': 0, 'CACHE_TTL': 0,
+                      'SLOW_QUERY_MS': float('inf'), 'QUERY_COUNT_WARNING': float('inf')})
+    terms = search_terms(args.documents, args.queries, args.seed)
+
+    def like(term):
+        return db.session.scalars(select(Document).where(
+            or_(*(getattr(Document, name).contains(term) for name in SEARCH_COLUMNS))
+        ).limit(args.limit)).all()
+
+    def ranked(term):
+        return db.session.scalars(apply_search(select(Document), term, ranked=True).limit(args.limit)).all()
+
+    def filtered(term):
+        return db.session.scalars(
+            select(Document).where(search_criterion(term, 'sqlite')).order_by(Document.id).limit(args.limit)
+        ).all()
+
+    report = {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'sqlalchemy': metadata.version('sqlalchemy'),
+        'documents': args.documents,
+        'queries': args.queries,
+        'limit': args.limit,
+        'seed': args.seed,
+        'results': {},
+    }
+    with app.app_context():
+        for name, run in (('like', like), ('ranked', ranked), ('filter', filtered)):
+            print(f'  {name}', file=sys.stderr)
+            report['results'][name] = latencies(run, terms)
+            db.session.expunge_all()
+        db.engine.dispose()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Encode time and bytes on the wire of /api/documents per 10k dossiers.
+
+Builds (or reuses, see --data-dir) the seeded database of run.py and encodes
+the first --count dossiers as the listing does, each path timed from the
+queries to the finished JSON array:
+
+- orm: Document objects with their states, to_dict() and the Flask JSON
+  provider, what the listing did before the row path;
+- rows: plain rows grouped into dicts, stdlib compact encoder;
+- rows_orjson: the same dicts through orjson (skipped if not installed);
+- projection: ``fields=numero_carton,states.state_type`` on the row path.
+
+Each body is then compressed with gzip and brotli (if installed) at the
+levels of compression.py, and their size and time are reported too.
+
+    python benchmarks/serialization.py --documents 10000 --output serialization.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from importlib import metadata
+
+from run import base_database, git_commit
+
+PROJECTION = 'numero_carton,states.state_type'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=10000, help='Dossiers in the database.')
+    parser.add_argument('--count', type=int, default=10000, help='Dossiers encoded per run.')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per path.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'electrodoc-bench'))
+    parser.add_argument('--output', help='Write the JSON report here.')
+    return parser.parse_args()
+
+
+def timed(run, repeat):
+    """(last result, median milliseconds) of ``repeat`` calls after a warm-up."""
+    result = run()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return result, round(statistics.median(latencies), 1)
+
+
+def main():
+    args = parse_args()
+    import api
+    import compression
+    from api import close_list, encode_document, field_projection, iter_document_dicts, iter_documents
+    from app import create_app
+    from extensions import db
+
+    path = base_database(args.data_dir, args.documents, args.seed)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path, 'JOB_WORKERS': 0, 'CACHE_TTL': 0,
+                      'SLOW_QUERY_MS': float('inf'), 'QUERY_COUNT_WARNING': float('inf')})
+    mimetype = 'application/json'
+    per_10k = 10000 / args.count
+
+    def body(documents, dumps):
+        count = 0
+        pieces = []
+        for count, document in enumerate(documents, start=1):
+            pieces.append(encode_document(document, count - 1, mimetype, dumps))
+        pieces.append(close_list(count, mimetype))
+        return ''.join(pieces).encode()
+
+    def orm():
+        return body((doc.to_dict() for doc in iter_documents([], limit=args.count)), app.json.dumps)
+
+    def rows(fields, dumps):
+        return lambda: body(iter_document_dicts([], field_projection(fields), limit=args.count), dumps)
+
+    paths = {'orm': orm, 'rows': rows('', api._encoder.encode)}
+    if api.orjson is not None:
+        paths['rows_orjson'] = rows('', api.dumps_compact)
+    paths['projection'] = rows(PROJECTION, api.dumps_compact)
+
+    encodings = ['gzip'] + (['br'] if compression.brotli is not None else [])
+    report = {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlalchemy': metadata.version('sqlalchemy'),
+        'orjson': metadata.version('orjson') if api.orjson is not None else None,
+        'brotli': metadata.version('brotli') if compression.brotli is not None else None,
+        'documents': args.documents,
+        'count': args.count,
+        'seed': args.seed,
+        'results': {},
+    }
+    with app.app_context():
+        for name, run in paths.items():
+            print(f'  {name}', file=sys.stderr)
+            data, elapsed = timed(run, args.repeat)
+            db.session.expunge_all()
+            result = {'encode_ms_per_10k': round(elapsed * per_10k, 1), 'bytes_per_10k': round(len(data) * per_10k)}
+            for encoding in encodings:
+                compressed, elapsed = timed(lambda: compression.compress(data, encoding), args.repeat)
+                result[f'{encoding}_bytes_per_10k'] = round(len(compressed) * per_10k)
+                result[f'{encoding}_ms_per_10k'] = round(elapsed * per_10k, 1)
+            report['results'][name] = result
+        db.engine.dispose()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
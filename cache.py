@@ -0,0 +1,183 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from itertools import chain
+
+from flask import Response, request, session
+from sqlalchemy import event
+
+from extensions import RoutingSession
+
+# Rendered pages and API bodies keyed by a data version. Any commit touching
+# these tables bumps the version, so every earlier entry and ETag goes stale at
+# once; old entries simply age out of the LRU or expire.
+WATCHED_TABLES = {'documents', 'document_states', 'document_state_sub_states'}
+
+
+class LRUCache:
+    """In-process cache: least recently used entries are evicted, all expire after ``ttl`` seconds.
+
+    The data version is local too, so with several worker processes a write
+    only invalidates its own worker; the others serve entries up to ``ttl`` old.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Random epoch so ETags from a previous process never match
+        self._epoch = uuid.uuid4().hex[:8]
+        self._counter = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def version(self):
+        return f'{self._epoch}.{self._counter}'
+
+    def bump(self):
+        with self._lock:
+            self._counter += 1
+
+
+class RedisCache:
+    """Cache and data version shared by every worker through Redis."""
+
+    def __init__(self, url, ttl, prefix='electrodoc:cache:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_REDIS_URL nécessite le paquet redis.')
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def version(self):
+        return (self.client.get(self.prefix + 'version') or b'0').decode()
+
+    def bump(self):
+        self.client.incr(self.prefix + 'version')
+
+
+class ResponseCache:
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        """Pick the backend from CACHE_REDIS_URL / CACHE_TTL / CACHE_MAX_ENTRIES; a TTL of 0 disables caching."""
+        ttl = app.config.get('CACHE_TTL', 30)
+        if ttl <= 0:
+            self.backend = None
+        elif app.config.get('CACHE_REDIS_URL'):
+            self.backend = RedisCache(app.config['CACHE_REDIS_URL'], ttl)
+        else:
+            self.backend = LRUCache(app.config.get('CACHE_MAX_ENTRIES', 512), ttl)
+        app.extensions['response_cache'] = self
+
+    def _versioned(self, key):
+        return f'{self.backend.version()}:{key}'
+
+    def get(self, key):
+        return self.backend.get(self._versioned(key)) if self.backend else None
+
+    def set(self, key, value):
+        if self.backend:
+            self.backend.set(self._versioned(key), value)
+
+    def etag(self, key):
+        version = self.backend.version() if self.backend else uuid.uuid4().hex
+        return hashlib.sha1(f'{version}:{key}'.encode()).hexdigest()[:20]
+
+    def invalidate(self):
+        if self.backend:
+            self.backend.bump()
+
+    def page(self, render, key=None):
+        """Serve the cached HTML for this URL, or ``render()`` and cache it.
+
+        Pages about to show flashed messages are neither served from nor stored
+        in the cache, since the messages belong to one user.
+        """
+        if '_flashes' in session:
+            return render()
+        key = key or 'page:' + request.full_path
+        cached = self.get(key)
+        if cached is not None:
+            return cached['body']
+        body = render()
+        self.set(key, {'body': body})
+        return body
+
+
+response_cache = ResponseCache()
+
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+# ------------------------
+# Invalidation
+# ------------------------
+def _touches_watched_tables(objects):
+    return any(getattr(obj, '__tablename__', None) in WATCHED_TABLES for obj in objects)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _track_flush(session, flush_context):
+    # session.dirty also lists objects whose attributes were set to their current value
+    modified = (obj for obj in session.dirty if session.is_modified(obj))
+    if _touches_watched_tables(chain(session.new, modified, session.deleted)):
+        session.info['cache_stale'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _track_statement(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE statements never go through the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        if orm_execute_state.statement.table.name in WATCHED_TABLES:
+            orm_execute_state.session.info['cache_stale'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('cache_stale', False):
+        response_cache.invalidate()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('cache_stale', None)
@@ -0,0 +1,178 @@
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
+from sqlalchemy import and_, delete, exists, func, insert, literal, select, update
+
+from aggregates import StatAggregate
+from auth import is_logged_in
+from database import retry_on_busy
+from extensions import db
+from models import ALL_ETATS, Document, DocumentState, DocumentSubState, clean_state, documents_with_states, utcnow
+from readmodel import read_model
+
+cartons_bp = Blueprint('cartons', __name__)
+
+CARTONS_PER_PAGE = 20
+DOSSIERS_PER_PAGE = 20
+
+
+def paginate_cartons(page, per_page=CARTONS_PER_PAGE, prefix=''):
+    """Page through cartons using the per-carton rows of stat_aggregates (primary key order)."""
+    query = StatAggregate.query.filter(StatAggregate.dimension == 'carton', StatAggregate.count > 0)
+    if prefix:
+        query = query.filter(StatAggregate.key.startswith(prefix, autoescape=True))
+    return query.order_by(StatAggregate.key).paginate(page=page, per_page=per_page, error_out=False)
+
+
+def carton_state_totals(cartons):
+    """Return {carton: {state_type: quantity}} for the given cartons in one grouped query."""
+    model = read_model()
+    if model is not None:
+        return model.current().carton_state_totals(cartons)
+    totals = {carton: dict.fromkeys(ALL_ETATS, 0) for carton in cartons}
+    if not cartons:
+        return totals
+    rows = db.session.execute(
+        select(Document.numero_carton, DocumentState.state_type, func.sum(DocumentState.quantity))
+        .join(DocumentState, DocumentState.document_id == Document.id)
+        .where(Document.numero_carton.in_(cartons))
+        .group_by(Document.numero_carton, DocumentState.state_type)
+    ).all()
+    for carton, state_type, quantity in rows:
+        totals[carton][state_type] = quantity or 0
+    return totals
+
+
+def assign_state(numero_carton, values):
+    """Give every dossier of a carton the state ``values`` with set-based statements.
+
+    Dossiers that already have a state of that type get its quantity/sub-states
+    overwritten; the others get a new state. Returns (updated, inserted).
+    """
+    in_carton = select(Document.id).where(Document.numero_carton == numero_carton)
+    now = utcnow()
+    updated = db.session.execute(
+        update(DocumentState)
+        .where(DocumentState.state_type == values['state_type'], DocumentState.document_id.in_(in_carton))
+        .values(quantity=values['quantity'])
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    inserted = db.session.execute(
+        insert(DocumentState).from_select(
+            # Column defaults do not apply to INSERT ... SELECT
+            ['document_id', 'state_type', 'quantity', 'created_at', 'updated_at'],
+            select(Document.id, literal(values['state_type']), literal(values['quantity']), literal(now), literal(now))
+            .where(Document.numero_carton == numero_carton)
+            .where(~exists().where(and_(DocumentState.document_id == Document.id,
+                                        DocumentState.state_type == values['state_type'])))
+        )
+    ).rowcount
+
+    targets = select(DocumentState.id).where(
+        DocumentState.state_type == values['state_type'], DocumentState.document_id.in_(in_carton)
+    )
+    db.session.execute(delete(DocumentSubState).where(DocumentSubState.state_id.in_(targets)))
+    for sub_state in filter(None, (values['sub_state'] or '').split(',')):
+        db.session.execute(insert(DocumentSubState).from_select(
+            ['state_id', 'sub_state'], targets.add_columns(literal(sub_state))
+        ))
+    db.session.commit()
+    return updated, inserted
+
+
+# ------------------------
+# Pages
+# ------------------------
+@cartons_bp.route('/cartons')
+def list_cartons():
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    search = request.args.get('search', '').strip()
+    page = request.args.get('page', 1, type=int)
+    cartons = paginate_cartons(page, prefix=search)
+    totals = carton_state_totals([carton.key for carton in cartons.items])
+    return render_template('list_cartons.html', cartons=cartons, totals=totals, etats=ALL_ETATS, search=search)
+
+
+@cartons_bp.route('/cartons/<path:numero_carton>')
+def list_dossiers(numero_carton):
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    page = request.args.get('page', 1, type=int)
+    dossiers = documents_with_states().filter(Document.numero_carton == numero_carton) \
+        .order_by(Document.id).paginate(page=page, per_page=DOSSIERS_PER_PAGE, error_out=False)
+    if not dossiers.total:
+        flash('Carton introuvable.', 'error')
+        return redirect(url_for('cartons.list_cartons'))
+
+    totals = carton_state_totals([numero_carton])[numero_carton]
+    return render_template('list_dossiers.html', numero_carton=numero_carton, dossiers=dossiers,
+                           totals=totals, etats=ALL_ETATS)
+
+
+@cartons_bp.route('/cartons/<path:numero_carton>/assign', methods=['POST'])
+@retry_on_busy
+def assign_carton_state(numero_carton):
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    try:
+        values = clean_state(request.form.get('state_type'), request.form.get('quantity'),
+                             request.form.getlist('sub_states'))
+    except ValueError as exc:
+        flash(f'État invalide: {exc}', 'error')
+        return redirect(url_for('cartons.list_dossiers', numero_carton=numero_carton))
+
+    updated, inserted = assign_state(numero_carton, values)
+    flash(f'État {values["state_type"]} appliqué: {inserted} ajouté(s), {updated} mis à jour.', 'success')
+    return redirect(url_for('cartons.list_dossiers', numero_carton=numero_carton))
+
+
+# ------------------------
+# API
+# ------------------------
+@cartons_bp.route('/api/cartons', methods=['GET'])
+def api_cartons():
+    page = request.args.get('page', 1, type=int)
+    per_page = max(1, min(request.args.get('per_page', CARTONS_PER_PAGE, type=int), 200))
+    cartons = paginate_cartons(page, per_page, prefix=request.args.get('search', '').strip())
+    totals = carton_state_totals([carton.key for carton in cartons.items])
+    return jsonify({
+        'page': cartons.page,
+        'pages': cartons.pages,
+        'total': cartons.total,
+        'cartons': [
+            {'numero_carton': carton.key, 'documents': carton.count, 'states': totals[carton.key]}
+            for carton in cartons.items
+        ],
+    })
+
+
+@cartons_bp.route('/api/cartons/<path:numero_carton>/documents', methods=['GET'])
+def api_carton_documents(numero_carton):
+    page = request.args.get('page', 1, type=int)
+    per_page = max(1, min(request.args.get('per_page', DOSSIERS_PER_PAGE, type=int), 200))
+    dossiers = documents_with_states().filter(Document.numero_carton == numero_carton) \
+        .order_by(Document.id).paginate(page=page, per_page=per_page, error_out=False)
+    return jsonify({
+        'page': dossiers.page,
+        'pages': dossiers.pages,
+        'total': dossiers.total,
+        'documents': [doc.to_dict() for doc in dossiers.items],
+    })
+
+
+@cartons_bp.route('/api/cartons/<path:numero_carton>/states', methods=['POST'])
+@retry_on_busy
+def api_assign_carton_state(numero_carton):
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    data = request.get_json(silent=True) or {}
+    try:
+        values = clean_state(data.get('state_type'), data.get('quantity'), data.get('sub_state'))
+    except ValueError as exc:
+        return jsonify({'success': False, 'message': str(exc)}), 400
+
+    updated, inserted = assign_state(numero_carton, values)
+    return jsonify({'success': True, 'updated': updated, 'inserted': inserted})
@@ -0,0 +1,262 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from sqlalchemy import delete, event, func, select, text
+from sqlalchemy.orm import aliased, selectinload
+
+from aggregates import trigger_ddl
+from database import SUPPORTED_DIALECTS, read_only, trigger_names
+from extensions import db
+from models import Document
+
+changes_bp = Blueprint('changes', __name__, cli_group=None)
+
+# Change log of documents: triggers on documents, document_states and
+# document_state_sub_states append (version, document_id, op) in the writing
+# transaction, so every write path is recorded, bulk statements included.
+# Clients keep the last version they applied and ask for what changed since.
+#
+# Versions must follow commit order, or a transaction committing late would
+# show up behind a version a client has already read. SQLite serializes
+# writers, so its AUTOINCREMENT versions do. On PostgreSQL writers run
+# concurrently: a version is the writing transaction's id shifted left by
+# VERSION_TXID_BITS plus a counter local to the transaction, and readers only
+# serve versions below the oldest transaction still in flight
+# (txid_snapshot_xmin), all of whose rows are final. A write shows up once
+# every transaction older than it has ended; none waits on another. Versions
+# stay below 2**53, exact in JavaScript, for the first 2**33 transaction ids.
+#
+# Pruning keeps the newest entry it could delete, so the log stays the
+# unbroken tail of versions and a client behind it gets a 410.
+
+CHANGES_PAGE_SIZE = 500
+CHANGES_POLL_INTERVAL = 1.0
+CHANGES_KEEPALIVE = 15
+CHANGES_RETENTION_DAYS = 30
+# Log entries one PostgreSQL transaction can write: 2**20 - 1
+VERSION_TXID_BITS = 20
+
+
+class DocumentChange(db.Model):
+    __tablename__ = 'document_changes'
+    # AUTOINCREMENT: SQLite never reuses a version, even after pruning
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    version = db.Column(db.BigInteger().with_variant(db.Integer(), 'sqlite'), primary_key=True)
+    document_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=func.current_timestamp())
+
+
+def _log(dialect, document_id, op, source=''):
+    if dialect == 'postgresql':
+        return f"INSERT INTO document_changes (version, document_id, op) " \
+               f"SELECT document_change_version(), {document_id}, '{op}'{source};"
+    return f"INSERT INTO document_changes (document_id, op) SELECT {document_id}, '{op}'{source};"
+
+
+# name: (timing, table, document id, op, FROM clause), installed like the stats triggers
+TRIGGERS = {
+    'changes_documents_ai': ('AFTER INSERT', 'documents', 'new.id', 'upsert'),
+    'changes_documents_au': ('AFTER UPDATE', 'documents', 'new.id', 'upsert'),
+    'changes_documents_ad': ('AFTER DELETE', 'documents', 'old.id', 'delete'),
+    'changes_states_ai': ('AFTER INSERT', 'document_states', 'new.document_id', 'upsert'),
+    'changes_states_au': ('AFTER UPDATE', 'document_states', 'new.document_id', 'upsert'),
+    'changes_states_ad': ('AFTER DELETE', 'document_states', 'old.document_id', 'upsert'),
+    # Sub-state rows only know their state
+    'changes_sub_states_ai': ('AFTER INSERT', 'document_state_sub_states', 'document_id', 'upsert',
+                              ' FROM document_states WHERE id = new.state_id'),
+    'changes_sub_states_ad': ('AFTER DELETE', 'document_state_sub_states', 'document_id', 'upsert',
+                              ' FROM document_states WHERE id = old.state_id'),
+}
+
+# PostgreSQL: the next version of the current transaction. The counter is a
+# transaction-local setting, so it restarts with each transaction (and with a
+# rolled back savepoint, whose entries are gone too).
+VERSION_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION document_change_version() RETURNS bigint LANGUAGE plpgsql AS $$
+DECLARE
+    n bigint := COALESCE(NULLIF(current_setting('electrodoc.change_count', true), ''), '0')::bigint + 1;
+BEGIN
+    IF n >= {2 ** VERSION_TXID_BITS} THEN
+        RAISE EXCEPTION 'Plus de % modifications de documents dans une transaction', n - 1;
+    END IF;
+    PERFORM set_config('electrodoc.change_count', n::text, true);
+    RETURN txid_current() * {2 ** VERSION_TXID_BITS} + n;
+END $$
+"""
+
+
+def _triggers(dialect):
+    return {name: (timing, table, _log(dialect, *log)) for name, (timing, table, *log) in TRIGGERS.items()}
+
+
+def init_change_log(connection, replace=False):
+    """Install the change log triggers if they are missing, or all of them again with ``replace``."""
+    dialect = connection.dialect.name
+    if dialect not in SUPPORTED_DIALECTS:
+        return
+    triggers = _triggers(dialect)
+    if not replace and trigger_names(connection, 'changes_') == set(triggers):
+        return
+    if dialect == 'postgresql':
+        connection.execute(text(VERSION_FUNCTION))
+    for name, (timing, table, statements) in triggers.items():
+        for statement in trigger_ddl(dialect, name, timing, table, statements):
+            connection.execute(text(statement))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_change_triggers(target, connection, **kw):
+    init_change_log(connection)
+
+
+# ------------------------
+# Reading the log (shared with the async handlers in asgi.py)
+# ------------------------
+def changes_params(args, last_event_id=None):
+    """Read ``since`` (or an SSE Last-Event-ID) and ``limit``; ``since`` is None when not given."""
+    since = args.get('since', type=int)
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    return {
+        'since': since,
+        'limit': max(1, min(args.get('limit', CHANGES_PAGE_SIZE, type=int), CHANGES_PAGE_SIZE)),
+    }
+
+
+def version_bounds(dialect):
+    """Oldest version still in the log and latest one that can be served.
+
+    On PostgreSQL the latest is below the oldest transaction in flight: those
+    and later ones may still add smaller versions than committed entries.
+    """
+    latest = select(func.max(DocumentChange.version))
+    if dialect == 'postgresql':
+        horizon = func.txid_snapshot_xmin(func.txid_current_snapshot()) * 2 ** VERSION_TXID_BITS
+        latest = latest.where(DocumentChange.version < horizon)
+    # Two subqueries: SQLite only reads min() or max() off the primary key when it is alone
+    return select(select(func.min(DocumentChange.version)).scalar_subquery(), latest.scalar_subquery())
+
+
+def changed_documents(since, until, limit):
+    """Documents changed after ``since`` up to ``until`` with their last version, oldest first, one row past ``limit``.
+
+    A document changed several times appears once, so a page can be cut after
+    any row without splitting the changes of one document.
+    """
+    version = func.max(DocumentChange.version).label('version')
+    return select(DocumentChange.document_id, version) \
+        .where(DocumentChange.version > since, DocumentChange.version <= until) \
+        .group_by(DocumentChange.document_id).order_by(version).limit(limit + 1)
+
+
+def documents_by_id(ids):
+    return select(Document).options(selectinload(Document.states)).where(Document.id.in_(ids))
+
+
+def changes_body(since, limit, bounds, rows, documents):
+    """The /api/documents/changes body, or None if ``since`` is older than the log (the client must reload)."""
+    oldest, latest = bounds
+    if since is None:
+        # Start here, then load the full list
+        return {'version': latest or 0, 'changes': [], 'more': False}
+    if oldest is not None and since < oldest - 1:
+        return None
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    documents = {doc.id: doc for doc in documents}
+    changes = []
+    for document_id, version in rows:
+        doc = documents.get(document_id)
+        if doc is None:
+            changes.append({'version': version, 'id': document_id, 'op': 'delete'})
+        else:
+            changes.append({'version': version, 'id': document_id, 'op': 'upsert', 'document': doc.to_dict()})
+    return {'version': rows[-1][1] if rows else max(since, latest or 0), 'changes': changes, 'more': more}
+
+
+def sse_event(body, dumps):
+    return f"id: {body['version']}\nevent: changes\ndata: {dumps(body)}\n\n"
+
+
+def read_changes(since, limit):
+    bounds = db.session.execute(version_bounds(db.engine.dialect.name)).one()
+    rows = []
+    documents = []
+    # Idle clients stop at the bounds query
+    if since is not None and bounds[1] is not None and since < bounds[1]:
+        rows = db.session.execute(changed_documents(since, bounds[1], limit)).all()
+        if rows:
+            documents = db.session.scalars(documents_by_id([row[0] for row in rows[:limit]])).all()
+    return changes_body(since, limit, bounds, rows, documents)
+
+
+GONE = {'success': False, 'message': 'Version trop ancienne: rechargez la liste complète'}
+
+
+# ------------------------
+# Routes
+# ------------------------
+@changes_bp.route('/api/documents/changes', methods=['GET'])
+@read_only
+def get_changes():
+    """Documents changed since ``since``; without it, only the current version to start from."""
+    params = changes_params(request.args)
+    body = read_changes(params['since'], params['limit'])
+    if body is None:
+        return jsonify(GONE), 410
+    return jsonify(body)
+
+
+@changes_bp.route('/api/documents/changes/stream', methods=['GET'])
+@read_only
+def stream_changes():
+    """Server-Sent Events: one ``changes`` event per page of changes, a comment line while idle.
+
+    Each connection holds a worker thread here; serve many clients through asgi.py.
+    """
+    params = changes_params(request.args, request.headers.get('Last-Event-ID'))
+    interval = current_app.config.get('CHANGES_POLL_INTERVAL', CHANGES_POLL_INTERVAL)
+    dumps = current_app.json.dumps
+
+    def generate():
+        since = params['since']
+        idle = 0.0
+        while True:
+            body = read_changes(since, params['limit'])
+            # Release the connection while waiting
+            db.session.remove()
+            if body is None:
+                yield f"event: reset\ndata: {dumps(GONE)}\n\n"
+                return
+            if since is None or body['changes']:
+                yield sse_event(body, dumps)
+                since, idle = body['version'], 0.0
+                if body['more']:
+                    continue
+            elif idle >= CHANGES_KEEPALIVE:
+                yield ': keepalive\n\n'
+                idle = 0.0
+            time.sleep(interval)
+            idle += interval
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@changes_bp.cli.command('prune-changes')
+@click.option('--days', default=CHANGES_RETENTION_DAYS, show_default=True, help='Jours de journal à conserver.')
+def prune_changes_command(days):
+    """Supprime les entrées du journal des modifications plus anciennes que --days jours."""
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+    # By version, up to the newest old entry which stays as the horizon: a
+    # pruned log is never empty nor holed, so stale clients are told to reload
+    old = aliased(DocumentChange)
+    horizon = select(func.max(old.version)).where(old.changed_at < cutoff).scalar_subquery()
+    deleted = db.session.execute(delete(DocumentChange).where(DocumentChange.version < horizon)).rowcount
+    db.session.commit()
+    click.echo(f'{deleted} entrées supprimées')
@@ -0,0 +1,90 @@
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Response compression negotiated from Accept-Encoding: brotli when the client
+# takes it and the package is installed, else gzip. JSON listings repeat the
+# same keys, state types and carton names on every row and shrink several
+# times. Server-Sent Events are left alone, compressors would hold them back.
+
+COMPRESSIBLE = {'application/json', 'application/x-ndjson', 'text/csv', 'text/html', 'text/plain'}
+COMPRESS_MIN_SIZE = 500
+GZIP_LEVEL = 6
+# Brotli's default (11) is meant for static files: far too slow per request
+BROTLI_QUALITY = 5
+
+
+def negotiate(accept_encodings):
+    """'br', 'gzip' or None for a werkzeug Accept built from Accept-Encoding."""
+    offers = (['br'] if brotli is not None else []) + ['gzip']
+    quality, encoding = max(((accept_encodings[name], name) for name in offers), key=lambda offer: offer[0])
+    return encoding if quality > 0 else None
+
+
+class Compressor:
+    """Compresses one response body, whole or chunk by chunk."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits 31: gzip header and trailer
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._brotli.process(data) if self.encoding == 'br' else self._zlib.compress(data)
+
+    def finish(self):
+        return self._brotli.finish() if self.encoding == 'br' else self._zlib.flush()
+
+
+def compress(data, encoding):
+    compressor = Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(chunks, encoding):
+    compressor = Compressor(encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compress_response(response):
+    if (response.status_code != 200 or request.method == 'HEAD' or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), encoding)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # Same content, other bytes: the validator becomes weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    """Compress responses from an after_request hook unless COMPRESSION is off."""
+    app.config.setdefault('COMPRESSION', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', COMPRESS_MIN_SIZE)
+    if app.config['COMPRESSION']:
+        app.after_request(compress_response)
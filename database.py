@@ -0,0 +1,130 @@
+import time
+from functools import partial, wraps
+
+from flask import current_app, g
+from sqlalchemy import event, inspect, make_url, text
+from sqlalchemy.exc import OperationalError
+
+from extensions import REPLICA_BIND, db
+
+SUPPORTED_DIALECTS = ('sqlite', 'postgresql')
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg'}
+# PostgreSQL serialization failure and deadlock: the transaction can simply be run again
+RETRYABLE_SQLSTATES = ('40001', '40P01')
+
+
+# ------------------------
+# Backend selection
+# ------------------------
+def database_url(url):
+    """Accept the postgres:// scheme some hosts still hand out; SQLAlchemy only knows postgresql://."""
+    if url and url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url, pool_size, max_overflow, pool_timeout=30):
+    """SQLALCHEMY_ENGINE_OPTIONS for ``url``.
+
+    In-memory SQLite runs on a single static connection, which takes no pool sizing.
+    """
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and (url.database or ':memory:').endswith(':memory:'):
+        return {}
+    return {'pool_size': pool_size, 'max_overflow': max_overflow, 'pool_timeout': pool_timeout}
+
+
+def database_binds(replica_url):
+    """SQLALCHEMY_BINDS for an optional read replica; no models are bound to it, only read_only views."""
+    return {REPLICA_BIND: database_url(replica_url)} if replica_url else {}
+
+
+def read_only(view):
+    """Let the reads of ``view`` go to the replica bind (falls back to the primary without one)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def table_names(engine):
+    return inspect(engine).get_table_names()
+
+
+def trigger_names(connection, prefix):
+    """Names of the triggers starting with ``prefix``, whatever the backend."""
+    if connection.dialect.name == 'sqlite':
+        statement = "SELECT name FROM sqlite_master WHERE type='trigger' AND name LIKE :pattern"
+    else:
+        statement = "SELECT DISTINCT trigger_name FROM information_schema.triggers WHERE trigger_name LIKE :pattern"
+    return {row[0] for row in connection.execute(text(statement), {'pattern': prefix + '%'})}
+
+
+# ------------------------
+# SQLite connection tuning
+# ------------------------
+def _apply_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        if value is not None:
+            cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def init_sqlite_tuning(app):
+    """Set ``SQLITE_PRAGMAS`` on every new SQLite connection of the app's engines."""
+    pragmas = app.config.get('SQLITE_PRAGMAS', {})
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', partial(_apply_pragmas, pragmas))
+
+
+def create_async_api_engine(app):
+    """Async engine (aiosqlite/asyncpg) for the handlers in asgi.py, on the replica when there is one."""
+    # Only the ASGI entry point needs greenlet and the async drivers
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = make_url(app.config['SQLALCHEMY_BINDS'].get(REPLICA_BIND) or app.config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    engine = create_async_engine(url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}'),
+                                 **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    if backend == 'sqlite':
+        event.listen(engine.sync_engine, 'connect', partial(_apply_pragmas, app.config.get('SQLITE_PRAGMAS', {})))
+    return engine
+
+
+# ------------------------
+# Busy handling
+# ------------------------
+def _is_busy(exc):
+    sqlstate = getattr(exc.orig, 'sqlstate', None) or getattr(exc.orig, 'pgcode', None)
+    if sqlstate in RETRYABLE_SQLSTATES:
+        return True
+    message = str(exc.orig).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def retry_on_busy(view):
+    """Re-run a writing view when SQLite reports the database as locked.
+
+    busy_timeout already waits for the write lock, but a transaction that read
+    first and then tries to write can be refused immediately; rolling back and
+    starting over is the only way out. PostgreSQL serialization failures and
+    deadlocks are handled the same way. Retries ``DB_WRITE_RETRIES`` times with
+    exponential backoff. Only for views whose side effects are all in the
+    session until their single commit.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        retries = current_app.config.get('DB_WRITE_RETRIES', 0)
+        for attempt in range(retries + 1):
+            try:
+                return view(*args, **kwargs)
+            except OperationalError as exc:
+                db.session.rollback()
+                if attempt == retries or not _is_busy(exc):
+                    raise
+                time.sleep(0.02 * 2 ** attempt)
+    return wrapper
@@ -0,0 +1,217 @@
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, flash
+
+from aggregates import read_stats, rebuild_stats
+from auth import is_logged_in
+from batch import delete_documents
+from cache import response_cache
+from database import read_only, retry_on_busy, table_names
+from extensions import db
+from history import read_trends
+from jobs import job_accepted, submit_job, task
+from models import ALL_ETATS, BRK_SUB_STATES, Document, DocumentState, documents_with_states
+from search import apply_search
+
+documents_bp = Blueprint('documents', __name__)
+
+
+# ------------------------
+# Traditional Flask Routes (for server-side rendering, if needed)
+# ------------------------
+def states_from_form(form):
+    """Read the submitted etats/quantities/sub_states_i fields as DocumentState column dicts."""
+    states = []
+    quantities = form.getlist('quantities')
+    for i, state_type in enumerate(form.getlist('etats')):
+        quantity = int(quantities[i]) if i < len(quantities) and quantities[i].isdigit() else 1
+        sub_states = form.getlist(f'sub_states_{i}') if state_type == 'BRK' else []
+        states.append({
+            'state_type': state_type,
+            'sub_state': ",".join(sub_states) if sub_states else None,
+            'quantity': quantity,
+        })
+    return states
+
+
+def sync_states(document, desired):
+    """Make ``document.states`` match ``desired`` with the fewest inserts, updates and deletes.
+
+    Identical rows are kept untouched, remaining existing rows are updated in
+    place with the remaining submitted values, and only the surplus is deleted
+    or inserted. The unit of work then batches each kind of statement.
+    """
+    def key(values):
+        return values['state_type'], values['sub_state'], values['quantity']
+
+    leftover = []
+    unmatched = {}
+    for state in document.states:
+        unmatched.setdefault(key(state.to_dict()), []).append(state)
+    for values in desired:
+        same = unmatched.get(key(values))
+        if same:
+            same.pop()
+        else:
+            leftover.append(values)
+
+    stale = [state for states in unmatched.values() for state in states]
+    for state, values in zip(stale, leftover):
+        for name, value in values.items():
+            setattr(state, name, value)
+    for state in stale[len(leftover):]:
+        document.states.remove(state)
+    for values in leftover[len(stale):]:
+        document.states.append(DocumentState(**values))
+
+
+@documents_bp.route('/')
+def home():
+    return redirect(url_for('auth.login'))
+
+@documents_bp.route('/dashboard')
+@read_only
+def dashboard():
+    if not is_logged_in():
+        flash('Veuillez vous connecter pour accéder au tableau de bord.', 'error')
+        return redirect(url_for('auth.login'))
+
+    search = request.args.get('search', '').strip()
+    page = request.args.get('page', 1, type=int)
+    per_page = 10
+
+    def render():
+        query = documents_with_states()
+        if search:
+            query = apply_search(query, search, ranked=True)
+
+        documents = query.paginate(page=page, per_page=per_page, error_out=False)
+        return render_template('index.html', documents=documents, search=search)
+    return response_cache.page(render)
+
+@documents_bp.route('/add', methods=['GET', 'POST'])
+@retry_on_busy
+def add_document():
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    if request.method == 'POST':
+        numero_dossier = request.form['numero_dossier'].strip()
+        numero_carton = request.form['numero_carton'].strip()
+        modele = request.form['modele'].strip()
+
+        if not numero_dossier or not numero_carton or not modele:
+            flash('Veuillez remplir tous les champs obligatoires!', 'error')
+            return redirect(url_for('documents.add_document'))
+
+        if Document.query.filter_by(numero_dossier=numero_dossier).first():
+            flash('Un document avec ce numéro de dossier existe déjà!', 'error')
+            return redirect(url_for('documents.add_document'))
+
+        new_document = Document(numero_dossier=numero_dossier, numero_carton=numero_carton, modele=modele)
+        new_document.states = [DocumentState(**state) for state in states_from_form(request.form)]
+        db.session.add(new_document)
+        db.session.commit()
+        flash('Document ajouté avec succès!', 'success')
+        return redirect(url_for('documents.dashboard'))
+
+    etats = [{'id': etat, 'nom': etat} for etat in ALL_ETATS]
+    return render_template('add_document.html', etats=etats)
+
+
+@documents_bp.route('/edit/<int:id>', methods=['GET', 'POST'])
+@retry_on_busy
+def edit_document(id):
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    document = Document.query.get_or_404(id)
+
+    if request.method == 'POST':
+        document.numero_dossier = request.form['numero_dossier'].strip()
+        document.numero_carton = request.form['numero_carton'].strip()
+        document.modele = request.form['modele'].strip()
+
+        # Only the rows that actually differ are written; unchanged fields and states issue no SQL
+        sync_states(document, states_from_form(request.form))
+        db.session.commit()
+        flash('Document modifié avec succès!', 'success')
+        return redirect(url_for('documents.dashboard'))
+
+    etats = [{'id': etat, 'nom': etat} for etat in ALL_ETATS]
+    selected_etats = [state.state_type for state in document.states]
+
+    return render_template('edit_document.html', document=document, etats=etats, selected_etats=selected_etats)
+
+@documents_bp.route('/delete/<int:id>', methods=['POST'])
+@retry_on_busy
+def delete_document(id):
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    Document.query.get_or_404(id)
+    # Set-based: the ORM cascade would load and delete the states one by one
+    delete_documents([Document.id == id])
+    flash('Document supprimé avec succès!', 'success')
+    return redirect(url_for('documents.dashboard'))
+
+@documents_bp.route('/document/<int:doc_id>/add_state', methods=['POST'])
+@retry_on_busy
+def add_document_state(doc_id):
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    data = request.get_json()
+    Document.query.get_or_404(doc_id)
+
+    new_state = DocumentState(
+        document_id=doc_id,
+        state_type=data.get('state_type'),
+        sub_state=data.get('sub_state'),
+        quantity=data.get('quantity', 1)
+    )
+
+    db.session.add(new_state)
+    db.session.commit()
+    return jsonify({'success': True, 'message': 'État ajouté avec succès'})
+
+
+@documents_bp.route('/state/<int:state_id>/delete', methods=['POST'])
+@retry_on_busy
+def delete_document_state(state_id):
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    state = DocumentState.query.get_or_404(state_id)
+    db.session.delete(state)
+    db.session.commit()
+    return jsonify({'success': True, 'message': 'État supprimé avec succès'})
+
+
+@documents_bp.route('/tables')
+def list_tables():
+    return f"Tables dans la base de données: {', '.join(table_names(db.engine))}"
+
+@documents_bp.route('/stats')
+@read_only
+def stats():
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    return response_cache.page(
+        lambda: render_template('stats.html', etats=ALL_ETATS, sub_states=BRK_SUB_STATES,
+                                trends=read_trends('day'), **read_stats())
+    )
+
+
+@task('aggregates')
+def rebuild_stats_job(job):
+    """Job body: recompute stat_aggregates from the base tables."""
+    with db.engine.begin() as connection:
+        rebuild_stats(connection)
+    response_cache.invalidate()
+
+
+@documents_bp.route('/api/stats/rebuild', methods=['POST'])
+def rebuild_stats_view():
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+    return job_accepted(submit_job('aggregates'))
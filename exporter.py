@@ -0,0 +1,183 @@
+import csv
+import io
+import json
+from collections import namedtuple
+
+import click
+from flask import Blueprint, Response, request, redirect, url_for, stream_with_context
+from sqlalchemy import exists, func, select
+
+from auth import is_logged_in
+from extensions import db
+from jobs import job_accepted, submit_job, task
+from importer import COLUMNS
+from models import Document, DocumentState, DocumentSubState, sort_sub_states
+
+export_bp = Blueprint('exporter', __name__, cli_group=None)
+
+EXPORT_CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'columnar': ('application/x-ndjson', 'columnar.ndjson'),
+}
+ExportRow = namedtuple('ExportRow', ['id', 'numero_dossier', 'numero_carton', 'modele', 'state_type', 'quantity',
+                                     'sub_state'])
+
+
+def _sorted_sub_states(row):
+    # aggregate_strings concatenates in whatever order the rows come; exports must be repeatable
+    if not row.sub_state or ',' not in row.sub_state:
+        return row
+    return ExportRow(*row[:-1], ','.join(sort_sub_states(sorted(row.sub_state.split(',')))))
+
+
+def export_rows(carton=None, modele=None, state_type=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield flat (document, state) rows ordered by document, read through a streaming cursor.
+
+    Documents without states appear once with empty state columns. ``state_type``
+    keeps documents having at least one state of that type, with all their states.
+    """
+    sub_state = select(func.aggregate_strings(DocumentSubState.sub_state, ',')) \
+        .where(DocumentSubState.state_id == DocumentState.id).scalar_subquery()
+    statement = select(
+        Document.id, Document.numero_dossier, Document.numero_carton, Document.modele,
+        DocumentState.state_type, DocumentState.quantity, sub_state.label('sub_state'),
+    ).outerjoin(DocumentState, DocumentState.document_id == Document.id) \
+        .order_by(Document.id, DocumentState.id)
+
+    if carton:
+        statement = statement.where(Document.numero_carton == carton)
+    if modele:
+        statement = statement.where(Document.modele == modele)
+    if state_type:
+        statement = statement.where(exists().where(
+            DocumentState.document_id == Document.id, DocumentState.state_type == state_type
+        ).correlate(Document))
+
+    # yield_per fetches chunk_size rows at a time (server-side cursor where the driver has one)
+    result = db.session.execute(statement.execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        yield from map(_sorted_sub_states, partition)
+
+
+# ------------------------
+# Writers
+# ------------------------
+def write_csv(rows):
+    """Same columns as the import format, so an export can be re-imported as is."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([row.numero_dossier, row.numero_carton, row.modele,
+                         row.state_type or '', row.quantity or '', row.sub_state or ''])
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_ndjson(rows):
+    """One document per line with its states nested, like /api/documents."""
+    current = None
+    for row in rows:
+        if current is None or current['id'] != row.id:
+            if current is not None:
+                yield json.dumps(current, ensure_ascii=False) + '\n'
+            current = {'id': row.id, 'numero_dossier': row.numero_dossier,
+                       'numero_carton': row.numero_carton, 'modele': row.modele, 'states': []}
+        if row.state_type is not None:
+            current['states'].append({'state_type': row.state_type, 'sub_state': row.sub_state,
+                                      'quantity': row.quantity})
+    if current is not None:
+        yield json.dumps(current, ensure_ascii=False) + '\n'
+
+
+def write_columnar(rows, group_size=EXPORT_CHUNK_SIZE):
+    """One JSON line per row group holding column arrays instead of row objects.
+
+    Repetitive text columns (carton, modele, state_type) are dictionary encoded
+    per group: the column holds indexes into the group's ``dictionaries`` entry.
+    """
+    names = ['id', 'numero_dossier', 'numero_carton', 'modele', 'state_type', 'quantity', 'sub_state']
+    encoded = ('numero_carton', 'modele', 'state_type')
+
+    def flush(group):
+        columns = {name: [getattr(row, name) for row in group] for name in names}
+        dictionaries = {}
+        for name in encoded:
+            values = {}
+            columns[name] = [values.setdefault(value, len(values)) for value in columns[name]]
+            dictionaries[name] = list(values)
+        return json.dumps({'rows': len(group), 'columns': columns, 'dictionaries': dictionaries},
+                          ensure_ascii=False, separators=(',', ':')) + '\n'
+
+    group = []
+    for row in rows:
+        group.append(row)
+        if len(group) >= group_size:
+            yield flush(group)
+            group = []
+    if group:
+        yield flush(group)
+
+
+WRITERS = {'csv': write_csv, 'ndjson': write_ndjson, 'columnar': write_columnar}
+
+
+@task('export')
+def export_job(job, fmt, carton=None, modele=None, state_type=None):
+    """Job body: write the export to a file and return where to download it."""
+    mimetype, extension = FORMATS[fmt]
+    path = job.file_path(extension)
+    rows = job.track(export_rows(carton=carton, modele=modele, state_type=state_type))
+    with open(path, 'w', encoding='utf-8', newline='') as output:
+        for chunk in WRITERS[fmt](rows):
+            output.write(chunk)
+    return {'path': path, 'mimetype': mimetype, 'filename': f'documents.{extension}', 'rows': job.count}
+
+
+# ------------------------
+# Entry points
+# ------------------------
+@export_bp.route('/api/export', methods=['GET'])
+def export_documents():
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in WRITERS:
+        return {'success': False, 'message': f'Format inconnu: {fmt}'}, 400
+
+    filters = {
+        'carton': request.args.get('carton', '').strip() or None,
+        'modele': request.args.get('modele', '').strip() or None,
+        'state_type': request.args.get('state', '').strip() or None,
+    }
+    if request.args.get('background') == '1':
+        return job_accepted(submit_job('export', dict(filters, fmt=fmt)))
+
+    rows = export_rows(**filters)
+    mimetype, extension = FORMATS[fmt]
+    return Response(
+        stream_with_context(WRITERS[fmt](rows)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=documents.{extension}'},
+    )
+
+
+@export_bp.cli.command('export-documents')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(list(WRITERS)), default='csv', show_default=True)
+@click.option('--carton', help='Limiter à un carton.')
+@click.option('--modele', help='Limiter à un modèle.')
+@click.option('--state', 'state_type', help="Dossiers ayant au moins un état de ce type.")
+def export_documents_command(path, fmt, carton, modele, state_type):
+    """Exporte les dossiers et leurs états en CSV, NDJSON ou format colonnes."""
+    rows = export_rows(carton=carton, modele=modele, state_type=state_type)
+    with open(path, 'w', encoding='utf-8', newline='') as output:
+        for chunk in WRITERS[fmt](rows):
+            output.write(chunk)
+    click.echo(f'Export écrit dans {path}')
@@ -0,0 +1,123 @@
+from sqlalchemy import and_, case, distinct, func, literal, select, union_all
+
+from extensions import db
+from models import ALL_ETATS, BRK_SUB_STATES, Document, DocumentState, DocumentSubState
+from search import search_criterion
+
+# Structured filters for /api/documents/filter. Values of one dimension are
+# alternatives (carton=A&carton=B), dimensions are combined with AND. The state
+# filters (state_type, sub_state, quantity range) apply to the same state row:
+# state_type=HS&quantity_min=4 means "has an HS state of 4 pieces or more".
+
+FACET_LIMIT = 20
+QUANTITY_BUCKETS = [(1, 1, '1'), (2, 3, '2-3'), (4, 5, '4-5'), (6, 10, '6-10'), (11, None, '11+')]
+
+
+def filter_params(args):
+    """Read the filter arguments from a MultiDict of query args, or raise ValueError."""
+    def values(name):
+        return [value.strip() for value in args.getlist(name) if value.strip()]
+
+    def quantity(name):
+        value = args.get(name, '').strip()
+        if not value:
+            return None
+        if not value.isdigit():
+            raise ValueError(f'{name} invalide: {value}')
+        return int(value)
+
+    params = {
+        'state_type': values('state_type'),
+        'sub_state': values('sub_state'),
+        'quantity_min': quantity('quantity_min'),
+        'quantity_max': quantity('quantity_max'),
+        'carton': values('carton'),
+        'modele': values('modele'),
+        'search': args.get('search', '').strip(),
+    }
+    unknown = [value for value in params['state_type'] if value not in ALL_ETATS]
+    if unknown:
+        raise ValueError(f"état inconnu: {', '.join(unknown)}")
+    unknown = [value for value in params['sub_state'] if value not in BRK_SUB_STATES]
+    if unknown:
+        raise ValueError(f"sous-état inconnu: {', '.join(unknown)}")
+    return params
+
+
+def filter_criteria(params, dialect):
+    """WHERE criteria on Document for the filters; state filters become a single EXISTS."""
+    criteria = []
+    if params['carton']:
+        criteria.append(Document.numero_carton.in_(params['carton']))
+    if params['modele']:
+        criteria.append(Document.modele.in_(params['modele']))
+    if params['search']:
+        criteria.append(search_criterion(params['search'], dialect))
+
+    state = []
+    if params['state_type']:
+        state.append(DocumentState.state_type.in_(params['state_type']))
+    if params['sub_state']:
+        state.append(DocumentState.sub_state_rows.any(DocumentSubState.sub_state.in_(params['sub_state'])))
+    if params['quantity_min'] is not None:
+        state.append(DocumentState.quantity >= params['quantity_min'])
+    if params['quantity_max'] is not None:
+        state.append(DocumentState.quantity <= params['quantity_max'])
+    if state:
+        criteria.append(Document.states.any(and_(*state)))
+    return criteria
+
+
+def _quantity_bucket():
+    return case(*[
+        (DocumentState.quantity >= low if high is None else DocumentState.quantity.between(low, high), label)
+        for low, high, label in QUANTITY_BUCKETS
+    ])
+
+
+def facet_counts(criteria, limit=FACET_LIMIT):
+    """Count the matching documents per state type, sub-state, quantity bucket, carton and modele.
+
+    One statement: the matching ids are a CTE and every dimension is a grouped
+    branch of a UNION ALL over it. Counts are of documents, so a dossier with
+    two HS states counts once under HS. Cartons and modeles are lists of their
+    ``limit`` largest values, largest first.
+    """
+    matched = select(Document.id, Document.numero_carton, Document.modele).where(*criteria).cte('matched')
+
+    def by_state(dimension, column, *joins):
+        statement = select(literal(dimension), column, func.count(distinct(DocumentState.document_id))) \
+            .join(matched, matched.c.id == DocumentState.document_id)
+        for target, on in joins:
+            statement = statement.join(target, on)
+        return statement.group_by(column)
+
+    def top(dimension, column):
+        ranked = select(column.label('value'), func.count().label('count')).group_by(column) \
+            .order_by(func.count().desc(), column).limit(limit).subquery()
+        return select(literal(dimension), ranked.c.value, ranked.c.count)
+
+    rows = union_all(
+        select(literal('total'), literal(''), func.count()).select_from(matched),
+        by_state('state_type', DocumentState.state_type),
+        by_state('sub_state', DocumentSubState.sub_state,
+                 (DocumentSubState, DocumentSubState.state_id == DocumentState.id)),
+        by_state('quantity', _quantity_bucket()),
+        top('carton', matched.c.numero_carton),
+        top('modele', matched.c.modele),
+    )
+
+    facets = {'state_type': dict.fromkeys(ALL_ETATS, 0), 'sub_state': dict.fromkeys(BRK_SUB_STATES, 0),
+              'quantity': {label: 0 for _, _, label in QUANTITY_BUCKETS}, 'carton': [], 'modele': []}
+    total = 0
+    for dimension, value, count in db.session.execute(rows).all():
+        if dimension == 'total':
+            total = count
+        elif dimension in ('carton', 'modele'):
+            facets[dimension].append({'value': value, 'count': count})
+        elif value is not None:
+            facets[dimension][value] = count
+    for dimension in ('carton', 'modele'):
+        facets[dimension].sort(key=lambda facet: (-facet['count'], facet['value']))
+    return total, facets
+
@@ -0,0 +1,272 @@
+from datetime import datetime, timedelta, timezone
+
+from flask import Blueprint, abort, jsonify, redirect, request, url_for
+from sqlalchemy import event, func, select, text
+
+from aggregates import trigger_ddl
+from auth import is_logged_in
+from database import SUPPORTED_DIALECTS, read_only, trigger_names
+from extensions import db
+from models import Document, utcnow
+
+history_bp = Blueprint('history', __name__)
+
+# State history: triggers on document_states append every state added, changed
+# or removed to state_history, and roll the same event into hourly and daily
+# counters per state type in state_buckets. Both happen in the writing
+# transaction, so bulk statements are recorded too, and a trend over a time
+# range reads one row per bucket and state type however many states changed.
+#
+# Buckets are keyed by their UTC start as text ('2024-05-13 14:00' for an hour,
+# '2024-05-13' for a day), so a range is a primary key range scan.
+
+GRANULARITIES = ('hour', 'day', 'week')
+# Default span of a trend and the most buckets one request may ask for
+TREND_SPANS = {'hour': 48, 'day': 30, 'week': 12}
+TREND_MAX_BUCKETS = 400
+BUCKET_FORMATS = {'hour': '%Y-%m-%d %H:00', 'day': '%Y-%m-%d'}
+BUCKET_COUNTERS = ('added', 'removed', 'quantity_added', 'quantity_removed')
+
+
+class StateHistory(db.Model):
+    """One state added, changed or removed; rows are never updated."""
+    __tablename__ = 'state_history'
+    __table_args__ = (db.Index('ix_state_history_document', 'document_id', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, nullable=False)
+    state_id = db.Column(db.Integer, nullable=False)
+    event = db.Column(db.String(10), nullable=False)
+    state_type = db.Column(db.String(50), nullable=False)
+    quantity = db.Column(db.Integer, nullable=True)
+    previous_state_type = db.Column(db.String(50), nullable=True)
+    previous_quantity = db.Column(db.Integer, nullable=True)
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=func.current_timestamp())
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'state_id': self.state_id,
+            'event': self.event,
+            'state_type': self.state_type,
+            'quantity': self.quantity,
+            'previous_state_type': self.previous_state_type,
+            'previous_quantity': self.previous_quantity,
+            'changed_at': self.changed_at.isoformat() if self.changed_at else None,
+        }
+
+
+class StateBucket(db.Model):
+    """States added/removed, and their pieces, per state type over one hour or one day."""
+    __tablename__ = 'state_buckets'
+
+    granularity = db.Column(db.String(5), primary_key=True)
+    bucket = db.Column(db.String(16), primary_key=True)
+    state_type = db.Column(db.String(50), primary_key=True)
+    added = db.Column(db.Integer, nullable=False, default=0)
+    removed = db.Column(db.Integer, nullable=False, default=0)
+    quantity_added = db.Column(db.Integer, nullable=False, default=0)
+    quantity_removed = db.Column(db.Integer, nullable=False, default=0)
+
+
+# ------------------------
+# Triggers
+# ------------------------
+def _bucket_key(dialect, granularity):
+    if dialect == 'sqlite':
+        return f"strftime('{BUCKET_FORMATS[granularity]}', 'now')"
+    pattern = 'YYYY-MM-DD HH24:00' if granularity == 'hour' else 'YYYY-MM-DD'
+    return f"to_char(timezone('UTC', now()), '{pattern}')"
+
+
+def _count(dialect, state_type, added, removed, quantity_added, quantity_removed, where='TRUE'):
+    return ' '.join(
+        f"INSERT INTO state_buckets "
+        f"(granularity, bucket, state_type, added, removed, quantity_added, quantity_removed) "
+        f"SELECT '{granularity}', {_bucket_key(dialect, granularity)}, {state_type}, "
+        f"{added}, {removed}, {quantity_added}, {quantity_removed} WHERE {where} "
+        f"ON CONFLICT (granularity, bucket, state_type) DO UPDATE SET "
+        f"added = state_buckets.added + excluded.added, removed = state_buckets.removed + excluded.removed, "
+        f"quantity_added = state_buckets.quantity_added + excluded.quantity_added, "
+        f"quantity_removed = state_buckets.quantity_removed + excluded.quantity_removed;"
+        for granularity in ('hour', 'day')
+    )
+
+
+def _record(event, row, previous=None, where='TRUE'):
+    previous_columns = f'{previous}.state_type, {previous}.quantity' if previous else 'NULL, NULL'
+    return (
+        f"INSERT INTO state_history (document_id, state_id, event, state_type, quantity, "
+        f"previous_state_type, previous_quantity) "
+        f"SELECT {row}.document_id, {row}.id, '{event}', {row}.state_type, {row}.quantity, {previous_columns} "
+        f"WHERE {where};"
+    )
+
+
+def _history_triggers(dialect):
+    old_quantity, new_quantity = 'COALESCE(old.quantity, 0)', 'COALESCE(new.quantity, 0)'
+    retyped = 'old.state_type <> new.state_type'
+    resized = f'old.state_type = new.state_type AND {old_quantity} <> {new_quantity}'
+    # A state moved to another type leaves the old type and joins the new one;
+    # a quantity change only moves the pieces
+    return {
+        'history_states_ai': ('AFTER INSERT', 'document_states', ' '.join([
+            _record('add', 'new'),
+            _count(dialect, 'new.state_type', 1, 0, new_quantity, 0),
+        ])),
+        'history_states_au': ('AFTER UPDATE OF state_type, quantity', 'document_states', ' '.join([
+            _record('update', 'new', 'old', f'{retyped} OR {old_quantity} <> {new_quantity}'),
+            _count(dialect, 'old.state_type', 0, 1, 0, old_quantity, retyped),
+            _count(dialect, 'new.state_type', 1, 0, new_quantity, 0, retyped),
+            _count(dialect, 'new.state_type', 0, 0,
+                   f'CASE WHEN {new_quantity} > {old_quantity} THEN {new_quantity} - {old_quantity} ELSE 0 END',
+                   f'CASE WHEN {old_quantity} > {new_quantity} THEN {old_quantity} - {new_quantity} ELSE 0 END',
+                   resized),
+        ])),
+        'history_states_ad': ('AFTER DELETE', 'document_states', ' '.join([
+            _record('remove', 'old'),
+            _count(dialect, 'old.state_type', 0, 1, 0, old_quantity),
+        ])),
+    }
+
+
+def init_state_history(connection):
+    """Install the state history triggers if they are missing."""
+    dialect = connection.dialect.name
+    if dialect not in SUPPORTED_DIALECTS:
+        return
+    triggers = _history_triggers(dialect)
+    if trigger_names(connection, 'history_') == set(triggers):
+        return
+    for name, (timing, table, statements) in triggers.items():
+        for statement in trigger_ddl(dialect, name, timing, table, statements):
+            connection.execute(text(statement))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_history_triggers(target, connection, **kw):
+    init_state_history(connection)
+
+
+# ------------------------
+# Trends
+# ------------------------
+def _floor(moment, granularity):
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'hour':
+        return moment
+    moment = moment.replace(hour=0)
+    if granularity == 'week':
+        moment -= timedelta(days=moment.weekday())
+    return moment
+
+
+def _step(granularity):
+    return {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}[granularity]
+
+
+def trend_params(args):
+    """Read granularity, start and end (ISO, UTC unless an offset is given) from query args, or raise ValueError."""
+    granularity = args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'granularité inconnue: {granularity}')
+
+    def moment(name):
+        value = args.get(name, '').strip()
+        if not value:
+            return None
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f'{name} invalide: {value}')
+        # Buckets are naive UTC; an explicit offset is converted
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+
+    end = _floor(moment('end') or utcnow(), granularity)
+    start = moment('start')
+    start = _floor(start, granularity) if start else end - _step(granularity) * (TREND_SPANS[granularity] - 1)
+    if start > end:
+        raise ValueError('start doit précéder end')
+    if (end - start) // _step(granularity) >= TREND_MAX_BUCKETS:
+        raise ValueError(f'intervalle trop long: {TREND_MAX_BUCKETS} périodes au plus')
+    state_types = [value for value in args.getlist('state_type') if value]
+    return {'granularity': granularity, 'start': start, 'end': end, 'state_types': state_types}
+
+
+def read_trends(granularity='day', start=None, end=None, state_types=None):
+    """Counters per bucket and state type between ``start`` and ``end`` (bucket starts, UTC).
+
+    Reads the pre-rolled rows of the range only: one per hour or day and state
+    type. Weeks (starting on Monday) are summed from the daily buckets. Every
+    bucket of the range is listed, empty ones with zeros.
+    """
+    end = _floor(end or utcnow(), granularity)
+    start = _floor(start, granularity) if start else end - _step(granularity) * (TREND_SPANS[granularity] - 1)
+    stored = 'day' if granularity == 'week' else granularity
+    last = end + timedelta(days=6) if granularity == 'week' else end
+
+    statement = select(StateBucket).where(
+        StateBucket.granularity == stored,
+        StateBucket.bucket.between(start.strftime(BUCKET_FORMATS[stored]), last.strftime(BUCKET_FORMATS[stored])),
+    )
+    if state_types:
+        statement = statement.where(StateBucket.state_type.in_(state_types))
+
+    buckets = []
+    moment = start
+    while moment <= end:
+        buckets.append(moment)
+        moment += _step(granularity)
+    index = {moment: position for position, moment in enumerate(buckets)}
+
+    series = {}
+    for row in db.session.scalars(statement):
+        moment = _floor(datetime.strptime(row.bucket, BUCKET_FORMATS[stored]), granularity)
+        counters = series.setdefault(row.state_type, {name: [0] * len(buckets) for name in BUCKET_COUNTERS})
+        for name in BUCKET_COUNTERS:
+            counters[name][index[moment]] += getattr(row, name)
+
+    return {
+        'granularity': granularity,
+        'buckets': [moment.strftime(BUCKET_FORMATS['hour' if granularity == 'hour' else 'day']) for moment in buckets],
+        'series': dict(sorted(series.items())),
+    }
+
+
+def document_history(document_id):
+    """Every state event of a document, oldest first."""
+    return select(StateHistory).where(StateHistory.document_id == document_id).order_by(StateHistory.id)
+
+
+# ------------------------
+# Routes
+# ------------------------
+@history_bp.route('/api/stats/trends', methods=['GET'])
+@read_only
+def get_trends():
+    """States added/removed per hour, day or week and state type.
+
+    Arguments: granularity (hour, day, week), start and end (UTC, default the
+    last 48 hours, 30 days or 12 weeks) and state_type (repeatable).
+    """
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+    try:
+        params = trend_params(request.args)
+    except ValueError as exc:
+        return jsonify({'success': False, 'message': str(exc)}), 400
+    return jsonify(read_trends(**params))
+
+
+@history_bp.route('/api/documents/<int:id>/history', methods=['GET'])
+@read_only
+def get_document_history(id):
+    """State events of a document, still available after it was deleted."""
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+    events = db.session.scalars(document_history(id)).all()
+    if not events and db.session.get(Document, id) is None:
+        abort(404)
+    return jsonify({'id': id, 'history': [row.to_dict() for row in events]})
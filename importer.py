@@ -0,0 +1,245 @@
+import csv
+import io
+import os
+import time
+import uuid
+
+import click
+from flask import Blueprint, current_app, request, jsonify, redirect, url_for
+from sqlalchemy import select
+
+from auth import is_logged_in
+from extensions import db
+from jobs import job_accepted, submit_job, task
+from models import Document, clean_state, insert_states
+
+import_bp = Blueprint('importer', __name__, cli_group=None)
+
+# One line per state; a dossier with several states repeats its columns on each
+# line, a dossier without state leaves state_type empty.
+COLUMNS = ['numero_dossier', 'numero_carton', 'modele', 'state_type', 'quantity', 'sub_state']
+DEFAULT_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.documents = 0
+        self.states = 0
+        # Dossiers skipped because they already exist, whatever their number of lines
+        self.skipped = set()
+        self.errors = []
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def duplicates(self):
+        return len(self.skipped)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def error(self, line, message):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'ligne': line, 'erreur': message})
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'documents': self.documents,
+            'states': self.states,
+            'duplicates': self.duplicates,
+            'errors': self.errors,
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+# ------------------------
+# Readers
+# ------------------------
+def _read_csv(stream):
+    text_stream = stream if isinstance(stream, io.TextIOBase) else io.TextIOWrapper(stream, encoding='utf-8-sig')
+    yield from csv.DictReader(text_stream)
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _read_xlsx(workbook):
+    rows = workbook.active.iter_rows(values_only=True)
+    header = [_cell(cell).strip() for cell in next(rows, [])]
+    for values in rows:
+        yield {name: _cell(value) for name, value in zip(header, values)}
+
+
+def read_rows(stream, filename):
+    """Iterate the lines of a CSV or XLSX file as dicts keyed by column name."""
+    if not filename.lower().endswith('.xlsx'):
+        return _read_csv(stream)
+
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("L'import XLSX nécessite le paquet openpyxl.")
+    # read_only mode streams rows instead of loading the whole sheet
+    return _read_xlsx(load_workbook(stream, read_only=True, data_only=True))
+
+
+# ------------------------
+# Pipeline
+# ------------------------
+def _parse_row(row):
+    """Return (document fields, state fields or None) for one input line, or raise ValueError."""
+    fields = {name: (row.get(name) or '').strip() for name in COLUMNS}
+    if not fields['numero_dossier'] or not fields['numero_carton'] or not fields['modele']:
+        raise ValueError('numero_dossier, numero_carton et modele sont obligatoires')
+
+    document = {name: fields[name] for name in ('numero_dossier', 'numero_carton', 'modele')}
+    state_type = fields['state_type']
+    if not state_type:
+        return document, None
+    return document, clean_state(state_type, fields['quantity'] or None, fields['sub_state'])
+
+
+def _flush_chunk(chunk, imported, report):
+    """Insert one chunk of parsed lines with two executemany statements and commit it."""
+    numeros = {document['numero_dossier'] for _, document, _ in chunk} - imported.keys()
+    existing = set(db.session.execute(
+        select(Document.numero_dossier).where(Document.numero_dossier.in_(numeros))
+    ).scalars()) if numeros else set()
+
+    new_documents = {}
+    for line, document, _ in chunk:
+        numero = document['numero_dossier']
+        if numero in existing:
+            report.skipped.add(numero)
+            report.error(line, f'dossier déjà existant: {numero}')
+        elif numero not in imported and numero not in new_documents:
+            new_documents[numero] = document
+
+    if new_documents:
+        db.session.execute(Document.__table__.insert(), list(new_documents.values()))
+        imported.update(db.session.execute(
+            select(Document.numero_dossier, Document.id).where(Document.numero_dossier.in_(new_documents))
+        ).all())
+        report.documents += len(new_documents)
+
+    states = [
+        dict(state, document_id=imported[document['numero_dossier']])
+        for _, document, state in chunk
+        if state is not None and document['numero_dossier'] in imported
+    ]
+    if states:
+        insert_states(states)
+        report.states += len(states)
+
+    db.session.commit()
+
+
+def import_documents(rows, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Import dossiers and their states from an iterable of dict rows, ``batch_size`` lines per transaction.
+
+    Dossiers already in the database are skipped; states for dossiers created
+    earlier in the same import are attached to them.
+    """
+    report = ImportReport()
+    imported = {}
+    chunk = []
+
+    # Line 1 is the header
+    for line, row in enumerate(rows, start=2):
+        report.rows += 1
+        try:
+            document, state = _parse_row(row)
+        except ValueError as exc:
+            report.error(line, str(exc))
+            continue
+        chunk.append((line, document, state))
+
+        if len(chunk) >= batch_size:
+            _flush_chunk(chunk, imported, report)
+            chunk = []
+            if progress:
+                progress(report)
+
+    if chunk:
+        _flush_chunk(chunk, imported, report)
+    if progress:
+        progress(report)
+    return report
+
+
+@task('import')
+def import_job(job, path, filename, batch_size=DEFAULT_BATCH_SIZE):
+    """Job body: import a file saved by upload_import, then delete it."""
+    try:
+        with open(path, 'rb') as stream:
+            rows = read_rows(stream, filename)
+            report = import_documents(rows, batch_size=batch_size, progress=lambda report: job.progress(report.rows))
+    finally:
+        os.remove(path)
+    return report.to_dict()
+
+
+# ------------------------
+# Entry points
+# ------------------------
+@import_bp.route('/api/import', methods=['POST'])
+def upload_import():
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'success': False, 'message': 'Aucun fichier fourni'}), 400
+    batch_size = max(1, request.form.get('batch_size', DEFAULT_BATCH_SIZE, type=int))
+
+    if request.values.get('background') == '1':
+        # The upload only lives as long as the request: keep a copy for the job
+        os.makedirs(current_app.config['JOB_DIR'], exist_ok=True)
+        extension = os.path.splitext(upload.filename)[1].lower()
+        path = os.path.join(current_app.config['JOB_DIR'], f'upload-{uuid.uuid4().hex}{extension}')
+        upload.save(path)
+        return job_accepted(submit_job('import', {
+            'path': path, 'filename': upload.filename, 'batch_size': batch_size,
+        }))
+
+    try:
+        rows = read_rows(upload.stream, upload.filename)
+    except ValueError as exc:
+        return jsonify({'success': False, 'message': str(exc)}), 400
+
+    report = import_documents(rows, batch_size=batch_size)
+    return jsonify({'success': True, **report.to_dict()})
+
+
+@import_bp.cli.command('import-documents')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True, help='Lignes par transaction.')
+def import_documents_command(path, batch_size):
+    """Importe des dossiers et leurs états depuis un fichier CSV ou XLSX."""
+    def progress(report):
+        click.echo(f'{report.rows} lignes, {report.documents} dossiers, {report.states} états '
+                   f'({report.rows_per_second:.0f} lignes/s)')
+
+    with open(path, 'rb') as stream:
+        try:
+            rows = read_rows(stream, path)
+        except ValueError as exc:
+            raise click.ClickException(str(exc))
+        report = import_documents(rows, batch_size=batch_size, progress=progress)
+
+    click.echo(f'Terminé en {report.elapsed:.1f}s: {report.duplicates} doublons, {len(report.errors)} erreurs')
+    for error in report.errors:
+        click.echo(f"  ligne {error['ligne']}: {error['erreur']}", err=True)
@@ -0,0 +1,190 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import partial, wraps
+
+from flask import (Blueprint, Response, before_render_template, current_app, g, has_request_context, request,
+                   template_rendered)
+from sqlalchemy import event
+
+from extensions import db
+
+# Per-request figures collected in g.timings while the request runs:
+#   sql        statements sent to the database (an executemany counts once)
+#   db         seconds spent executing them
+#   render     seconds spent in render_template
+#   serialize  seconds spent in Document.to_dict
+# They are sent back as a Server-Timing header and accumulated per endpoint for
+# /metrics. Streamed bodies are produced after the headers are sent, so the
+# time spent streaming them appears in neither. Only Flask requests are
+# measured: the async handlers of asgi.py run outside the app and send no
+# Server-Timing header nor /metrics figures.
+
+metrics_bp = Blueprint('metrics', __name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TIMED_FIELDS = ('db', 'render', 'serialize')
+
+
+class RouteMetrics:
+    """Latency histogram and SQL totals per endpoint, in Prometheus exposition format.
+
+    Figures are per process; with several workers each one exposes its own.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, method, status, seconds, timings):
+        with self._lock:
+            route = self._routes.setdefault((endpoint, method), {
+                'buckets': [0] * (len(self.buckets) + 1), 'count': 0, 'sum': 0.0,
+                'sql': 0, 'db': 0.0, 'render': 0.0, 'serialize': 0.0, 'errors': 0,
+            })
+            route['buckets'][bisect_left(self.buckets, seconds)] += 1
+            route['count'] += 1
+            route['sum'] += seconds
+            route['sql'] += timings['sql']
+            for name in TIMED_FIELDS:
+                route[name] += timings[name]
+            if status >= 500:
+                route['errors'] += 1
+
+    def render(self):
+        lines = [
+            '# HELP electrodoc_request_duration_seconds Request latency per endpoint.',
+            '# TYPE electrodoc_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            routes = {key: dict(value, buckets=list(value['buckets'])) for key, value in self._routes.items()}
+        for (endpoint, method), route in sorted(routes.items()):
+            labels = f'endpoint="{endpoint}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), route['buckets']):
+                cumulative += count
+                lines.append(f'electrodoc_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'electrodoc_request_duration_seconds_sum{{{labels}}} {route["sum"]:.6f}')
+            lines.append(f'electrodoc_request_duration_seconds_count{{{labels}}} {route["count"]}')
+
+        counters = [
+            ('sql_statements_total', 'sql', 'SQL statements issued.', 'd'),
+            ('db_seconds_total', 'db', 'Time spent executing SQL.', '.6f'),
+            ('render_seconds_total', 'render', 'Time spent rendering templates.', '.6f'),
+            ('serialize_seconds_total', 'serialize', 'Time spent in Document.to_dict.', '.6f'),
+            ('server_errors_total', 'errors', 'Responses with a 5xx status.', 'd'),
+        ]
+        for name, field, description, fmt in counters:
+            lines.append(f'# HELP electrodoc_{name} {description}')
+            lines.append(f'# TYPE electrodoc_{name} counter')
+            for (endpoint, method), route in sorted(routes.items()):
+                value = format(route[field], fmt)
+                lines.append(f'electrodoc_{name}{{endpoint="{endpoint}",method="{method}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+route_metrics = RouteMetrics()
+
+
+def _timings():
+    return g.get('timings') if has_request_context() else None
+
+
+def timed(field):
+    """Add the run time of the decorated function to g.timings[field] while serving a request."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            timings = _timings()
+            if timings is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timings[field] += time.perf_counter() - start
+        return wrapper
+    return decorator
+
+
+# ------------------------
+# Hooks
+# ------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(app, conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    timings = _timings()
+    if timings is not None:
+        timings['sql'] += 1
+        timings['db'] += elapsed
+    if elapsed * 1000 >= app.config['SLOW_QUERY_MS']:
+        app.logger.warning('Requête lente (%.0f ms): %s', elapsed * 1000, ' '.join(statement.split())[:500])
+
+
+def _forget_failed_query(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_start'):
+        connection.info['query_start'].pop()
+
+
+def _start_render(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None:
+        timings['render_start'] = time.perf_counter()
+
+
+def _end_render(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None and 'render_start' in timings:
+        timings['render'] += time.perf_counter() - timings.pop('render_start')
+
+
+def _start_request():
+    g.timings = {'start': time.perf_counter(), 'sql': 0, 'db': 0.0, 'render': 0.0, 'serialize': 0.0}
+
+
+def _finish_request(response):
+    timings = g.get('timings')
+    if timings is None or request.endpoint == 'metrics.metrics':
+        return response
+    total = time.perf_counter() - timings['start']
+    endpoint = request.endpoint or 'not_found'
+    route_metrics.observe(endpoint, request.method, response.status_code, total, timings)
+
+    if timings['sql'] >= current_app.config['QUERY_COUNT_WARNING']:
+        current_app.logger.warning('%s: %d requêtes SQL pour une seule page (N+1 ?)', endpoint, timings['sql'])
+    if current_app.config['SERVER_TIMING']:
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;desc="{timings["sql"]} SQL";dur={timings["db"] * 1000:.1f}',
+            f'render;dur={timings["render"] * 1000:.1f}',
+            f'serialize;dur={timings["serialize"] * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+    return response
+
+
+def init_instrumentation(app):
+    """Time SQL, template rendering and serialization for every request of ``app``."""
+    app.config.setdefault('SLOW_QUERY_MS', 200)
+    app.config.setdefault('QUERY_COUNT_WARNING', 50)
+    app.config.setdefault('SERVER_TIMING', True)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', partial(_after_cursor_execute, app))
+            event.listen(engine, 'handle_error', _forget_failed_query)
+    before_render_template.connect(_start_render, app)
+    template_rendered.connect(_end_render, app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.register_blueprint(metrics_bp)
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    return Response(route_metrics.render(), mimetype='text/plain; version=0.0.4')
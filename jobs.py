@@ -0,0 +1,396 @@
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import Blueprint, current_app, jsonify, redirect, request, send_file, url_for
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import aliased
+
+from auth import is_logged_in
+from extensions import db
+
+jobs_bp = Blueprint('jobs', __name__, cli_group=None)
+
+# Long operations (imports, exports, reports, mass deletes, stats rebuilds) are
+# queued in the jobs table and run by a dispatcher thread in each process that
+# has JOB_WORKERS > 0, or by a separate `flask run-jobs` process. A job is a task
+# name plus JSON parameters, so any process can claim it. JOB_WORKERS caps the
+# jobs running in one process, JOB_LIMITS caps each task across all processes.
+# Running jobs are heartbeated; one not seen for JOB_STALE_AFTER seconds belongs
+# to a dead process and is marked failed.
+
+JOB_STATES = ('pending', 'running', 'done', 'failed', 'cancelled')
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+DEFAULT_JOB_LIMITS = {'import': 1, 'delete': 1, 'aggregates': 1}
+JOBS_PER_PAGE = 50
+# PostgreSQL advisory lock serializing claims across processes
+CLAIM_LOCK_KEY = 0x6a6f6273
+
+TASKS = {}
+
+
+def task(kind):
+    """Register ``function(job, **params)`` as the body of jobs of this kind."""
+    def decorator(function):
+        TASKS[kind] = function
+        return function
+    return decorator
+
+
+def _now():
+    # Naive UTC, as stored by SQLite
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class JobRecord(db.Model):
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    state = db.Column(db.String(10), nullable=False, default='pending', index=True)
+    params = db.Column(db.Text, nullable=False, default='{}')
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    worker = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=_now)
+    started_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def done(self):
+        return self.state in FINISHED_STATES
+
+    @property
+    def result_data(self):
+        return json.loads(self.result) if self.result else None
+
+    def to_dict(self):
+        def timestamp(value):
+            return value.isoformat() + 'Z' if value else None
+
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'state': self.state,
+            'progress': self.progress,
+            'total': self.total,
+            'result': self.result_data,
+            'error': self.error,
+            'cancel_requested': self.cancel_requested,
+            'created_at': timestamp(self.created_at),
+            'started_at': timestamp(self.started_at),
+            'finished_at': timestamp(self.finished_at),
+        }
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """What a task body sees of its job: progress reporting and cooperative cancellation.
+
+    Cancellation is noticed at the next ``progress()`` call, so bodies should
+    call it between committed chunks; the chunks already committed stay.
+    """
+
+    def __init__(self, runner, id, kind, total=None):
+        self.id = id
+        self.kind = kind
+        self.total = total
+        self.count = 0
+        self.cancelled = threading.Event()
+        self._runner = runner
+        self._saved = 0.0
+
+    def progress(self, count, total=None):
+        self.count = count
+        if total is not None:
+            self.total = total
+        if self.cancelled.is_set():
+            raise JobCancelled()
+        now = time.monotonic()
+        if now - self._saved >= self._runner.config['JOB_PROGRESS_INTERVAL']:
+            self._saved = now
+            self._runner.save(self.id, progress=count, total=self.total, updated_at=_now())
+
+    def track(self, items):
+        """Yield ``items``, counting them as progress."""
+        for count, item in enumerate(items, start=1):
+            yield item
+            self.progress(count)
+
+    def file_path(self, extension):
+        """Where to write this job's output file."""
+        directory = self._runner.config['JOB_DIR']
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f'job-{self.id}.{extension}')
+
+
+class JobRunner:
+    def __init__(self, app):
+        self.app = app
+        self.config = app.config
+        self.worker = None
+        self.workers = 0
+        self._executor = None
+        self._thread = None
+        self._running = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    # ------------------------
+    # Queue
+    # ------------------------
+    def save(self, job_id, **values):
+        with db.engine.begin() as connection:
+            connection.execute(update(JobRecord).where(JobRecord.id == job_id).values(**values))
+
+    def submit(self, kind, params=None, total=None):
+        """Queue a job and return its id. ``params`` must be JSON serializable."""
+        if kind not in TASKS:
+            raise ValueError(f'Type de tâche inconnu: {kind}')
+        with db.engine.begin() as connection:
+            job_id = connection.execute(JobRecord.__table__.insert().values(
+                kind=kind, state='pending', params=json.dumps(params or {}), progress=0, total=total,
+                cancel_requested=False, created_at=_now(),
+            )).inserted_primary_key[0]
+        self._wake.set()
+        return job_id
+
+    def cancel(self, job_id):
+        """Cancel a pending job now, or ask a running one to stop at its next progress report."""
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(JobRecord).where(JobRecord.id == job_id, JobRecord.state == 'pending')
+                .values(state='cancelled', finished_at=_now())
+            )
+            connection.execute(
+                update(JobRecord).where(JobRecord.id == job_id, JobRecord.state == 'running')
+                .values(cancel_requested=True)
+            )
+        with self._lock:
+            job = self._running.get(job_id)
+        if job is not None:
+            job.cancelled.set()
+
+    # ------------------------
+    # Dispatcher
+    # ------------------------
+    def start(self, background=True):
+        """Start dispatching in a daemon thread, once per process (again after a fork).
+
+        With ``background=False`` dispatch in the calling thread until interrupted.
+        """
+        if background and (self.config['JOB_WORKERS'] <= 0 or self.worker == self._worker_name()):
+            return
+        with self._lock:
+            if background and self.worker == self._worker_name():
+                return
+            self.worker = self._worker_name()
+            self._running = {}
+            self.workers = max(1, self.config['JOB_WORKERS'])
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='job')
+            if background:
+                self._thread = threading.Thread(target=self.run_forever, name='job-dispatcher', daemon=True)
+                self._thread.start()
+        if not background:
+            self.run_forever()
+
+    @staticmethod
+    def _worker_name():
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def run_forever(self):
+        while True:
+            self._wake.wait(self.config['JOB_POLL_INTERVAL'])
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self._heartbeat()
+                    self._claim()
+            except Exception:
+                self.app.logger.exception('Répartiteur de tâches')
+
+    def _heartbeat(self):
+        with self._lock:
+            local = dict(self._running)
+        now = _now()
+        with db.engine.begin() as connection:
+            if local:
+                connection.execute(update(JobRecord).where(JobRecord.id.in_(local)).values(updated_at=now))
+                # Cancellations requested through another process
+                for job_id in connection.execute(select(JobRecord.id).where(
+                        JobRecord.id.in_(local), JobRecord.cancel_requested.is_(True))).scalars():
+                    local[job_id].cancelled.set()
+            connection.execute(
+                update(JobRecord)
+                .where(JobRecord.state == 'running',
+                       JobRecord.updated_at < now - timedelta(seconds=self.config['JOB_STALE_AFTER']))
+                .values(state='failed', error='Interrompue: processus arrêté', finished_at=now)
+            )
+
+    def _claim(self):
+        limits = self.config['JOB_LIMITS']
+        while len(self._running) < self.workers:
+            with db.engine.begin() as connection:
+                if connection.dialect.name == 'postgresql':
+                    # Under READ COMMITTED two claims of the same kind would each count the
+                    # running jobs without the other's; held until this transaction ends
+                    connection.execute(select(func.pg_advisory_xact_lock(CLAIM_LOCK_KEY)))
+                running = dict(connection.execute(
+                    select(JobRecord.kind, func.count()).where(JobRecord.state == 'running').group_by(JobRecord.kind)
+                ).all())
+                pending = connection.execute(
+                    select(JobRecord.id, JobRecord.kind, JobRecord.params, JobRecord.total)
+                    .where(JobRecord.state == 'pending').order_by(JobRecord.id).limit(JOBS_PER_PAGE)
+                ).all()
+                claimed = None
+                for row in pending:
+                    if row.kind in limits and running.get(row.kind, 0) >= limits[row.kind]:
+                        continue
+                    # Another process may have claimed it, or one of its kind, since the select
+                    if connection.execute(self._claim_statement(row, limits.get(row.kind))).rowcount == 1:
+                        claimed = row
+                        break
+            if claimed is None:
+                return
+            job = Job(self, claimed.id, claimed.kind, claimed.total)
+            with self._lock:
+                self._running[job.id] = job
+            self._executor.submit(self._run, job, json.loads(claimed.params))
+
+    def _claim_statement(self, row, limit):
+        """UPDATE claiming a pending job, counting the running jobs of its kind in the same statement."""
+        now = _now()
+        statement = update(JobRecord).where(JobRecord.id == row.id, JobRecord.state == 'pending')
+        if limit is not None:
+            other = aliased(JobRecord)
+            running = select(func.count()).select_from(other) \
+                .where(other.kind == row.kind, other.state == 'running').scalar_subquery()
+            statement = statement.where(running < limit)
+        return statement.values(state='running', worker=self.worker, started_at=now, updated_at=now)
+
+    def _run(self, job, params):
+        values = {}
+        with self.app.app_context():
+            try:
+                function = TASKS.get(job.kind)
+                if function is None:
+                    raise ValueError(f'Type de tâche inconnu: {job.kind}')
+                result = function(job, **params)
+                values = {'state': 'done', 'result': json.dumps(result) if result is not None else None}
+            except JobCancelled:
+                values = {'state': 'cancelled'}
+            except Exception as exc:
+                self.app.logger.exception('Tâche %s (%s) en échec', job.id, job.kind)
+                values = {'state': 'failed', 'error': str(exc)}
+            finally:
+                # Roll back whatever the body left open before recording the outcome
+                db.session.remove()
+                try:
+                    self.save(job.id, progress=job.count, total=job.total, finished_at=_now(), **values)
+                except Exception:
+                    self.app.logger.exception('Tâche %s: état non enregistré', job.id)
+                with self._lock:
+                    self._running.pop(job.id, None)
+                self._wake.set()
+
+
+def init_jobs(app):
+    """Attach a job runner to ``app``; its dispatcher starts with the first request."""
+    app.config.setdefault('JOB_WORKERS', 2)
+    app.config.setdefault('JOB_LIMITS', DEFAULT_JOB_LIMITS)
+    app.config.setdefault('JOB_POLL_INTERVAL', 2)
+    app.config.setdefault('JOB_PROGRESS_INTERVAL', 0.5)
+    app.config.setdefault('JOB_STALE_AFTER', 60)
+    app.config.setdefault('JOB_DIR', os.path.join(app.instance_path, 'jobs'))
+
+    runner = JobRunner(app)
+    app.extensions['jobs'] = runner
+    app.before_request(runner.start)
+    app.register_blueprint(jobs_bp)
+
+
+def submit_job(kind, params=None, total=None):
+    return current_app.extensions['jobs'].submit(kind, params, total)
+
+
+def job_accepted(job_id):
+    """202 response pointing at the status of a queued job."""
+    status_url = url_for('jobs.get_job', job_id=job_id)
+    return jsonify({'success': True, 'job_id': job_id, 'status_url': status_url}), 202, {'Location': status_url}
+
+
+# ------------------------
+# Routes
+# ------------------------
+def _job_status(job):
+    status = job.to_dict()
+    if job.state == 'done' and (job.result_data or {}).get('path'):
+        status['download_url'] = url_for('jobs.download_job', job_id=job.id)
+    return status
+
+
+@jobs_bp.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    query = select(JobRecord).order_by(JobRecord.id.desc()).limit(JOBS_PER_PAGE)
+    if request.args.get('state') in JOB_STATES:
+        query = query.where(JobRecord.state == request.args['state'])
+    if request.args.get('kind'):
+        query = query.where(JobRecord.kind == request.args['kind'])
+    return jsonify([_job_status(job) for job in db.session.scalars(query)])
+
+
+@jobs_bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+    return jsonify(_job_status(db.get_or_404(JobRecord, job_id)))
+
+
+@jobs_bp.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    db.get_or_404(JobRecord, job_id)
+    current_app.extensions['jobs'].cancel(job_id)
+    db.session.expire_all()
+    return jsonify(_job_status(db.session.get(JobRecord, job_id)))
+
+
+@jobs_bp.route('/api/jobs/<int:job_id>/download', methods=['GET'])
+def download_job(job_id):
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    job = db.get_or_404(JobRecord, job_id)
+    result = job.result_data or {}
+    if job.state != 'done' or not result.get('path') or not os.path.exists(result['path']):
+        return jsonify({'success': False, 'message': 'Aucun fichier disponible pour cette tâche'}), 404
+    return send_file(result['path'], mimetype=result.get('mimetype'), as_attachment=True,
+                     download_name=result.get('filename'))
+
+
+@jobs_bp.cli.command('run-jobs')
+@click.option('--workers', type=int, help='Tâches simultanées dans ce processus (JOB_WORKERS par défaut).')
+def run_jobs_command(workers):
+    """Exécute les tâches en file dans ce processus, jusqu'à interruption."""
+    runner = current_app.extensions['jobs']
+    if workers is not None:
+        runner.config['JOB_WORKERS'] = workers
+    click.echo(f"{max(1, runner.config['JOB_WORKERS'])} tâches simultanées au plus, Ctrl+C pour arrêter")
+    runner.start(background=False)
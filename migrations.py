@@ -0,0 +1,122 @@
+from sqlalchemy import inspect, text
+from database import trigger_names
+from extensions import db
+from search import init_search_index
+from aggregates import init_stats_tables
+from changes import init_change_log
+from history import init_state_history
+
+# Versioned schema changes for databases created before the current models.
+# db.create_all() only creates missing tables; it never adds indexes to a table
+# that already exists, so every index or structural change also gets a step here.
+# Steps must be idempotent: a fresh database already has what create_all() made.
+
+
+def _create_indexes(connection):
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_document_states_document_state "
+        "ON document_states (document_id, state_type)"
+    ))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_numero_carton ON documents (numero_carton)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_modele ON documents (modele)"))
+
+
+def _normalize_sub_states(connection):
+    columns = {column['name'] for column in inspect(connection).get_columns('document_states')}
+    # Only SQLite databases predate the sub-state table
+    if 'sub_state' in columns and connection.dialect.name == 'sqlite':
+        # The old stats triggers read the column and would block dropping it;
+        # init_stats_tables() below installs the new ones and rebuilds the figures
+        for name in trigger_names(connection, 'stats_'):
+            connection.execute(text(f"DROP TRIGGER {name}"))
+        connection.execute(text(
+            "WITH RECURSIVE split(state_id, part, rest) AS ("
+            "  SELECT id, '', sub_state || ',' FROM document_states WHERE COALESCE(sub_state, '') != ''"
+            "  UNION ALL"
+            "  SELECT state_id, trim(substr(rest, 1, instr(rest, ',') - 1)), substr(rest, instr(rest, ',') + 1)"
+            "  FROM split WHERE rest != ''"
+            ") "
+            "INSERT OR IGNORE INTO document_state_sub_states (state_id, sub_state) "
+            "SELECT state_id, part FROM split WHERE part != ''"
+        ))
+        connection.execute(text("ALTER TABLE document_states DROP COLUMN sub_state"))
+    init_stats_tables(connection)
+
+
+def _add_session_version(connection):
+    columns = {column['name'] for column in inspect(connection).get_columns('user')}
+    if 'session_version' not in columns:
+        # "user" is a reserved word on PostgreSQL
+        connection.execute(text('ALTER TABLE "user" ADD COLUMN session_version INTEGER NOT NULL DEFAULT 0'))
+
+
+def _add_state_history(connection):
+    # No server default: SQLite cannot add a column defaulting to CURRENT_TIMESTAMP,
+    # so existing rows keep NULL timestamps
+    for table in ('documents', 'document_states'):
+        columns = {column['name'] for column in inspect(connection).get_columns(table)}
+        for name in ('created_at', 'updated_at'):
+            if name not in columns:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} TIMESTAMP"))
+    init_state_history(connection)
+
+
+def _reinstall_change_log(connection):
+    # Triggers of the current version, see changes.py
+    init_change_log(connection, replace=True)
+
+
+def _version_changes_by_transaction(connection):
+    # PostgreSQL versions are now made of transaction ids, above every older
+    # version, and need 64 bits; its triggers no longer take a global lock
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("ALTER TABLE document_changes ALTER COLUMN version TYPE BIGINT"))
+    init_change_log(connection, replace=True)
+
+
+MIGRATIONS = [
+    (1, 'Index de recherche plein texte', init_search_index),
+    (2, 'Index document_states et documents', _create_indexes),
+    (3, 'Tables de statistiques agrégées', init_stats_tables),
+    (4, 'Sous-états normalisés', _normalize_sub_states),
+    (5, 'Révocation des sessions utilisateur', _add_session_version),
+    (6, 'Journal des modifications de documents', init_change_log),
+    (7, 'Horodatage et historique des états', _add_state_history),
+    (8, 'Journal des modifications dans l\'ordre des validations', _reinstall_change_log),
+    (9, 'Versions du journal par transaction, sans verrou global', _version_changes_by_transaction),
+]
+
+
+def get_schema_version(connection):
+    connection.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    version = connection.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+
+def run_migrations(engine, logger=None):
+    """Apply every migration newer than the recorded schema version, each in its own transaction."""
+    with engine.begin() as connection:
+        current = get_schema_version(connection)
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {'v': version})
+        if logger:
+            logger.info('Migration %s appliquée: %s', version, description)
+        current = version
+    return current
+
+
+def missing_indexes(engine):
+    """Return (table, index) pairs declared on the models but absent from the database."""
+    inspector = inspect(engine)
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend((table.name, index.name) for index in table.indexes if index.name not in existing)
+    return missing
@@ -0,0 +1,185 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.orm import selectinload
+from extensions import db
+from instrumentation import timed
+
+ALL_ETATS = ['REP', 'HS', 'SWA', 'BRK']
+BRK_SUB_STATES = ['KC', 'Ill']
+
+
+def utcnow():
+    """Naive UTC now, the way SQLite's CURRENT_TIMESTAMP stores it."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _isoformat(moment):
+    return moment.isoformat() if moment else None
+
+
+def _sub_state_order(name):
+    return BRK_SUB_STATES.index(name) if name in BRK_SUB_STATES else len(BRK_SUB_STATES)
+
+
+def sort_sub_states(names):
+    """Sub-state names in BRK_SUB_STATES order, the order the forms and the API show them in."""
+    return sorted(names, key=_sub_state_order)
+
+
+def clean_state(state_type, quantity=None, sub_state=None):
+    """Validate raw state values and return them as DocumentState column values.
+
+    ``quantity`` defaults to 1; ``sub_state`` may be a comma-joined string or a
+    list and is only kept for BRK. Raises ValueError with a user-facing message.
+    """
+    if state_type not in ALL_ETATS:
+        raise ValueError(f'état inconnu: {state_type}')
+
+    if quantity in (None, ''):
+        quantity = 1
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        raise ValueError(f'quantité invalide: {quantity}')
+    if quantity < 1:
+        raise ValueError(f'quantité invalide: {quantity}')
+
+    if isinstance(sub_state, str):
+        sub_state = sub_state.split(',')
+    sub_states = [s.strip() for s in sub_state or [] if s and s.strip()] if state_type == 'BRK' else []
+    sub_states = sorted(dict.fromkeys(sub_states), key=_sub_state_order)
+    unknown = [s for s in sub_states if s not in BRK_SUB_STATES]
+    if unknown:
+        raise ValueError(f"sous-état inconnu: {', '.join(unknown)}")
+
+    return {
+        'state_type': state_type,
+        'sub_state': ','.join(sub_states) if sub_states else None,
+        'quantity': quantity,
+    }
+
+
+# ------------------------
+# Models
+# ------------------------
+class Document(db.Model):
+    __tablename__ = 'documents'
+    id = db.Column(db.Integer, primary_key=True)
+    numero_dossier = db.Column(db.String(100), nullable=False, unique=True)
+    numero_carton = db.Column(db.String(100), nullable=False, index=True)
+    modele = db.Column(db.String(100), nullable=False, index=True)
+    # NULL for documents created before the columns existed
+    created_at = db.Column(db.DateTime, nullable=True, default=utcnow)
+    updated_at = db.Column(db.DateTime, nullable=True, default=utcnow, onupdate=utcnow)
+
+    # Plain list relationship so listings can eager-load it with selectinload()
+    states = db.relationship('DocumentState', backref='document', lazy='select', cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<Document {self.numero_dossier}>'
+
+    @timed('serialize')
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'numero_dossier': self.numero_dossier,
+            'numero_carton': self.numero_carton,
+            'modele': self.modele,
+            'created_at': _isoformat(self.created_at),
+            'updated_at': _isoformat(self.updated_at),
+            'states': [state.to_dict() for state in self.states]
+        }
+
+
+class DocumentState(db.Model):
+    __tablename__ = 'document_states'
+    # Serves state loads per document as well as per-document state_type lookups
+    __table_args__ = (db.Index('ix_document_states_document_state', 'document_id', 'state_type'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
+    state_type = db.Column(db.String(50), nullable=False)
+    quantity = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True, default=utcnow)
+    updated_at = db.Column(db.DateTime, nullable=True, default=utcnow, onupdate=utcnow)
+
+    # Loaded for a whole batch of states with one extra SELECT
+    sub_state_rows = db.relationship('DocumentSubState', lazy='selectin', cascade='all, delete-orphan')
+
+    def get_sub_states(self):
+        return sort_sub_states(row.sub_state for row in self.sub_state_rows)
+
+    @property
+    def sub_state(self):
+        """Comma-joined sub-states, the format the forms and the API have always used."""
+        return ','.join(self.get_sub_states()) or None
+
+    @sub_state.setter
+    def sub_state(self, value):
+        if isinstance(value, str):
+            value = value.split(',')
+        wanted = [name for name in dict.fromkeys(value or []) if name]
+        for row in list(self.sub_state_rows):
+            if row.sub_state not in wanted:
+                self.sub_state_rows.remove(row)
+        existing = {row.sub_state for row in self.sub_state_rows}
+        self.sub_state_rows.extend(DocumentSubState(sub_state=name) for name in wanted if name not in existing)
+
+    def to_dict(self):
+        sub_states = self.get_sub_states()
+        return {
+            'id': self.id,
+            'state_type': self.state_type,
+            'sub_state': ','.join(sub_states) or None,
+            'sub_states': sub_states,
+            'quantity': self.quantity
+        }
+
+
+class DocumentSubState(db.Model):
+    """One BRK sub-state (KC, Ill, ...) of a state, so sub-states can be filtered and counted by index."""
+    __tablename__ = 'document_state_sub_states'
+    __table_args__ = (db.Index('ix_document_state_sub_states_sub_state', 'sub_state', 'state_id'),)
+
+    state_id = db.Column(db.Integer, db.ForeignKey('document_states.id'), primary_key=True)
+    sub_state = db.Column(db.String(50), primary_key=True)
+
+
+def sub_state_rows(state_id, sub_state):
+    """DocumentSubState column dicts for a comma-joined sub_state, for bulk inserts."""
+    return [{'state_id': state_id, 'sub_state': name} for name in sub_state.split(',')] if sub_state else []
+
+
+def insert_states(rows, return_ids=False):
+    """Bulk insert state dicts carrying a comma-joined ``sub_state``, bypassing the ORM.
+
+    States without sub-states go in one executemany; only those with sub-states
+    (or all of them with ``return_ids``) need their new ids read back.
+    Returns the new ids in input order when ``return_ids`` is set.
+    """
+    columns = [{name: value for name, value in row.items() if name != 'sub_state'} for row in rows]
+    if return_ids:
+        returning = list(range(len(rows)))
+    else:
+        returning = [i for i, row in enumerate(rows) if row.get('sub_state')]
+        plain = [columns[i] for i, row in enumerate(rows) if not row.get('sub_state')]
+        if plain:
+            db.session.execute(insert(DocumentState), plain)
+
+    ids = []
+    if returning:
+        ids = db.session.execute(
+            insert(DocumentState).returning(DocumentState.id, sort_by_parameter_order=True),
+            [columns[i] for i in returning]
+        ).scalars().all()
+        sub_states = [sub for i, state_id in zip(returning, ids)
+                      for sub in sub_state_rows(state_id, rows[i].get('sub_state'))]
+        if sub_states:
+            db.session.execute(insert(DocumentSubState), sub_states)
+    return ids if return_ids else None
+
+
+def documents_with_states():
+    """Document query that loads every document's states in one extra SELECT."""
+    return Document.query.options(selectinload(Document.states))
@@ -0,0 +1,391 @@
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+
+from changes import DocumentChange, version_bounds
+from extensions import RoutingSession, db
+from filters import QUANTITY_BUCKETS
+from models import ALL_ETATS, BRK_SUB_STATES, Document, DocumentState, DocumentSubState
+
+try:
+    import numpy as np
+except ImportError:  # optional: without NumPy everything stays on the SQL path
+    np = None
+
+# Optional in-process read model (READ_MODEL=1): documents and states held as
+# NumPy columns, so facet counts, per-carton totals and id scans are array
+# operations instead of queries building ORM objects. Strings are interned:
+# cartons and modeles are int32 codes into one list of names, state types int8
+# indexes into ALL_ETATS, sub-states a bitmask over BRK_SUB_STATES.
+#
+# It is loaded on first use, then catches up through the document change log
+# (changes.py): right away after a commit of this process, and at most
+# READ_MODEL_REFRESH seconds late for writes of other processes. Each process
+# holds its own copy, about 30 bytes per state and 20 per document.
+
+READ_MODEL_REFRESH = 1.0
+# Above this share of the documents changed, reloading is cheaper than patching
+RELOAD_RATIO = 0.2
+LOAD_CHUNK_SIZE = 50000
+ID_CHUNK_SIZE = 500
+# First window of documents an id scan matches, growing fourfold
+ID_SCAN_WINDOW = 4096
+NO_QUANTITY = -1
+
+
+class Columns:
+    """One immutable snapshot of the read model; refreshing builds a new one."""
+
+    def __init__(self, doc_id, doc_carton, doc_modele, state_doc, state_type, quantity, sub_states, names):
+        order = np.argsort(doc_id, kind='stable')
+        self.doc_id = doc_id[order]
+        self.doc_carton = doc_carton[order]
+        self.doc_modele = doc_modele[order]
+        # Row of each state's document, for document-level masks; states whose
+        # document was deleted between the two SELECTs are dropped
+        row = np.searchsorted(self.doc_id, state_doc)
+        found = self.doc_id[np.minimum(row, len(self.doc_id) - 1)] == state_doc if len(self.doc_id) else row < 0
+        order = np.flatnonzero(found)[np.argsort(state_doc[found], kind='stable')]
+        self.state_type = state_type[order]
+        self.quantity = quantity[order]
+        self.sub_states = sub_states[order]
+        self.state_row = row[order]
+        # States are in document order: those of row r are state_start[r] to state_start[r + 1]
+        self.state_start = np.concatenate([[0], np.cumsum(np.bincount(self.state_row, minlength=len(self.doc_id)))])
+
+        # Per document, the bits of its state types, sub-states and quantity
+        # buckets: facet counts are made of these
+        self.doc_types = _document_bits(self.state_row, np.left_shift(1, self.state_type), len(self.doc_id))
+        self.doc_sub_states = _document_bits(self.state_row, self.sub_states, len(self.doc_id))
+        bucket = _quantity_bucket(self.quantity)
+        self.doc_quantities = _document_bits(self.state_row, np.where(bucket >= 0, np.left_shift(1, bucket), 0),
+                                             len(self.doc_id))
+
+        # Document rows grouped by carton, for per-carton totals
+        self.names = names
+        self.carton_order = np.argsort(self.doc_carton, kind='stable')
+        self.carton_start = np.searchsorted(self.doc_carton[self.carton_order], np.arange(len(names.values) + 1))
+        self.name_rank = np.argsort(np.argsort(np.array(names.values, dtype=object))) \
+            if names.values else np.zeros(0, dtype=np.int64)
+
+    @property
+    def nbytes(self):
+        return sum(value.nbytes for value in vars(self).values() if isinstance(value, np.ndarray))
+
+    def __len__(self):
+        return len(self.doc_id)
+
+    # ------------------------
+    # Masks
+    # ------------------------
+    def match(self, params, low=0, high=None):
+        """Boolean mask over document rows ``low`` to ``high`` for filters.filter_params values.
+
+        ``search`` is not supported: callers send searches to SQL.
+        """
+        high = len(self.doc_id) if high is None else high
+        mask = np.ones(high - low, dtype=bool)
+        if params['carton']:
+            mask &= np.isin(self.doc_carton[low:high], self.names.codes(params['carton']))
+        if params['modele']:
+            mask &= np.isin(self.doc_modele[low:high], self.names.codes(params['modele']))
+
+        types = sum(1 << ALL_ETATS.index(value) for value in params['state_type'])
+        sub_states = sum(1 << BRK_SUB_STATES.index(value) for value in params['sub_state'])
+        quantity_min, quantity_max = params['quantity_min'], params['quantity_max']
+        if quantity_min is None and quantity_max is None and not (types and sub_states):
+            # A single state filter: the document bits answer it
+            if types:
+                mask &= (self.doc_types[low:high] & types) != 0
+            if sub_states:
+                mask &= (self.doc_sub_states[low:high] & sub_states) != 0
+            return mask
+
+        # Same semantics as the EXISTS of filter_criteria: one state row meets every state filter
+        first, last = self.state_start[low], self.state_start[high]
+        state = np.ones(last - first, dtype=bool)
+        quantity = self.quantity[first:last]
+        if types:
+            state &= (np.left_shift(1, self.state_type[first:last]) & types) != 0
+        if sub_states:
+            state &= (self.sub_states[first:last] & sub_states) != 0
+        if quantity_min is not None:
+            state &= quantity >= quantity_min
+        if quantity_max is not None:
+            state &= (quantity <= quantity_max) & (quantity != NO_QUANTITY)
+        has_state = np.zeros(high - low, dtype=bool)
+        has_state[self.state_row[first:last][state] - low] = True
+        return mask & has_state
+
+    def ids_after(self, params, after, limit, mask=None):
+        """Ids of matching documents after ``after``, in id order, at most ``limit``.
+
+        Without a precomputed ``mask``, documents are matched in growing windows
+        from ``after`` on, so a page stops early like the SQL keyset query.
+        """
+        start = int(np.searchsorted(self.doc_id, after, side='right'))
+        if mask is not None:
+            return self.doc_id[np.flatnonzero(mask[start:])[:limit] + start].tolist()
+
+        ids = []
+        window = ID_SCAN_WINDOW
+        while start < len(self.doc_id) and len(ids) < limit:
+            end = min(len(self.doc_id), start + window)
+            rows = np.flatnonzero(self.match(params, start, end))[:limit - len(ids)] + start
+            ids.extend(self.doc_id[rows].tolist())
+            start, window = end, window * 4
+        return ids
+
+    # ------------------------
+    # Aggregations
+    # ------------------------
+    def facet_counts(self, mask, limit):
+        """Same result as filters.facet_counts for the documents in ``mask``."""
+        def count_bits(bits, labels):
+            selected = bits[mask]
+            return {label: int(np.count_nonzero(selected & (1 << bit))) for bit, label in enumerate(labels)}
+
+        facets = {
+            'state_type': count_bits(self.doc_types, ALL_ETATS),
+            'sub_state': count_bits(self.doc_sub_states, BRK_SUB_STATES),
+            'quantity': count_bits(self.doc_quantities, [label for _, _, label in QUANTITY_BUCKETS]),
+            'carton': self._top(self.doc_carton[mask], limit),
+            'modele': self._top(self.doc_modele[mask], limit),
+        }
+        return int(np.count_nonzero(mask)), facets
+
+    def _top(self, codes, limit):
+        counts = np.bincount(codes, minlength=len(self.names.values))
+        present = np.flatnonzero(counts)
+        # Largest first, then by name, like the SQL version
+        present = present[np.lexsort((self.name_rank[present], -counts[present]))][:limit]
+        return [{'value': self.names.values[code], 'count': int(counts[code])} for code in present]
+
+    def carton_state_totals(self, cartons):
+        """Same result as cartons.carton_state_totals."""
+        totals = {}
+        for carton, code in zip(cartons, self.names.codes(cartons).tolist()):
+            sums = np.zeros(len(ALL_ETATS))
+            if code < len(self.carton_start) - 1:
+                rows = self.carton_order[self.carton_start[code]:self.carton_start[code + 1]]
+                states = _ranges(self.state_start[rows], self.state_start[rows + 1])
+                sums = np.bincount(self.state_type[states], weights=np.maximum(self.quantity[states], 0),
+                                   minlength=len(ALL_ETATS))
+            totals[carton] = dict(zip(ALL_ETATS, (int(value) for value in sums)))
+        return totals
+
+    def state_totals(self):
+        """{state_type: {'count', 'quantity'}}, the by_state_type figures of the stats page."""
+        counts = np.bincount(self.state_type, minlength=len(ALL_ETATS))
+        quantities = np.bincount(self.state_type, weights=np.maximum(self.quantity, 0), minlength=len(ALL_ETATS))
+        return {etat: {'count': int(counts[i]), 'quantity': int(quantities[i])} for i, etat in enumerate(ALL_ETATS)}
+
+
+class Names:
+    """Interned carton/modele names: code -> name list and name -> code dict, append-only."""
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def code(self, name):
+        code = self.index.get(name)
+        if code is None:
+            code = self.index[name] = len(self.values)
+            self.values.append(name)
+        return code
+
+    def codes(self, names):
+        # Unknown names get a code no document has
+        missing = len(self.values)
+        return np.array([self.index.get(name, missing) for name in names], dtype=np.int64)
+
+    def copy(self):
+        names = Names()
+        names.values = list(self.values)
+        names.index = dict(self.index)
+        return names
+
+
+def _document_bits(rows, bits, size):
+    # OR of the bits of each document's states
+    result = np.zeros(size, dtype=np.uint8)
+    np.bitwise_or.at(result, rows, bits.astype(np.uint8))
+    return result
+
+
+def _ranges(starts, ends):
+    # Concatenated aranges [start, end) without a Python loop
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(len(offsets))
+
+
+def _quantity_bucket(quantity):
+    # Index into QUANTITY_BUCKETS, -1 for a missing quantity
+    lows = np.array([low for low, _, _ in QUANTITY_BUCKETS])
+    bucket = np.searchsorted(lows, quantity, side='right') - 1
+    bucket[quantity == NO_QUANTITY] = -1
+    return bucket
+
+
+# ------------------------
+# Loading
+# ------------------------
+def _selections(document_ids):
+    documents = select(Document.id, Document.numero_carton, Document.modele)
+    states = select(DocumentState.id, DocumentState.document_id, DocumentState.state_type, DocumentState.quantity)
+    sub_states = select(DocumentSubState.state_id, DocumentSubState.sub_state)
+    if document_ids is None:
+        yield documents, states, sub_states
+        return
+    for start in range(0, len(document_ids), ID_CHUNK_SIZE):
+        chunk = document_ids[start:start + ID_CHUNK_SIZE]
+        yield (documents.where(Document.id.in_(chunk)),
+               states.where(DocumentState.document_id.in_(chunk)),
+               sub_states.join(DocumentState, DocumentState.id == DocumentSubState.state_id)
+               .where(DocumentState.document_id.in_(chunk)))
+
+
+def _fetch_columns(connection, statement):
+    # Plain Core rows, transposed chunk by chunk: no ORM objects, no per-row Python work
+    result = connection.execute(statement)
+    while rows := result.fetchmany(LOAD_CHUNK_SIZE):
+        yield zip(*rows)
+
+
+def _read_columns(session, names, document_ids=None):
+    """Column arrays of every document (or of ``document_ids``) and of their states."""
+    connection = session.connection()
+    type_codes = {etat: i for i, etat in enumerate(ALL_ETATS)}
+    sub_state_bits = {name: 1 << i for i, name in enumerate(BRK_SUB_STATES)}
+    doc_id, doc_carton, doc_modele = [], [], []
+    state_id, state_doc, state_type, quantity = [], [], [], []
+    sub_state_id, sub_state_bit = [], []
+    for documents, states, sub_states in _selections(document_ids):
+        for ids, cartons, modeles in _fetch_columns(connection, documents):
+            doc_id.extend(ids)
+            doc_carton.extend(map(names.code, cartons))
+            doc_modele.extend(map(names.code, modeles))
+        for ids, owners, types, quantities in _fetch_columns(connection, states):
+            state_id.extend(ids)
+            state_doc.extend(owners)
+            state_type.extend(type_codes.get(value, -1) for value in types)
+            quantity.extend(NO_QUANTITY if value is None else value for value in quantities)
+        for ids, values in _fetch_columns(connection, sub_states):
+            sub_state_id.extend(ids)
+            sub_state_bit.extend(sub_state_bits.get(value, 0) for value in values)
+
+    state_id = np.array(state_id, dtype=np.int64)
+    state_type = np.array(state_type, dtype=np.int8)
+    # Sub-state rows become a bitmask on their state
+    bits = np.zeros(len(state_id), dtype=np.uint8)
+    if sub_state_id:
+        order = np.argsort(state_id)
+        position = np.searchsorted(state_id, np.array(sub_state_id, dtype=np.int64), sorter=order)
+        position = np.minimum(position, len(state_id) - 1)
+        owner = order[position]
+        known = state_id[owner] == sub_state_id
+        np.bitwise_or.at(bits, owner[known], np.array(sub_state_bit, dtype=np.uint8)[known])
+    # State types outside ALL_ETATS are left out, as the SQL facets ignore them
+    keep = state_type >= 0
+    return (np.array(doc_id, dtype=np.int64), np.array(doc_carton, dtype=np.int32),
+            np.array(doc_modele, dtype=np.int32), np.array(state_doc, dtype=np.int64)[keep],
+            state_type[keep], np.array(quantity, dtype=np.int32)[keep], bits[keep])
+
+
+class ReadModel:
+    def __init__(self, refresh=READ_MODEL_REFRESH):
+        self.refresh_interval = refresh
+        self.columns = None
+        self.version = 0
+        self.stale = True
+        self.checked = 0.0
+        self.loaded_in = None
+        self._lock = threading.Lock()
+
+    def current(self, session=None):
+        """The up-to-date Columns snapshot, loading or catching up first if needed."""
+        if self.columns is not None and not self.stale and time.monotonic() - self.checked < self.refresh_interval:
+            return self.columns
+        with self._lock:
+            session = session or db.session
+            if self.columns is None:
+                self._load(session)
+            else:
+                self._catch_up(session)
+            self.checked = time.monotonic()
+        return self.columns
+
+    def _load(self, session):
+        start = time.perf_counter()
+        # The version is read first: changes made during the load are applied again later
+        self.version = session.execute(version_bounds(db.engine.dialect.name)).one()[1] or 0
+        self.stale = False
+        names = Names()
+        self.columns = Columns(*_read_columns(session, names), names)
+        self.loaded_in = time.perf_counter() - start
+
+    def _catch_up(self, session):
+        self.stale = False
+        oldest, latest = session.execute(version_bounds(db.engine.dialect.name)).one()
+        if latest is None or latest <= self.version:
+            return
+        if oldest is not None and self.version < oldest - 1:
+            # The log was pruned past our version
+            return self._load(session)
+
+        changed = session.scalars(
+            select(DocumentChange.document_id).where(DocumentChange.version > self.version,
+                                                     DocumentChange.version <= latest).distinct()
+        ).all()
+        if len(changed) > RELOAD_RATIO * max(len(self.columns), 1):
+            return self._load(session)
+
+        columns = self.columns
+        names = columns.names.copy()
+        fresh = _read_columns(session, names, changed)
+        keep_documents = ~np.isin(columns.doc_id, changed)
+        state_doc = columns.doc_id[columns.state_row]
+        keep_states = ~np.isin(state_doc, changed)
+        self.columns = Columns(
+            np.concatenate([columns.doc_id[keep_documents], fresh[0]]),
+            np.concatenate([columns.doc_carton[keep_documents], fresh[1]]),
+            np.concatenate([columns.doc_modele[keep_documents], fresh[2]]),
+            np.concatenate([state_doc[keep_states], fresh[3]]),
+            np.concatenate([columns.state_type[keep_states], fresh[4]]),
+            np.concatenate([columns.quantity[keep_states], fresh[5]]),
+            np.concatenate([columns.sub_states[keep_states], fresh[6]]),
+            names,
+        )
+        self.version = latest
+
+    def mark_stale(self):
+        self.stale = True
+
+
+def init_read_model(app):
+    """Register the read model if READ_MODEL is set and NumPy is installed."""
+    app.config.setdefault('READ_MODEL', False)
+    app.config.setdefault('READ_MODEL_REFRESH', READ_MODEL_REFRESH)
+    if not app.config['READ_MODEL']:
+        return
+    if np is None:
+        app.logger.warning('READ_MODEL ignoré: le paquet numpy est absent')
+        return
+    app.extensions['read_model'] = ReadModel(app.config['READ_MODEL_REFRESH'])
+
+
+def read_model():
+    """This app's ReadModel, or None when it is off."""
+    return current_app.extensions.get('read_model') if has_app_context() else None
+
+
+# Registered ahead of the response cache listener, which consumes the flag
+@event.listens_for(RoutingSession, 'after_commit', insert=True)
+def _refresh_on_commit(session):
+    model = read_model()
+    if model is not None and session.info.get('cache_stale'):
+        model.mark_stale()
@@ -0,0 +1,129 @@
+import os
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, current_app, redirect, render_template, request, stream_with_context, url_for
+from sqlalchemy import func, select
+
+from api import iter_documents
+from auth import is_logged_in
+from database import read_only
+from extensions import db
+from jobs import JobRecord, submit_job, task
+from models import Document
+from search import search_criterion
+
+reports_bp = Blueprint('reports', __name__)
+
+# Above this many dossiers, or for a PDF, the report is written to a file by a
+# background job instead of being streamed by the request worker.
+REPORT_INLINE_LIMIT = 500
+REPORT_FORMATS = {'html': 'text/html', 'pdf': 'application/pdf'}
+
+
+def report_selection(args):
+    """Read a carton, a search or an id range (start/end) from query args, or raise ValueError."""
+    selection = {
+        'carton': args.get('carton', '').strip(),
+        'search': args.get('search', '').strip(),
+        'start': args.get('start', type=int),
+        'end': args.get('end', type=int),
+    }
+    if not (selection['carton'] or selection['search']
+            or selection['start'] is not None or selection['end'] is not None):
+        raise ValueError('Précisez un carton, une recherche ou un intervalle de dossiers (start/end)')
+    return selection
+
+
+def report_criteria(selection, dialect):
+    """Return (criteria, title) for a selection built by report_selection."""
+    if selection['carton']:
+        return [Document.numero_carton == selection['carton']], f"Carton {selection['carton']}"
+    if selection['search']:
+        return [search_criterion(selection['search'], dialect)], f"Recherche « {selection['search']} »"
+    criteria = []
+    if selection['start'] is not None:
+        criteria.append(Document.id >= selection['start'])
+    if selection['end'] is not None:
+        criteria.append(Document.id <= selection['end'])
+    return criteria, f"Dossiers #{selection['start'] or 1} à #{selection['end'] or 'fin'}"
+
+
+def render_report(documents, title, total):
+    """Yield the report HTML chunk by chunk while ``documents`` are iterated.
+
+    Fed by api.iter_documents, each batch of dossiers loads its states and
+    sub-states in two more queries, so a report costs three queries per
+    API_BATCH_SIZE dossiers whatever its size.
+    """
+    template = current_app.jinja_env.get_template('print_report.html')
+    return template.generate(documents=documents, title=title, total=total, now=datetime.now())
+
+
+@task('report')
+def write_report(job, selection, fmt):
+    """Job body: write the report file and return where to download it."""
+    if fmt == 'pdf':
+        try:
+            from weasyprint import HTML
+        except ImportError:
+            raise ValueError("L'export PDF nécessite le paquet weasyprint.")
+    criteria, title = report_criteria(selection, db.engine.dialect.name)
+
+    html_path = job.file_path('html')
+    with open(html_path, 'w', encoding='utf-8') as output:
+        for chunk in render_report(job.track(iter_documents(criteria)), title, job.total):
+            output.write(chunk)
+    path = html_path
+    if fmt == 'pdf':
+        path = job.file_path('pdf')
+        HTML(filename=html_path).write_pdf(path)
+        os.remove(html_path)
+    return {'path': path, 'mimetype': REPORT_FORMATS[fmt], 'filename': f'rapport-{job.id}.{fmt}'}
+
+
+# ------------------------
+# Routes
+# ------------------------
+@reports_bp.route('/document/<int:id>/print')
+def print_document(id):
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+    doc = db.get_or_404(Document, id)
+    return render_template('print_document.html', doc=doc, now=datetime.now())
+
+
+@reports_bp.route('/reports/print')
+@read_only
+def print_report():
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    fmt = request.args.get('format', 'html')
+    if fmt not in REPORT_FORMATS:
+        return {'success': False, 'message': f'Format inconnu: {fmt}'}, 400
+    try:
+        selection = report_selection(request.args)
+    except ValueError as exc:
+        return {'success': False, 'message': str(exc)}, 400
+
+    criteria, title = report_criteria(selection, db.engine.dialect.name)
+    total = db.session.scalar(select(func.count()).select_from(Document).where(*criteria))
+
+    limit = current_app.config.get('REPORT_INLINE_LIMIT', REPORT_INLINE_LIMIT)
+    if fmt == 'html' and total <= limit:
+        documents = iter_documents(criteria)
+        return Response(stream_with_context(render_report(documents, title, total)), mimetype='text/html')
+
+    job_id = submit_job('report', {'selection': selection, 'fmt': fmt}, total=total)
+    return redirect(url_for('reports.report_status', job_id=job_id))
+
+
+@reports_bp.route('/reports/<int:job_id>')
+def report_status(job_id):
+    if not is_logged_in():
+        return redirect(url_for('auth.login'))
+
+    job = db.get_or_404(JobRecord, job_id)
+    if job.kind != 'report':
+        abort(404)
+    return render_template('report_status.html', job=job)
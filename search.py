@@ -0,0 +1,108 @@
+from sqlalchemy import column, event, or_, select, table, text
+from extensions import db
+from models import Document
+
+# SQLite FTS5 shadow table over the searchable Document columns. The trigram
+# tokenizer indexes every 3-character window, so MATCH answers substring and
+# prefix searches from the index instead of a LIKE '%x%' table scan.
+FTS_TABLE = 'documents_fts'
+MIN_INDEXED_LENGTH = 3
+# bm25 scores every row it ranks. Shorter terms (DOS00, MOD-1) match a large
+# share of the table and are listed in id order instead; longer ones are
+# ranked among their first RANK_CANDIDATES matches only.
+RANKED_MIN_LENGTH = 7
+RANK_CANDIDATES = 500
+SEARCH_COLUMNS = ('numero_dossier', 'numero_carton', 'modele')
+
+fts = table(FTS_TABLE, column('rowid'), column('rank'))
+
+FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        numero_dossier, numero_carton, modele,
+        content='documents', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS documents_fts_ai AFTER INSERT ON documents BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, numero_dossier, numero_carton, modele)
+        VALUES (new.id, new.numero_dossier, new.numero_carton, new.modele);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS documents_fts_ad AFTER DELETE ON documents BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, numero_dossier, numero_carton, modele)
+        VALUES ('delete', old.id, old.numero_dossier, old.numero_carton, old.modele);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS documents_fts_au AFTER UPDATE ON documents BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, numero_dossier, numero_carton, modele)
+        VALUES ('delete', old.id, old.numero_dossier, old.numero_carton, old.modele);
+        INSERT INTO {FTS_TABLE}(rowid, numero_dossier, numero_carton, modele)
+        VALUES (new.id, new.numero_dossier, new.numero_carton, new.modele);
+    END""",
+]
+
+# PostgreSQL has no FTS5; pg_trgm GIN indexes serve the same ILIKE '%x%' searches
+PG_TRGM_DDL = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"] + [
+    f"CREATE INDEX IF NOT EXISTS ix_documents_{name}_trgm ON documents USING gin ({name} gin_trgm_ops)"
+    for name in SEARCH_COLUMNS
+]
+
+
+def init_search_index(connection):
+    """Create the FTS table and its sync triggers, indexing existing rows if it is new."""
+    if connection.dialect.name == 'postgresql':
+        for statement in PG_TRGM_DDL:
+            connection.execute(text(statement))
+        return
+    if connection.dialect.name != 'sqlite':
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"), {'name': FTS_TABLE}
+    ).first()
+    for statement in FTS_DDL:
+        connection.execute(text(statement))
+    if not exists:
+        connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+@event.listens_for(Document.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    # Fresh databases get the index from db.create_all()
+    init_search_index(connection)
+
+
+def _match_expression(search):
+    # Quote the term so FTS5 treats it as a literal phrase, not query syntax
+    return text(f"{FTS_TABLE} MATCH :fts_query").bindparams(fts_query='"' + search.replace('"', '""') + '"')
+
+
+def _uses_index(search, dialect):
+    return len(search) >= MIN_INDEXED_LENGTH and dialect == 'sqlite'
+
+
+def search_criterion(search, dialect):
+    """WHERE clause keeping the documents matching ``search`` in dossier, carton or modele."""
+    if not _uses_index(search, dialect):
+        # Too short for a trigram lookup; these terms are rare and cheap to scan.
+        # ILIKE on PostgreSQL matches SQLite's case-insensitive LIKE and uses the trigram indexes
+        operator = 'icontains' if dialect == 'postgresql' else 'contains'
+        return or_(*(getattr(getattr(Document, name), operator)(search) for name in SEARCH_COLUMNS))
+    return Document.id.in_(select(fts.c.rowid).where(_match_expression(search)))
+
+
+def apply_search(query, search, ranked=False, dialect=None):
+    """Restrict a Document query (or select()) to rows matching ``search``.
+
+    With ``ranked`` the results are ordered best match first (bm25) for terms
+    of RANKED_MIN_LENGTH characters or more, by id otherwise, ties by id;
+    without it the query's own ordering is left untouched. ``dialect``
+    defaults to the app's engine; callers on another engine pass theirs.
+    """
+    dialect = dialect or db.engine.dialect.name
+    if not ranked:
+        return query.filter(search_criterion(search, dialect))
+    if not _uses_index(search, dialect):
+        return query.filter(search_criterion(search, dialect)).order_by(Document.id)
+    if len(search) < RANKED_MIN_LENGTH:
+        # The index drives the join in rowid order, so a page stops reading matches once full
+        return query.join(fts, fts.c.rowid == Document.id) \
+            .filter(_match_expression(search)).order_by(fts.c.rowid)
+    candidates = select(fts.c.rowid, fts.c.rank).where(_match_expression(search)) \
+        .limit(RANK_CANDIDATES).subquery()
+    return query.join(candidates, candidates.c.rowid == Document.id).order_by(candidates.c.rank, Document.id)
@@ -0,0 +1,83 @@
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, insert
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, init_database  # noqa: E402
+from extensions import db  # noqa: E402
+
+PASSWORD = 'secret'
+
+
+@pytest.fixture
+def app_config():
+    """Settings laid over the test defaults; override in a module to turn the cache, compression... back on."""
+    return {}
+
+
+@pytest.fixture
+def app(app_config):
+    """App on an empty in-memory database, with one user and no response cache or job workers."""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'TESTING': True,
+        'JOB_WORKERS': 0,
+        'CACHE_TTL': 0,
+        'COMPRESSION': False,
+        'SLOW_QUERY_MS': float('inf'),
+        'QUERY_COUNT_WARNING': float('inf'),
+        **app_config,
+    })
+    with app.app_context():
+        from auth import User
+
+        init_database()
+        db.session.execute(insert(User), [{'username': 'user0', 'password': generate_password_hash(PASSWORD)}])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'user0', 'password': PASSWORD})
+    return client
+
+
+def add_documents(count):
+    """Add ``count`` dossiers, each with a plain state and a BRK state carrying two sub-states."""
+    from models import Document, insert_states
+
+    first = db.session.query(db.func.coalesce(db.func.max(Document.id), 0)).scalar() + 1
+    db.session.execute(insert(Document), [
+        {'numero_dossier': f'DOS{i:06d}', 'numero_carton': f'CRT{i // 10:04d}', 'modele': f'MOD-{i % 3}'}
+        for i in range(first, first + count)
+    ])
+    states = []
+    for document_id in range(first, first + count):
+        states.append({'document_id': document_id, 'state_type': 'REP', 'quantity': 1})
+        states.append({'document_id': document_id, 'state_type': 'BRK', 'sub_state': 'KC,Ill', 'quantity': 2})
+    insert_states(states)
+    db.session.commit()
+
+
+@contextmanager
+def recorded_statements():
+    """Collect the SQL statements the app's engine executes inside the block."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
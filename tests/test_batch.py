@@ -0,0 +1,83 @@
+"""Batch state operations: validated up front, written all or nothing."""
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+import batch
+from batch import apply_operations
+from conftest import add_documents
+from extensions import db
+from models import DocumentState
+
+
+def state_rows():
+    return db.session.execute(
+        select(DocumentState.id, DocumentState.state_type, DocumentState.quantity).order_by(DocumentState.id)
+    ).all()
+
+
+def test_operations_are_applied(app):
+    add_documents(2)
+    status, results = apply_operations([
+        {'op': 'add', 'document_id': 1, 'state_type': 'REP', 'quantity': 3},
+        {'op': 'update', 'id': 2, 'state_type': 'BRK', 'quantity': 5, 'sub_state': 'KC'},
+        {'op': 'delete', 'id': 3},
+    ])
+    assert status == 200
+    assert all(result['success'] for result in results)
+    rows = state_rows()
+    assert (2, 'BRK', 5) in rows
+    assert 3 not in [row.id for row in rows]
+    assert (results[0]['id'], 'REP', 3) in rows
+
+
+@pytest.mark.parametrize('operation, message', [
+    ({'op': 'add', 'document_id': True, 'state_type': 'REP'}, 'document introuvable'),
+    ({'op': 'add', 'document_id': 99, 'state_type': 'REP'}, 'document introuvable'),
+    ({'op': 'add', 'document_id': 1, 'state_type': 'XXX'}, 'état inconnu'),
+    ({'op': 'add', 'document_id': 1, 'state_type': 'REP', 'quantity': 0}, 'quantité invalide'),
+    ({'op': 'add', 'document_id': 1, 'state_type': 'BRK', 'sub_state': 'Nope'}, 'sous-état inconnu'),
+    ({'op': 'update', 'id': True, 'state_type': 'REP'}, 'état introuvable'),
+    ({'op': 'delete', 'id': False}, 'état introuvable'),
+    ({'op': 'delete', 'id': '1'}, 'état introuvable'),
+    ({'op': 'move', 'id': 1}, "type d'opération inconnu"),
+])
+def test_one_invalid_operation_rejects_the_batch(app, operation, message):
+    add_documents(1)
+    before = state_rows()
+    status, results = apply_operations([{'op': 'delete', 'id': 1}, operation])
+    assert status == 400
+    assert [result['index'] for result in results] == [1]
+    assert results[0]['message'].startswith(message)
+    assert state_rows() == before
+
+
+def test_states_of_another_document_are_refused(app):
+    add_documents(2)
+    other = db.session.scalar(select(DocumentState.id).where(DocumentState.document_id == 2).limit(1))
+    status, results = apply_operations([{'op': 'delete', 'id': other}], document_id=1)
+    assert status == 400
+    assert results[0]['message'] == f'état introuvable: {other}'
+
+
+def test_failed_write_is_rolled_back(app, client, monkeypatch):
+    add_documents(1)
+    before = state_rows()
+
+    def fail(state_id, sub_state):
+        raise OperationalError('INSERT', {}, Exception('disk I/O error'))
+
+    # Fails after the adds and updates have been sent, before the commit
+    monkeypatch.setattr(batch, 'sub_state_rows', fail)
+    with pytest.raises(OperationalError):
+        client.post('/api/states:batch', json={'operations': [
+            {'op': 'add', 'document_id': 1, 'state_type': 'REP'},
+            {'op': 'update', 'id': 1, 'state_type': 'REP', 'quantity': 9},
+        ]})
+    assert state_rows() == before
+    assert db.session.scalar(select(func.count()).select_from(DocumentState)) == 2
+
+
+def test_mass_delete_refuses_boolean_ids(client):
+    response = client.post('/api/documents:delete', json={'ids': [1, True]})
+    assert response.status_code == 400
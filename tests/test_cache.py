@@ -0,0 +1,70 @@
+"""Response cache: conditional GETs and invalidation on every write path."""
+import pytest
+from sqlalchemy import text
+
+from conftest import add_documents
+from extensions import db
+
+LISTING = '/api/documents?limit=5'
+
+
+@pytest.fixture
+def app_config():
+    return {'CACHE_TTL': 30}
+
+
+def test_unchanged_listing_is_not_modified(client):
+    add_documents(3)
+    first = client.get(LISTING)
+    assert first.status_code == 200 and first.headers['ETag']
+
+    second = client.get(LISTING, headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert second.data == b''
+
+
+def test_listing_is_served_from_the_cache(client):
+    add_documents(3)
+    first = client.get(LISTING)
+    # Bypasses the session, so nothing tells the cache
+    with db.engine.begin() as connection:
+        connection.execute(text("UPDATE documents SET modele = 'RAW' WHERE id = 1"))
+    assert client.get(LISTING).data == first.data
+
+
+def add(client):
+    client.post('/add', data={'numero_dossier': 'NEW000001', 'numero_carton': 'CRT9999', 'modele': 'MOD-N',
+                              'etats': ['REP'], 'quantities': ['1']})
+
+
+def edit(client):
+    client.post('/edit/1', data={'numero_dossier': 'DOS000001', 'numero_carton': 'CRT0000', 'modele': 'MOD-E',
+                                 'etats': ['REP'], 'quantities': ['1']})
+
+
+def delete(client):
+    client.post('/delete/2')
+
+
+@pytest.mark.parametrize('write, changed', [(add, b'NEW000001'), (edit, b'MOD-E'), (delete, b'DOS000002')])
+def test_writes_invalidate_the_listing(client, write, changed):
+    add_documents(3)
+    first = client.get('/api/documents?limit=10')
+    write(client)
+
+    second = client.get('/api/documents?limit=10', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert (changed in first.data) != (changed in second.data)
+
+
+@pytest.mark.parametrize('write, changed', [(add, b'NEW000001'), (edit, b'MOD-E'), (delete, b'DOS000002')])
+def test_writes_invalidate_the_dashboard(client, write, changed):
+    add_documents(3)
+    first = client.get('/dashboard').data
+    write(client)
+    client.get('/dashboard')  # shows the flashed message, never cached
+    second = client.get('/dashboard').data
+    assert (changed in first) != (changed in second)
+    assert client.get('/dashboard').data == second
@@ -0,0 +1,45 @@
+"""Carton-wide state assignment and the aggregates its set-based statements maintain."""
+from sqlalchemy import select
+
+from aggregates import StatAggregate, rebuild_stats
+from conftest import add_documents
+from extensions import db
+from models import Document
+
+
+def stats():
+    return {(row.dimension, row.key): (row.count, row.quantity)
+            for row in StatAggregate.query.filter(StatAggregate.count != 0)}
+
+
+def states_of(carton):
+    documents = Document.query.filter_by(numero_carton=carton).order_by(Document.id)
+    return [sorted((state['state_type'], state['quantity'], state['sub_state'])
+                   for state in document.to_dict()['states']) for document in documents]
+
+
+def test_assign_state_to_carton(app, client):
+    add_documents(25)
+    untouched = states_of('CRT0002')
+
+    response = client.post('/api/cartons/CRT0001/states', json={'state_type': 'BRK', 'quantity': 4, 'sub_state': 'Ill'})
+    assert response.get_json() == {'success': True, 'updated': 10, 'inserted': 0}
+    response = client.post('/api/cartons/CRT0001/states', json={'state_type': 'HS', 'quantity': 3})
+    assert response.get_json() == {'success': True, 'updated': 0, 'inserted': 10}
+
+    assert states_of('CRT0001') == [[('BRK', 4, 'Ill'), ('HS', 3, None), ('REP', 1, None)]] * 10
+    assert states_of('CRT0002') == untouched
+
+    triggered = stats()
+    assert triggered[('state_type', 'HS')] == (10, 30)
+    assert triggered[('state_type', 'BRK')] == (25, 15 * 2 + 10 * 4)
+    assert triggered[('sub_state', 'KC')] == (15, 30)
+    assert triggered[('sub_state', 'Ill')] == (25, 70)
+    rebuild_stats(db.session.connection())
+    assert stats() == triggered
+
+
+def test_assign_state_rejects_invalid_values(client):
+    response = client.post('/api/cartons/CRT0001/states', json={'state_type': 'BRK', 'sub_state': 'Nope'})
+    assert response.status_code == 400
+    assert db.session.scalar(select(StatAggregate.count).where(StatAggregate.key == 'states')) in (None, 0)
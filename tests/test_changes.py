@@ -0,0 +1,58 @@
+"""Document change feed."""
+from sqlalchemy import text, update
+from sqlalchemy.dialects import postgresql
+
+from changes import _triggers, changed_documents, version_bounds
+from conftest import add_documents
+from extensions import db
+from models import Document
+
+
+def changes(client, since, limit=500):
+    return client.get(f'/api/documents/changes?since={since}&limit={limit}')
+
+
+def test_feed_pages_through_changes(app, client):
+    start = client.get('/api/documents/changes').get_json()
+    assert start == {'version': 0, 'changes': [], 'more': False}
+
+    add_documents(5)
+    first = changes(client, 0, limit=3).get_json()
+    assert [change['id'] for change in first['changes']] == [1, 2, 3] and first['more']
+    rest = changes(client, first['version']).get_json()
+    assert [change['id'] for change in rest['changes']] == [4, 5] and not rest['more']
+    assert rest['changes'][0]['document']['numero_dossier'] == 'DOS000004'
+
+    client.post('/delete/2')
+    db.session.execute(update(Document).where(Document.id == 4).values(modele='MOD-X'))
+    db.session.commit()
+    latest = changes(client, rest['version']).get_json()
+    assert [(change['id'], change['op']) for change in latest['changes']] == [(2, 'delete'), (4, 'upsert')]
+    assert changes(client, latest['version']).get_json()['changes'] == []
+
+
+def test_feed_stops_at_the_latest_servable_version(app):
+    add_documents(3)
+    # Versions 1-3 are the document inserts; their states come later
+    assert db.session.execute(changed_documents(0, 3, 10)).all() == [(1, 1), (2, 2), (3, 3)]
+
+
+def test_pruned_log_answers_gone(app, client):
+    add_documents(3)
+    version = changes(client, 0).get_json()['version']
+    db.session.execute(text("UPDATE document_changes SET changed_at = '2000-01-01'"))
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=['prune-changes', '--days', '1'])
+    assert 'supprimées' in result.output
+
+    assert changes(client, 0).status_code == 410
+    assert changes(client, version).get_json()['changes'] == []
+    client.post('/delete/1')
+    assert [change['op'] for change in changes(client, version).get_json()['changes']] == ['delete']
+
+
+def test_postgresql_versions_take_no_lock():
+    for timing, table, statements in _triggers('postgresql').values():
+        assert 'document_change_version()' in statements and 'lock' not in statements
+    sql = str(version_bounds('postgresql').compile(dialect=postgresql.dialect()))
+    assert 'txid_snapshot_xmin(txid_current_snapshot())' in sql
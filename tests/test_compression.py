@@ -0,0 +1,74 @@
+"""Accept-Encoding negotiation of gzip and brotli responses."""
+import gzip
+
+import pytest
+
+import compression
+from conftest import add_documents
+
+LISTING = '/api/documents?limit=50'
+
+
+@pytest.fixture
+def app_config():
+    return {'COMPRESSION': True, 'CACHE_TTL': 30}
+
+
+def decompress(response):
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'gzip':
+        return gzip.decompress(response.data)
+    if encoding == 'br':
+        return compression.brotli.decompress(response.data)
+    assert encoding is None
+    return response.data
+
+
+@pytest.mark.parametrize('accept, encoding', [
+    ('gzip', 'gzip'),
+    ('gzip, deflate', 'gzip'),
+    ('br', 'br'),
+    ('gzip, br', 'br'),
+    ('gzip;q=1, br;q=0.5', 'gzip'),
+    ('gzip, br;q=0', 'gzip'),
+    ('*', 'br'),
+    ('deflate', None),
+    ('gzip;q=0, br;q=0', None),
+])
+def test_encoding_is_negotiated(client, accept, encoding):
+    if encoding == 'br' and compression.brotli is None:
+        encoding = 'gzip'
+    add_documents(50)
+    plain = client.get(LISTING)
+    assert 'Content-Encoding' not in plain.headers
+
+    response = client.get(LISTING, headers={'Accept-Encoding': accept})
+    assert response.headers.get('Content-Encoding') == encoding
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert decompress(response) == plain.data
+    if encoding:
+        assert len(response.data) < len(plain.data) / 3
+
+
+def test_compressed_etag_is_weak_and_still_matches(client):
+    add_documents(50)
+    response = client.get(LISTING, headers={'Accept-Encoding': 'gzip'})
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    assert client.get(LISTING, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}).status_code == 304
+
+
+def test_streamed_listing_is_compressed(client):
+    add_documents(300)
+    plain = client.get('/api/documents')
+    response = client.get('/api/documents', headers={'Accept-Encoding': 'gzip'})
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == plain.data
+
+
+def test_small_bodies_are_left_alone(client):
+    add_documents(1)
+    response = client.get('/api/documents?limit=1&fields=numero_carton', headers={'Accept-Encoding': 'gzip'})
+    assert len(response.data) < compression.COMPRESS_MIN_SIZE
+    assert 'Content-Encoding' not in response.headers
@@ -0,0 +1,10 @@
+"""Cross-origin clients can read the paging cursor."""
+from conftest import add_documents
+
+
+def test_next_after_is_exposed(app, client):
+    add_documents(5)
+    response = client.get('/api/documents?limit=2', headers={'Origin': 'http://localhost:4200'})
+    assert response.headers['X-Next-After'] == '2'
+    exposed = {name.strip().lower() for name in response.headers['Access-Control-Expose-Headers'].split(',')}
+    assert {'x-next-after', 'etag'} <= exposed
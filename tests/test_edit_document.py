@@ -0,0 +1,38 @@
+"""Saving the edit form writes only what changed."""
+from conftest import add_documents, recorded_statements
+from extensions import db
+from models import Document
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def edit_form(quantities=('1', '2')):
+    # Same values as add_documents() gives dossier 1
+    return {
+        'numero_dossier': 'DOS000001', 'numero_carton': 'CRT0000', 'modele': 'MOD-1',
+        'etats': ['REP', 'BRK'], 'quantities': list(quantities), 'sub_states_1': ['KC', 'Ill'],
+    }
+
+
+def writes(statements):
+    return [statement for statement in statements if statement.lstrip().upper().startswith(WRITES)]
+
+
+def test_unchanged_save_writes_nothing(app, client):
+    add_documents(3)
+    with recorded_statements() as statements:
+        response = client.post('/edit/1', data=edit_form())
+    assert response.status_code == 302
+    assert writes(statements) == []
+
+
+def test_changed_quantity_is_one_update(app, client):
+    add_documents(3)
+    with recorded_statements() as statements:
+        response = client.post('/edit/1', data=edit_form(quantities=('1', '5')))
+    assert response.status_code == 302
+    statements = writes(statements)
+    assert len(statements) == 1 and statements[0].lstrip().startswith('UPDATE document_states')
+
+    db.session.expire_all()
+    assert sorted(state.quantity for state in db.session.get(Document, 1).states) == [1, 5]
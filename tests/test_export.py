@@ -0,0 +1,23 @@
+"""Exports are repeatable."""
+from sqlalchemy import insert
+
+from conftest import add_documents
+from extensions import db
+from exporter import export_rows
+from models import DocumentSubState
+
+
+def test_sub_states_are_exported_in_a_fixed_order(app):
+    add_documents(1)
+    # Stored in reverse of the display order, plus a name outside BRK_SUB_STATES
+    db.session.execute(insert(DocumentSubState), [{'state_id': 2, 'sub_state': 'Zz'}, {'state_id': 2, 'sub_state': 'Aa'}])
+    db.session.commit()
+    sub_states = [row.sub_state for row in export_rows() if row.state_type == 'BRK']
+    assert sub_states == ['KC,Ill,Aa,Zz']
+
+
+def test_csv_export_is_stable(app, client):
+    add_documents(20)
+    first = client.get('/api/export?format=csv').data
+    assert first == client.get('/api/export?format=csv').data
+    assert b'KC,Ill' in first
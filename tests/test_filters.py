@@ -0,0 +1,114 @@
+"""/api/documents/filter: filtered pages and facet counts against a Python count of the fixture."""
+from collections import Counter
+
+import pytest
+
+from conftest import add_documents
+from extensions import db
+from filters import QUANTITY_BUCKETS
+from models import ALL_ETATS, BRK_SUB_STATES, insert_states
+
+
+def seed():
+    """30 dossiers over 3 cartons and 3 modeles; dossiers 1-12 also get an HS state of quantity 1 to 12,
+    and dossiers 1-4 a BRK state flagged KC only. Returns {id: (carton, modele, [(type, quantity, subs)])}."""
+    add_documents(30)
+    insert_states([{'document_id': i, 'state_type': 'HS', 'quantity': i} for i in range(1, 13)]
+                  + [{'document_id': i, 'state_type': 'BRK', 'quantity': 7, 'sub_state': 'KC'} for i in range(1, 5)])
+    db.session.commit()
+    documents = {}
+    for i in range(1, 31):
+        states = [('REP', 1, ()), ('BRK', 2, ('KC', 'Ill'))]
+        if i <= 12:
+            states.append(('HS', i, ()))
+        if i <= 4:
+            states.append(('BRK', 7, ('KC',)))
+        documents[i] = (f'CRT{i // 10:04d}', f'MOD-{i % 3}', states)
+    return documents
+
+
+def expected(documents, state_type=(), sub_state=(), quantity_min=None, quantity_max=None, carton=(), modele=()):
+    def state_matches(state):
+        kind, quantity, subs = state
+        return ((not state_type or kind in state_type)
+                and (not sub_state or set(subs) & set(sub_state))
+                and (quantity_min is None or quantity >= quantity_min)
+                and (quantity_max is None or quantity <= quantity_max))
+
+    ids = [i for i, (c, m, states) in documents.items()
+           if (not carton or c in carton) and (not modele or m in modele) and any(map(state_matches, states))]
+
+    def bucket(quantity):
+        return next(label for low, high, label in QUANTITY_BUCKETS
+                    if quantity >= low and (high is None or quantity <= high))
+
+    def count(values):
+        return Counter(value for i in ids for value in set(values(documents[i])))
+
+    def top(values):
+        ranked = sorted(values.items(), key=lambda item: (-item[1], item[0]))
+        return [{'value': value, 'count': n} for value, n in ranked]
+
+    facets = {
+        'state_type': dict.fromkeys(ALL_ETATS, 0) | count(lambda d: [s[0] for s in d[2]]),
+        'sub_state': dict.fromkeys(BRK_SUB_STATES, 0) | count(lambda d: [sub for s in d[2] for sub in s[2]]),
+        'quantity': {label: 0 for _, _, label in QUANTITY_BUCKETS} | count(lambda d: [bucket(s[1]) for s in d[2]]),
+        'carton': top(count(lambda d: [d[0]])),
+        'modele': top(count(lambda d: [d[1]])),
+    }
+    return ids, len(ids), facets
+
+
+CASES = [
+    {},
+    {'state_type': ['HS']},
+    {'state_type': ['HS'], 'quantity_min': 4},
+    {'state_type': ['HS', 'SWA'], 'quantity_min': 2, 'quantity_max': 5},
+    {'sub_state': ['KC'], 'quantity_min': 7},
+    {'carton': ['CRT0000', 'CRT0002'], 'modele': ['MOD-1']},
+    {'carton': ['CRT0001'], 'state_type': ['HS'], 'quantity_max': 11},
+    {'state_type': ['SWA']},
+]
+
+
+def query_string(case):
+    return '&'.join(f'{name}={value}' for name, values in case.items()
+                    for value in (values if isinstance(values, list) else [values]))
+
+
+@pytest.mark.parametrize('case', CASES, ids=query_string)
+def test_filter_results_and_facets(client, case):
+    documents = seed()
+    ids, total, facets = expected(documents, **case)
+
+    body = client.get('/api/documents/filter?limit=100&' + query_string(case)).get_json()
+    assert [document['id'] for document in body['documents']] == ids
+    assert body['next_after'] is None
+    assert body['total'] == total
+    assert body['facets'] == facets
+
+
+def test_filter_pages_follow_next_after(client):
+    documents = seed()
+    ids, total, facets = expected(documents, state_type=['HS'])
+    seen, after = [], 0
+    while after is not None:
+        body = client.get(f'/api/documents/filter?state_type=HS&limit=5&after={after}').get_json()
+        assert body['total'] == total
+        seen += [document['id'] for document in body['documents']]
+        after = body['next_after']
+    assert seen == ids
+
+
+def test_facets_can_be_skipped(client):
+    seed()
+    body = client.get('/api/documents/filter?facets=0&limit=3').get_json()
+    assert 'facets' not in body and 'total' not in body
+    assert [document['id'] for document in body['documents']] == [1, 2, 3]
+
+
+@pytest.mark.parametrize('query', ['state_type=XX', 'sub_state=Nope', 'quantity_min=-1', 'quantity_max=abc'])
+def test_invalid_filters(client, query):
+    response = client.get('/api/documents/filter?' + query)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
@@ -0,0 +1,17 @@
+"""Import summary of dossiers and states."""
+from conftest import add_documents
+from importer import import_documents
+
+
+def rows(numero, count):
+    return [{'numero_dossier': numero, 'numero_carton': 'C1', 'modele': 'M1', 'state_type': 'REP', 'quantity': '1'}
+            for _ in range(count)]
+
+
+def test_existing_dossier_counts_once_as_duplicate(app):
+    add_documents(2)
+    # DOS000001 exists: its three state lines are one skipped dossier, across chunks
+    report = import_documents(rows('DOS000001', 3) + rows('NEW1', 2), batch_size=2)
+    assert report.duplicates == 1
+    assert report.documents == 1 and report.states == 2
+    assert report.to_dict()['duplicates'] == 1
@@ -0,0 +1,78 @@
+"""Server-Timing phases, /metrics and the slow-query log."""
+import logging
+import re
+
+from conftest import add_documents, recorded_statements
+
+
+def server_timing(response, name):
+    return float(re.search(rf'{name};(?:desc="[^"]*";)?dur=([\d.]+)', response.headers['Server-Timing']).group(1))
+
+
+def sql_count(response):
+    return int(re.search(r'db;desc="(\d+) SQL"', response.headers['Server-Timing']).group(1))
+
+
+def metric(client, name, endpoint, labels=''):
+    body = client.get('/metrics').get_data(as_text=True)
+    labels = re.escape(f'endpoint="{endpoint}",method="GET"{labels}')
+    match = re.search(rf'^electrodoc_{name}{{{labels}}} (\S+)$', body, re.M)
+    return float(match.group(1)) if match else 0
+
+
+def test_documents_listing_reports_serialization(app, client):
+    add_documents(300)
+    response = client.get('/api/documents?limit=300')
+    assert response.status_code == 200
+    assert server_timing(response, 'serialize') > 0
+
+
+def test_server_timing_counts_the_request_statements(app, client):
+    add_documents(30)
+    with recorded_statements() as statements:
+        response = client.get('/api/documents?limit=20')
+    assert sql_count(response) == len(statements) > 0
+    assert server_timing(response, 'db') > 0
+    assert server_timing(response, 'render') == 0
+    assert server_timing(response, 'total') >= server_timing(response, 'db')
+
+
+def test_server_timing_reports_template_rendering(app, client):
+    add_documents(5)
+    response = client.get('/dashboard')
+    assert response.status_code == 200
+    assert server_timing(response, 'render') > 0
+    assert server_timing(response, 'serialize') == 0
+
+
+def test_metrics_accumulate_per_endpoint(app, client):
+    add_documents(5)
+    count = metric(client, 'request_duration_seconds_count', 'api.get_documents')
+    sql = metric(client, 'sql_statements_total', 'api.get_documents')
+    statements = sum(sql_count(client.get('/api/documents?limit=5')) for _ in range(3))
+
+    assert metric(client, 'request_duration_seconds_count', 'api.get_documents') == count + 3
+    assert metric(client, 'sql_statements_total', 'api.get_documents') == sql + statements
+    assert metric(client, 'request_duration_seconds_bucket', 'api.get_documents', ',le="+Inf"') == count + 3
+    # /metrics does not measure itself
+    assert 'endpoint="metrics.metrics"' not in client.get('/metrics').get_data(as_text=True)
+
+
+def test_slow_queries_are_logged(app, client, caplog):
+    add_documents(5)
+    client.get('/api/documents?limit=5')
+    assert not [r for r in caplog.records if r.getMessage().startswith('Requête lente')]
+
+    app.config['SLOW_QUERY_MS'] = 0
+    with caplog.at_level(logging.WARNING):
+        client.get('/api/documents?limit=5')
+    slow = [r.getMessage() for r in caplog.records if r.getMessage().startswith('Requête lente')]
+    assert slow and any('FROM documents' in message for message in slow)
+
+
+def test_statement_count_warning(app, client, caplog):
+    add_documents(5)
+    app.config['QUERY_COUNT_WARNING'] = 1
+    with caplog.at_level(logging.WARNING):
+        client.get('/api/documents?limit=5')
+    assert any('requêtes SQL pour une seule page' in r.getMessage() for r in caplog.records)
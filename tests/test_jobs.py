@@ -0,0 +1,131 @@
+"""Job queue claims, cancellation and stale-job recovery, driven by hand (JOB_WORKERS=0)."""
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from extensions import db
+from jobs import JobRecord, _now, task
+
+
+@task('test-limited')
+def limited_job(job, steps=0):
+    for count in range(1, steps + 1):
+        job.progress(count)
+    return {'steps': steps}
+
+
+@task('test-free')
+def free_job(job):
+    return None
+
+
+class RecordingExecutor:
+    """Stands in for the thread pool: keeps the claimed jobs instead of running them."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, function, job, params):
+        self.submitted.append((job, params))
+
+
+@pytest.fixture
+def runner(app):
+    runner = app.extensions['jobs']
+    runner.config['JOB_LIMITS'] = {'test-limited': 1}
+    runner.worker = 'test:1'
+    runner.workers = 4
+    runner._executor = RecordingExecutor()
+    return runner
+
+
+def states():
+    db.session.expire_all()
+    return dict(db.session.execute(select(JobRecord.id, JobRecord.state)).all())
+
+
+def test_claim_respects_the_per_kind_limit(runner):
+    first = runner.submit('test-limited')
+    second = runner.submit('test-limited')
+    free = runner.submit('test-free')
+    runner._claim()
+
+    assert states() == {first: 'running', second: 'pending', free: 'running'}
+    assert sorted(job.id for job, params in runner._executor.submitted) == [first, free]
+    assert db.session.get(JobRecord, first).worker == 'test:1'
+
+
+def test_claim_statement_rechecks_the_limit(runner):
+    runner.submit('test-limited')
+    second = runner.submit('test-limited')
+    runner._claim()
+    # A claimer that read the running count before the first claim committed
+    row = db.session.execute(select(JobRecord.id, JobRecord.kind).where(JobRecord.id == second)).one()
+    with db.engine.begin() as connection:
+        assert connection.execute(runner._claim_statement(row, 1)).rowcount == 0
+    assert states()[second] == 'pending'
+
+
+def test_finished_job_frees_its_slot(runner):
+    first = runner.submit('test-limited', {'steps': 2})
+    second = runner.submit('test-limited')
+    runner._claim()
+    job, params = runner._executor.submitted.pop()
+    runner._run(job, params)
+
+    assert states() == {first: 'done', second: 'pending'}
+    assert db.session.get(JobRecord, first).result_data == {'steps': 2}
+    runner._claim()
+    assert states()[second] == 'running'
+
+
+def test_cancel_pending_job(runner):
+    job_id = runner.submit('test-limited')
+    runner.cancel(job_id)
+    runner._claim()
+    assert states()[job_id] == 'cancelled'
+    assert runner._executor.submitted == []
+
+
+def test_cancel_running_job(runner):
+    job_id = runner.submit('test-limited', {'steps': 3})
+    runner._claim()
+    job, params = runner._executor.submitted.pop()
+    runner.cancel(job_id)
+    assert job.cancelled.is_set()
+
+    runner._run(job, params)
+    record = db.session.get(JobRecord, job_id)
+    db.session.refresh(record)
+    assert record.state == 'cancelled' and record.cancel_requested
+    assert job_id not in runner._running
+
+
+def test_heartbeat_relays_cancellation_from_another_process(runner):
+    job_id = runner.submit('test-limited', {'steps': 3})
+    runner._claim()
+    job, params = runner._executor.submitted.pop()
+    with db.engine.begin() as connection:
+        connection.execute(update(JobRecord).where(JobRecord.id == job_id).values(cancel_requested=True))
+    assert not job.cancelled.is_set()
+    runner._heartbeat()
+    assert job.cancelled.is_set()
+
+
+def test_heartbeat_keeps_local_jobs_and_fails_stale_ones(runner):
+    local = runner.submit('test-free')
+    runner._claim()
+    orphan = runner.submit('test-free')
+    long_ago = _now() - timedelta(seconds=runner.config['JOB_STALE_AFTER'] + 5)
+    with db.engine.begin() as connection:
+        # ``orphan`` was claimed by a process that died; neither has been heartbeated for a while
+        connection.execute(update(JobRecord).where(JobRecord.id == orphan)
+                           .values(state='running', worker='gone:2', started_at=long_ago))
+        connection.execute(update(JobRecord).values(updated_at=long_ago))
+
+    runner._heartbeat()
+    assert states() == {local: 'running', orphan: 'failed'}
+    record = db.session.get(JobRecord, orphan)
+    assert record.error == 'Interrompue: processus arrêté' and record.finished_at is not None
+    assert db.session.get(JobRecord, local).updated_at > long_ago
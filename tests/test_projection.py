@@ -0,0 +1,59 @@
+"""fields= projection of /api/documents."""
+import json
+
+import pytest
+
+from conftest import add_documents
+from extensions import db
+from models import Document
+
+
+def listing(client, query):
+    response = client.get('/api/documents?' + query)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_full_documents_without_fields(app, client):
+    add_documents(3)
+    expected = [document.to_dict() for document in db.session.query(Document).order_by(Document.id)]
+    for document in expected:
+        document['states'].sort(key=lambda state: state['id'])
+    assert listing(client, 'limit=10') == expected
+
+
+@pytest.mark.parametrize('fields, document_keys, state_keys', [
+    ('numero_carton', ['id', 'numero_carton'], None),
+    ('modele,id', ['id', 'modele'], None),
+    ('numero_carton,states.state_type', ['id', 'numero_carton', 'states'], ['state_type']),
+    ('states.quantity,states.sub_state', ['id', 'states'], ['sub_state', 'quantity']),
+    ('states', ['id', 'states'], ['id', 'state_type', 'sub_state', 'sub_states', 'quantity']),
+    (' numero_dossier , ,states.sub_states ', ['id', 'numero_dossier', 'states'], ['sub_states']),
+])
+def test_fields_are_projected(app, client, fields, document_keys, state_keys):
+    add_documents(3)
+    full = listing(client, 'limit=10')
+    projected = listing(client, f'limit=10&fields={fields}')
+    assert len(projected) == 3
+    for document, original in zip(projected, full):
+        assert list(document) == document_keys
+        assert all(document[key] == original[key] for key in document_keys if key != 'states')
+        if state_keys is not None:
+            assert [list(state) for state in document['states']] == [state_keys] * 2
+            assert document['states'] == [{key: state[key] for key in state_keys} for state in original['states']]
+
+
+def test_fields_apply_to_ndjson(app, client):
+    add_documents(2)
+    response = client.get('/api/documents?format=ndjson&fields=numero_dossier')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines == [{'id': 1, 'numero_dossier': 'DOS000001'}, {'id': 2, 'numero_dossier': 'DOS000002'}]
+
+
+@pytest.mark.parametrize('fields', ['nope', 'numero_carton,states.nope', 'states.', 'sub_state'])
+def test_unknown_field_is_rejected(app, client, fields):
+    response = client.get(f'/api/documents?fields={fields}')
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['success'] is False and body['message'].startswith('champ inconnu')
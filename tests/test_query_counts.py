@@ -0,0 +1,33 @@
+"""Listings must issue a fixed number of queries whatever the number of dossiers."""
+import pytest
+
+from conftest import add_documents, recorded_statements
+
+LISTINGS = [
+    '/dashboard',
+    '/dashboard?search=DOS',
+    '/api/documents',
+    '/api/documents?limit=100',
+    '/api/documents?format=ndjson',
+    '/api/documents/search?q=DOS&limit=100',
+]
+
+
+def statement_count(client, path):
+    # A first call fills the per-process caches (session check, read model, ...)
+    assert client.get(path).status_code == 200
+    with recorded_statements() as statements:
+        response = client.get(path)
+        response.get_data()
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize('path', LISTINGS)
+def test_listing_queries_do_not_grow_with_rows(app, client, path):
+    # Fewer dossiers than a dashboard page, then more than an API page
+    add_documents(4)
+    small = statement_count(client, path)
+    add_documents(396)
+    large = statement_count(client, path)
+    assert large == small, f'{path}: {small} requêtes pour 4 dossiers, {large} pour 400'
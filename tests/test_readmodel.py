@@ -0,0 +1,89 @@
+"""The NumPy read model answers like SQL, before and after writes it learns from the change log."""
+from contextlib import contextmanager
+
+import pytest
+from flask import current_app
+from sqlalchemy import text
+
+from cartons import carton_state_totals
+from extensions import db
+from test_filters import CASES, query_string, seed
+
+pytest.importorskip('numpy')
+
+CARTONS = ['CRT0000', 'CRT0001', 'CRT0002', 'CRT0003', 'CRT9999']
+
+
+@pytest.fixture
+def app_config():
+    return {'READ_MODEL': True}
+
+
+@contextmanager
+def sql_only():
+    model = current_app.extensions.pop('read_model')
+    try:
+        yield
+    finally:
+        current_app.extensions['read_model'] = model
+
+
+def filtered(client, query):
+    return client.get('/api/documents/filter?limit=100&' + query).get_json()
+
+
+def assert_same_as_sql(client):
+    for case in CASES:
+        from_model = filtered(client, query_string(case))
+        with sql_only():
+            assert from_model == filtered(client, query_string(case)), case
+    # A page that stops before the end
+    from_model = filtered(client, 'state_type=BRK&limit=7&after=3')
+    with sql_only():
+        assert from_model == filtered(client, 'state_type=BRK&limit=7&after=3')
+        expected = carton_state_totals(CARTONS)
+    assert carton_state_totals(CARTONS) == expected
+
+
+def test_read_model_matches_sql(app, client):
+    seed()
+    assert_same_as_sql(client)
+    assert len(current_app.extensions['read_model'].columns) == 30
+
+
+def test_read_model_catches_up_on_own_writes(app, client):
+    seed()
+    model = current_app.extensions['read_model']
+    model.current()
+    version = model.version
+    model.loaded_in = 'not reloaded'
+
+    client.post('/api/states:batch', json={'operations': [
+        {'op': 'add', 'document_id': 5, 'state_type': 'SWA', 'quantity': 11},
+        {'op': 'update', 'id': 1, 'state_type': 'HS', 'quantity': 4},
+    ]})
+    client.post('/api/cartons/CRT0003/states', json={'state_type': 'BRK', 'quantity': 3, 'sub_state': 'Ill'})
+    client.post('/delete/7')
+
+    assert_same_as_sql(client)
+    assert model.version > version
+    assert model.loaded_in == 'not reloaded'
+
+
+def test_read_model_catches_up_on_writes_of_other_processes(app, client):
+    seed()
+    model = current_app.extensions['read_model']
+    model.current()
+    version = model.version
+    model.loaded_in = 'not reloaded'
+
+    # Straight through the engine: no commit hook marks the model stale, only the change log has it
+    with db.engine.begin() as connection:
+        connection.execute(text("UPDATE documents SET numero_carton = 'CRT9999' WHERE id = 2"))
+        connection.execute(text("UPDATE document_states SET quantity = 9 WHERE document_id = 3 AND state_type = 'REP'"))
+    model.checked = 0.0  # READ_MODEL_REFRESH elapsed
+
+    assert_same_as_sql(client)
+    assert model.version > version
+    assert model.loaded_in == 'not reloaded'
+    assert carton_state_totals(['CRT9999'])['CRT9999']['REP'] == 1
@@ -0,0 +1,26 @@
+"""Search order of the dashboard and /api/documents/search."""
+from conftest import add_documents
+
+
+def search_ids(client, q, limit=5):
+    return [document['id'] for document in client.get('/api/documents/search', query_string={'q': q, 'limit': limit}).get_json()]
+
+
+def test_short_terms_are_listed_in_id_order(app, client):
+    add_documents(30)
+    assert search_ids(client, 'DOS') == [1, 2, 3, 4, 5]
+    assert search_ids(client, 'DOS', limit=1000) == list(range(1, 31))
+
+
+def test_ranked_ties_are_broken_by_id(app, client):
+    add_documents(30)
+    # DOS000010 to DOS000019 match alike
+    assert search_ids(client, 'DOS00001', limit=20) == list(range(10, 20))
+
+
+def test_dashboard_pages_do_not_overlap(app, client):
+    add_documents(30)
+    pages = [client.get('/dashboard', query_string={'search': 'DOS', 'page': page}).get_data(as_text=True)
+             for page in (1, 2)]
+    assert 'DOS000001' in pages[0] and 'DOS000001' not in pages[1]
+    assert 'DOS000011' in pages[1] and 'DOS000011' not in pages[0]
@@ -0,0 +1,15 @@
+"""Trend ranges given with a UTC offset."""
+
+
+def test_offset_bounds_are_converted_to_utc(client):
+    response = client.get('/api/stats/trends', query_string={
+        'granularity': 'hour', 'start': '2026-10-01T00:00+02:00', 'end': '2026-10-01T05:30+02:00',
+    })
+    assert response.status_code == 200
+    assert response.get_json()['buckets'][0] == '2026-09-30 22:00'
+    assert response.get_json()['buckets'][-1] == '2026-10-01 03:00'
+
+
+def test_mixed_naive_and_aware_bounds(client):
+    response = client.get('/api/stats/trends', query_string={'start': '2026-10-01T00:00+02:00'})
+    assert response.status_code == 200
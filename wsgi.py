@@ -0,0 +1,11 @@
+"""Production WSGI entry point.
+
+    flask --app wsgi init-db                 # once per deployment
+    gunicorn --workers 4 --bind 0.0.0.0:8000 wsgi:app
+
+With several workers, set CACHE_REDIS_URL so a write invalidates the response
+cache of every worker, not only its own.
+"""
+from app import create_app
+
+app = create_app()